@@ -1,20 +1,18 @@
-import psycopg2
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
-from data_fetch_store.db_params import DB_CONFIG
+from data_fetch_store.db_params import get_connection
 
 def fetch_sector_index_data(sector_index_name):
-    conn = psycopg2.connect(**DB_CONFIG)
     query = """
         SELECT date, index_value
         FROM sector_index_table
         WHERE sector_index = %s
         ORDER BY date
     """
-    df = pd.read_sql(query, conn, params=(sector_index_name,))
-    conn.close()
+    with get_connection() as conn:
+        df = pd.read_sql(query, conn, params=(sector_index_name,))
     return df
 
 def plot_sector_index(df, sector_index_name):
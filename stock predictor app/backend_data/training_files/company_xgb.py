@@ -7,7 +7,6 @@ import numpy as np
 import joblib
 import xgboost as xgb
 from datetime import datetime
-from sqlalchemy import create_engine
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 
@@ -17,21 +16,11 @@ project_root = os.path.abspath(os.path.join(current_file, "../../.."))
 sys.path.append(project_root)
 
 try:
-    from db_params import DB_CONFIG
+    from db_params import get_connection
 except ModuleNotFoundError as e:
     print(f"Module not found: {e}")
     sys.exit(1)
 
-# === DB Engine ===
-def create_db_engine():
-    db_uri = (
-        f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
-        f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
-    )
-    return create_engine(db_uri)
-
-engine = create_db_engine()
-
 # === Feature & Target Config ===
 input_params = {
     "features": [
@@ -80,11 +69,12 @@ def fetch_company_data(symbol):
                market_cap, market_cap_proxy,
                vix_close,
                day_of_week, week_of_year
-        FROM stock_market_table
+        FROM stock_market_view
         WHERE symbol = %s AND date IS NOT NULL
         ORDER BY date
     '''
-    return pd.read_sql(query, engine, params=(symbol,))
+    with get_connection() as conn:
+        return pd.read_sql(query, conn, params=(symbol,))
 
 # === Preprocess Data ===
 def preprocess(df, features, target_col):
@@ -205,7 +195,8 @@ def main():
         run_pipeline_for_company(symbol, input_params, xgb_params)
     else:
         print("📚 No symbol provided. Training all available companies.")
-        symbols_df = pd.read_sql("SELECT DISTINCT symbol FROM stock_market_table;", engine)
+        with get_connection() as conn:
+            symbols_df = pd.read_sql("SELECT DISTINCT symbol FROM stock_market_table;", conn)
         symbols = symbols_df["symbol"].tolist()
 
         training_summary = train_selected_companies(symbols, input_params, xgb_params)
@@ -1,6 +1,10 @@
 import psycopg2
 from psycopg2 import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
 import os
+import atexit
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../../credentials/.env'))
@@ -14,6 +18,60 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT"),
 }
 
+# --- Connection Pool ---
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "16"))
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide ThreadedConnectionPool, created on first use and again in forked child processes."""
+    global _pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # A pool inherited through fork shares sockets with the parent: leave it alone and start fresh
+            _pool = ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, **DB_CONFIG)
+            _pool_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a pooled connection: commits when the block succeeds, rolls back on error, and always
+    hands the connection back. Blocks while all POOL_MAX_CONN connections are in use.
+    """
+    pool = get_pool()
+    with _pool_slots:
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+atexit.register(close_pool)
+
+
 ALLOWED_COLUMNS = {
     "company": [
         "date", "symbol", "sector", "subsector",
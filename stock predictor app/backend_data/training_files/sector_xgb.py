@@ -6,7 +6,6 @@ import numpy as np
 import joblib
 import xgboost as xgb
 from datetime import datetime
-from sqlalchemy import create_engine
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from xgboost import callback, DMatrix
@@ -17,21 +16,12 @@ project_root = os.path.abspath(os.path.join(current_file, "../../.."))
 sys.path.append(project_root)
 
 try:
-    from db_params import DB_CONFIG
+    from db_params import get_connection
     from data_fetch_store.stock_list import SECTORS
 except ModuleNotFoundError as e:
     print(f"Module not found: {e}")
     sys.exit(1)
 
-def create_db_engine():
-    db_uri = (
-        f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
-        f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
-    )
-    return create_engine(db_uri)
-
-engine = create_db_engine()
-
 xgb_params = {
     "learning_rate": 0.01,
     "max_depth": 7,
@@ -72,28 +62,18 @@ def fetch_data_for_sector(sector_id):
             idx.sma_20, idx.sma_125,
             idx.ema_10, idx.ema_50,
             idx.momentum_14d, idx.return_vs_previous,
-            sm.us_10y_bond_rate, sm.cpi_inflation, sm.pce_inflation,
-            sm.consumer_confidence_index, sm.unemployment_rate
+            m.us_10y_bond_rate, m.cpi_inflation, m.pce_inflation,
+            m.consumer_confidence_index, m.unemployment_rate
         FROM sector_index_table idx
-        JOIN (
-            SELECT 
-                date,
-                AVG(us_10y_bond_rate) AS us_10y_bond_rate,
-                AVG(cpi_inflation) AS cpi_inflation,
-                AVG(pce_inflation) AS pce_inflation,
-                AVG(consumer_confidence_index) AS consumer_confidence_index,
-                AVG(unemployment_rate) AS unemployment_rate
-            FROM stock_market_table
-            WHERE sector_id = %s
-            GROUP BY date
-        ) sm ON idx.date = sm.date
+        LEFT JOIN macro_daily m ON m.date = idx.date
         WHERE idx.is_subsector = false 
         AND idx.sector = (
             SELECT sector FROM stock_market_table WHERE sector_id = %s LIMIT 1
         )
         ORDER BY idx.date;
     '''
-    return pd.read_sql(query, engine, params=(sector_id, sector_id))
+    with get_connection() as conn:
+        return pd.read_sql(query, conn, params=(sector_id,))
 
 def generate_company_distribution_features(sector_id):
     query = '''
@@ -104,7 +84,8 @@ def generate_company_distribution_features(sector_id):
         FROM stock_market_table
         WHERE sector_id = %s AND date IS NOT NULL
     '''
-    df = pd.read_sql(query, engine, params=(sector_id,))
+    with get_connection() as conn:
+        df = pd.read_sql(query, conn, params=(sector_id,))
     if df.empty:
         print(f"⚠️ No company data for sector_id {sector_id}")
         return pd.DataFrame()
@@ -254,7 +235,8 @@ def run_pipeline_for_sector(sector_id, sector_name, input_params, xgb_params):
 def train_selected_sectors(sectors, input_params, xgb_params):
     summary = []
     for name in sectors:
-        df = pd.read_sql("SELECT DISTINCT sector_id FROM stock_market_table WHERE sector = %s;", engine, params=(name,))
+        with get_connection() as conn:
+            df = pd.read_sql("SELECT DISTINCT sector_id FROM stock_market_table WHERE sector = %s;", conn, params=(name,))
         if df.empty:
             print(f"⚠️ No sector_id for '{name}', skipping.")
             continue
@@ -6,8 +6,7 @@ import xgboost as xgb
 import gc
 from sklearn.metrics import mean_squared_error
 from sklearn.model_selection import train_test_split
-from db_params import DB_CONFIG
-import psycopg2
+from db_params import get_connection
 
 
 # XGBoost Parameters
@@ -56,27 +55,25 @@ def normalize_subsector_name(name):
     return re.sub(r'\W+', '_', name.strip()).lower()
 
 def fetch_subsector_ids_and_names():
-    conn = psycopg2.connect(**DB_CONFIG)
     query = """
         SELECT DISTINCT subsector_id, subsector
         FROM stock_market_table
         WHERE subsector_id IS NOT NULL AND subsector IS NOT NULL
         ORDER BY subsector_id
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
+    with get_connection() as conn:
+        df = pd.read_sql(query, conn)
     return df.to_dict(orient="records")
 
 def fetch_data(subsector_id):
-    conn = psycopg2.connect(**DB_CONFIG)
     query = """
         SELECT *
-        FROM stock_market_table
+        FROM stock_market_view
         WHERE subsector_id = %s AND future_return_1d IS NOT NULL
         ORDER BY date
     """
-    df = pd.read_sql(query, conn, params=(subsector_id,))
-    conn.close()
+    with get_connection() as conn:
+        df = pd.read_sql(query, conn, params=(subsector_id,))
     return df
 
 def preprocess(df):
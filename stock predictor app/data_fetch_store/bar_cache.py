@@ -0,0 +1,173 @@
+import os
+import io
+import json
+import hashlib
+import pandas as pd
+from datetime import datetime, timedelta
+from price_fetch import download_history
+from providers import cache_root
+
+# --- Cache Layout ---
+# bar_cache/symbol=<SYMBOL>/<sha256>.parquet   immutable chunks named by content hash
+# bar_cache/symbol=<SYMBOL>/manifest.json      ordered chunk list + the start date the history was requested from
+
+BAR_CACHE_DIR = os.getenv("BAR_CACHE_DIR", os.path.join(os.path.dirname(__file__), "bar_cache"))
+ACTION_COLUMNS = ["dividends", "stock splits"]
+
+
+def symbol_dir(symbol):
+    return os.path.join(cache_root(BAR_CACHE_DIR), f"symbol={symbol}")
+
+
+def read_manifest(symbol):
+    path = os.path.join(symbol_dir(symbol), "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_manifest(symbol, manifest):
+    path = os.path.join(symbol_dir(symbol), "manifest.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_bars(symbol):
+    """Concatenate every cached chunk of a symbol. Returns (df, manifest) or (None, None)."""
+    manifest = read_manifest(symbol)
+    if not manifest or not manifest.get("chunks"):
+        return None, None
+
+    frames = [pd.read_parquet(os.path.join(symbol_dir(symbol), chunk["file"])) for chunk in manifest["chunks"]]
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(subset="date", keep="last").sort_values("date").reset_index(drop=True)
+    return df, manifest
+
+
+def append_bars(symbol, df, requested_start=None):
+    """Write df as a new content-addressed chunk and register it in the manifest."""
+    if df is None or df.empty:
+        return
+    os.makedirs(symbol_dir(symbol), exist_ok=True)
+
+    buffer = io.BytesIO()
+    df.reset_index(drop=True).to_parquet(buffer, index=False)
+    payload = buffer.getvalue()
+    name = hashlib.sha256(payload).hexdigest() + ".parquet"
+
+    path = os.path.join(symbol_dir(symbol), name)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+
+    manifest = read_manifest(symbol) or {"requested_start": requested_start, "chunks": []}
+    if requested_start is not None:
+        manifest["requested_start"] = requested_start
+    if not any(chunk["file"] == name for chunk in manifest["chunks"]):
+        manifest["chunks"].append({
+            "file": name,
+            "start": str(pd.to_datetime(df["date"]).min().date()),
+            "end": str(pd.to_datetime(df["date"]).max().date()),
+            "rows": len(df),
+        })
+    manifest["end"] = max(chunk["end"] for chunk in manifest["chunks"])
+    write_manifest(symbol, manifest)
+
+
+def clear_symbol(symbol):
+    """Drop a symbol's manifest; its chunks stay on disk but are no longer referenced."""
+    path = os.path.join(symbol_dir(symbol), "manifest.json")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def has_corporate_action(df):
+    """A dividend or split in a new tail means every earlier auto-adjusted bar has changed."""
+    columns = [c for c in ACTION_COLUMNS if c in df.columns]
+    return bool(columns) and bool((df[columns].fillna(0) != 0).any().any())
+
+
+def completed_sessions(df):
+    """Only cache bars before today; today's bar may still be moving."""
+    today = pd.Timestamp(datetime.today().date())
+    return df[pd.to_datetime(df["date"]).dt.tz_localize(None) < today]
+
+
+def fetch_history(symbols, start_date="2004-01-01", end_date=None, limiter=None, refreshed=None):
+    """
+    Cache-first replacement for download_history: serves bars from the local Parquet cache and
+    only downloads the missing tail per symbol, grouping symbols that share a tail start into one request.
+    A tail carrying a dividend or split invalidates that symbol and refetches it from start_date; such
+    symbols are added to the `refreshed` set when one is given, since their earlier bars changed too.
+    Returns {symbol: DataFrame} restricted to [start_date, end_date).
+    """
+    start = pd.Timestamp(start_date)
+    cached = {}
+    tails = {}   # tail start -> [symbols]
+
+    for symbol in symbols:
+        df, manifest = load_bars(symbol)
+        if df is not None and pd.Timestamp(manifest.get("requested_start") or start_date) <= start:
+            cached[symbol] = df
+            tail_start = (pd.Timestamp(manifest["end"]) + timedelta(days=1)).strftime("%Y-%m-%d")
+        else:
+            if df is not None:
+                clear_symbol(symbol)
+            tail_start = start.strftime("%Y-%m-%d")
+        tails.setdefault(tail_start, []).append(symbol)
+
+    last_session = pd.Timestamp(datetime.today().date())
+    while last_session.weekday() >= 5:
+        last_session -= timedelta(days=1)
+
+    frames = {}
+    refetch = []
+    for tail_start, group in sorted(tails.items()):
+        if pd.Timestamp(tail_start) > last_session or (end_date and pd.Timestamp(tail_start) >= pd.Timestamp(end_date)):
+            # Nothing can be missing yet: serve straight from the cache
+            frames.update({s: cached[s] for s in group if s in cached})
+            continue
+
+        downloaded = download_history(group, start_date=tail_start, end_date=end_date, limiter=limiter)
+        for symbol in group:
+            tail = downloaded.get(symbol)
+            base = cached.get(symbol)
+            if tail is None:
+                if base is not None:
+                    frames[symbol] = base
+                continue
+            tail = tail.assign(date=pd.to_datetime(tail["date"]).dt.tz_localize(None))
+
+            if base is not None and has_corporate_action(tail):
+                print(f"♻️ {symbol}: corporate action in new bars, refreshing cached history")
+                clear_symbol(symbol)
+                refetch.append(symbol)
+                if refreshed is not None:
+                    refreshed.add(symbol)
+                continue
+
+            requested = None if base is not None else start.strftime("%Y-%m-%d")
+            append_bars(symbol, completed_sessions(tail), requested_start=requested)
+            frames[symbol] = tail if base is None else pd.concat([base, tail], ignore_index=True)
+
+    if refetch:
+        downloaded = download_history(refetch, start_date=start.strftime("%Y-%m-%d"), end_date=end_date, limiter=limiter)
+        for symbol, df in downloaded.items():
+            df = df.assign(date=pd.to_datetime(df["date"]).dt.tz_localize(None))
+            append_bars(symbol, completed_sessions(df), requested_start=start.strftime("%Y-%m-%d"))
+            frames[symbol] = df
+
+    result = {}
+    for symbol, df in frames.items():
+        dates = pd.to_datetime(df["date"])
+        mask = dates >= start
+        if end_date:
+            mask &= dates < pd.Timestamp(end_date)
+        df = df[mask].drop_duplicates(subset="date", keep="last").sort_values("date").reset_index(drop=True)
+        if not df.empty:
+            result[symbol] = df
+    return result
@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor
+
+import db_params
+import bar_cache
+from providers import LocalProvider, set_provider, generate_dataset, LOCAL_DATA_DIR
+from price_fetch import build_batches
+from ingest_pipeline import FETCH_WORKERS, WRITE_BATCH_SYMBOLS
+from fundamentals_cache import fetch_live_fundamentals
+
+# --- Benchmark Settings ---
+# Runs fetch -> indicator -> load -> weight -> index -> index_sql on a synthetic dataset served by LocalProvider,
+# appends wall time, rows/s and peak RSS per stage to BENCH_HISTORY and exits 1 on a regression.
+# index and index_sql rebuild the same indexes with the Python and the SQL engine, for comparison.
+# The load/weight/index/index_sql stages rebuild tables, so they only run against BENCH_DB_NAME, never DB_NAME.
+
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME")
+BENCH_HISTORY = os.getenv("BENCH_HISTORY", os.path.join(os.path.dirname(__file__), "bench_history.json"))
+BENCH_DATA_DIR = os.getenv("BENCH_DATA_DIR", os.path.join(LOCAL_DATA_DIR, "bench"))
+BENCH_END_DATE = "2025-08-08"      # fixed so every run sees the same bars
+STAGES = ["fetch", "indicator", "load", "weight", "index", "index_sql"]
+DB_STAGES = {"load", "weight", "index", "index_sql"}
+REGRESSION_THRESHOLD = 0.20        # fail when wall time or peak RSS is 20% above the baseline
+BASELINE_RUNS = 5                  # baseline = median of the last runs with the same config
+RSS_SAMPLE_SEC = 0.02
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the lifetime peak (KiB on Linux, bytes on macOS), the best we can do without /proc
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRSS:
+    """Samples RSS on a background thread while the block runs and keeps the maximum."""
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_SEC):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+def run_stage(name, stage, ctx, verbose=False):
+    """Time one stage; `stage(ctx)` returns the number of rows it handled."""
+    print(f"⏱️ Running stage: {name}")
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        if verbose:
+            rows = stage(ctx)
+        else:
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                rows = stage(ctx)
+        wall = time.perf_counter() - started
+    return {
+        "wall_sec": round(wall, 3),
+        "rows": int(rows),
+        "rows_per_sec": round(rows / wall, 1) if wall > 0 else None,
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        "rss_start_mb": round(rss.start / 2 ** 20, 1),
+    }
+
+
+# --- Dataset ---
+
+def select_items(symbols):
+    """First `symbols` (symbol, sector, subsector) items, taken round-robin across subsectors so every sector is covered."""
+    batches = build_batches("subsector")
+    interleaved = [item for row in zip_longest(*batches) for item in row if item is not None]
+    return interleaved[:symbols]
+
+
+def prepare_dataset(items, years, seed):
+    """Synthetic dataset for the chosen symbols, generated once per (years, seed) and reused."""
+    root = os.path.join(BENCH_DATA_DIR, f"{years}y_seed{seed}")
+    missing = [symbol for symbol, _, _ in items
+               if not os.path.exists(os.path.join(root, "prices", f"{symbol}.parquet"))]
+    if missing:
+        print(f"🧪 Generating {len(missing)} synthetic symbol(s) in {root}")
+        generate_dataset(root, symbols=missing, years=years, end_date=BENCH_END_DATE, seed=seed)
+    return root
+
+
+# --- Stages ---
+
+def stage_fetch(ctx):
+    """Cold bar cache: every batch is one provider request, fundamentals one request per symbol."""
+    def fetch(items):
+        symbols = [symbol for symbol, _, _ in items]
+        frames = bar_cache.fetch_history(symbols, start_date="2004-01-01", end_date=BENCH_END_DATE)
+        market = {symbol: fetch_live_fundamentals(symbol) for symbol in frames}
+        return {"items": items, "frames": frames, "market": market}
+
+    with ThreadPoolExecutor(max_workers=ctx["fetch_workers"]) as executor:
+        ctx["payloads"] = list(executor.map(fetch, ctx["batches"]))
+    return sum(len(df) for payload in ctx["payloads"] for df in payload["frames"].values())
+
+
+def stage_indicator(ctx):
+    from init_data_fetch import compute_batch
+
+    ctx["records"] = [record for payload in ctx["payloads"] for record in compute_batch(payload)]
+    return sum(record["rows"] for record in ctx["records"])
+
+
+def reset_tables():
+    """Fresh stock, state, macro and index tables in the benchmark database."""
+    from db_params import create_table
+    from indicator_state import create_state_table
+    from macro_tables import create_macro_tables
+    from partitions import ensure_partitions
+
+    create_table()
+    create_state_table()
+    create_macro_tables()
+    with db_params.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE indicator_state;")
+            cur.execute("DROP TABLE IF EXISTS sector_index_table;")
+            with open(os.path.join(os.path.dirname(__file__), "schema", "sector.schema.sql"), "r") as f:
+                cur.execute(f.read())
+    ensure_partitions()
+
+
+def stage_load(ctx):
+    from init_data_fetch import write_batch
+
+    records = ctx["records"]
+    inserted = 0
+    for i in range(0, len(records), WRITE_BATCH_SYMBOLS):
+        batch = records[i:i + WRITE_BATCH_SYMBOLS]
+        statuses = write_batch(batch)
+        inserted += sum(record["rows"] for record in batch if statuses[record["symbol"]].startswith("inserted"))
+    return inserted
+
+
+def count_rows(table):
+    with db_params.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {table};")
+            return cur.fetchone()[0]
+
+
+def stage_weight(ctx):
+    from init_company_weight import calculate_and_update_weights
+
+    calculate_and_update_weights()
+    return count_rows("stock_market_table")
+
+
+def stage_index(ctx):
+    from index_builder import build_all_indexes
+
+    return build_all_indexes(cutoff_date="LATEST", engine="python")
+
+
+def stage_index_sql(ctx):
+    from index_builder import build_all_indexes
+
+    return build_all_indexes(cutoff_date="LATEST", engine="sql")
+
+
+STAGE_FUNCTIONS = {
+    "fetch": stage_fetch,
+    "indicator": stage_indicator,
+    "load": stage_load,
+    "weight": stage_weight,
+    "index": stage_index,
+    "index_sql": stage_index_sql,
+}
+
+
+# --- History & Regressions ---
+
+def read_history(path=BENCH_HISTORY):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def append_history(run, path=BENCH_HISTORY):
+    history = read_history(path)
+    history.append(run)
+    with open(path + ".tmp", "w") as f:
+        json.dump(history, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def find_regressions(run, history, threshold=REGRESSION_THRESHOLD, baseline_runs=BASELINE_RUNS):
+    """Stages whose wall time or peak RSS exceeds the median of the last comparable runs by more than `threshold`."""
+    regressions = []
+    comparable = [past for past in history if past["config"] == run["config"]]
+    for name, result in run["stages"].items():
+        previous = [past["stages"][name] for past in comparable if name in past["stages"]][-baseline_runs:]
+        if not previous:
+            continue
+        for metric in ("wall_sec", "peak_rss_mb"):
+            baseline = statistics.median(p[metric] for p in previous)
+            if baseline and result[metric] > baseline * (1 + threshold):
+                regressions.append({
+                    "stage": name, "metric": metric, "baseline": round(baseline, 3), "value": result[metric],
+                    "change_pct": round((result[metric] / baseline - 1) * 100, 1),
+                })
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(run, regressions):
+    print(f"\n📊 Benchmark: {run['config']['symbols']} symbols x {run['config']['years']} years "
+          f"({run['config']['latency_ms']} ms/request)")
+    print(f"   {'stage':<10}{'wall s':>10}{'rows':>12}{'rows/s':>12}{'peak RSS MB':>14}")
+    for name, r in run["stages"].items():
+        print(f"   {name:<10}{r['wall_sec']:>10.2f}{r['rows']:>12,}{r['rows_per_sec'] or 0:>12,.0f}{r['peak_rss_mb']:>14,.1f}")
+    for reg in regressions:
+        print(f"❌ {reg['stage']} {reg['metric']}: {reg['value']} vs baseline {reg['baseline']} (+{reg['change_pct']}%)")
+    if not regressions:
+        print("✅ No stage regressed beyond the threshold.")
+
+
+def run_benchmark(symbols=100, years=20, latency_ms=50.0, seed=0, stages=STAGES, fetch_workers=FETCH_WORKERS,
+                  threshold=REGRESSION_THRESHOLD, history_path=BENCH_HISTORY, verbose=False):
+    """Run the selected stages in order and record them. Returns (run, regressions)."""
+    stages = [name for name in STAGES if name in stages]
+    if DB_STAGES & set(stages):
+        if not BENCH_DB_NAME or BENCH_DB_NAME == db_params.DB_CONFIG["dbname"]:
+            raise ValueError("❌ Set BENCH_DB_NAME to a scratch database (not DB_NAME) to run load/weight/index/index_sql.")
+        # Every pooled connection of this process goes to the benchmark database
+        db_params.close_pool()
+        db_params.DB_CONFIG["dbname"] = BENCH_DB_NAME
+
+    items = select_items(symbols)
+    root = prepare_dataset(items, years, seed)
+    set_provider(LocalProvider(root, latency_ms=latency_ms, jitter_ms=0))
+
+    selected = {symbol for symbol, _, _ in items}
+    batches = [[item for item in batch if item[0] in selected] for batch in build_batches("subsector")]
+    ctx = {"batches": [batch for batch in batches if batch], "fetch_workers": fetch_workers}
+
+    bar_cache_dir = bar_cache.BAR_CACHE_DIR
+    bar_cache.BAR_CACHE_DIR = tempfile.mkdtemp(prefix="bench_bars_")
+    results = {}
+    try:
+        if "load" in stages:
+            reset_tables()
+        for name in stages:
+            if name == "indicator" and "payloads" not in ctx:
+                raise ValueError("❌ The indicator stage needs the fetch stage.")
+            if name == "load" and "records" not in ctx:
+                raise ValueError("❌ The load stage needs the fetch and indicator stages.")
+            results[name] = run_stage(name, STAGE_FUNCTIONS[name], ctx, verbose=verbose)
+    finally:
+        shutil.rmtree(bar_cache.BAR_CACHE_DIR, ignore_errors=True)
+        bar_cache.BAR_CACHE_DIR = bar_cache_dir
+
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "config": {"symbols": len(items), "years": years, "latency_ms": latency_ms, "seed": seed,
+                   "fetch_workers": fetch_workers},
+        "stages": results,
+    }
+    regressions = find_regressions(run, read_history(history_path), threshold=threshold)
+    run["regressions"] = regressions
+    append_history(run, history_path)
+    report(run, regressions)
+    return run, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion stages on a synthetic dataset.")
+    parser.add_argument("--symbols", type=int, default=100, help="number of symbols (max: all of stock_list)")
+    parser.add_argument("--years", type=int, default=20, help="years of daily bars per symbol")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="simulated provider latency per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of " + ",".join(STAGES))
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--history", default=BENCH_HISTORY)
+    parser.add_argument("--verbose", action="store_true", help="keep the stages' own output")
+    args = parser.parse_args(argv)
+
+    _, regressions = run_benchmark(
+        symbols=args.symbols, years=args.years, latency_ms=args.latency_ms, seed=args.seed,
+        stages=[s.strip() for s in args.stages.split(",") if s.strip()], fetch_workers=args.fetch_workers,
+        threshold=args.threshold, history_path=args.history, verbose=args.verbose,
+    )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import io
+import time
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from db_params import get_connection
+
+# --- stock_market_table Layout ---
+
+STOCK_COLUMNS = [
+    "symbol", "sector", "subsector", "date", "day_of_week", "week_of_year", "country_of_origin", "symbol_id",
+    "open", "high", "low", "close", "volume", "adj_close",
+    "sma_5", "sma_20", "sma_50", "sma_125", "sma_200", "sma_200_weekly",
+    "ema_5", "ema_20", "ema_50", "ema_125", "ema_200",
+    "macd", "dma", "rsi",
+    "bollinger_upper", "bollinger_middle", "bollinger_lower", "obv",
+    "pe_ratio", "forward_pe", "price_to_book",
+    "volatility_5d", "volatility_10d", "volatility_20d", "volatility_40d",
+    "market_cap", "market_cap_proxy",
+    "sector_id", "subsector_id",
+    "sector_weight", "subsector_weight", "future_return_1d",
+]
+INTEGER_COLUMNS = ["day_of_week", "week_of_year", "symbol_id", "volume", "obv", "market_cap", "sector_id", "subsector_id"]
+MARKET_DATA_COLUMNS = {"country_of_origin": "country", "pe_ratio": "pe_ratio", "forward_pe": "forward_pe",
+                       "price_to_book": "price_to_book", "market_cap": "market_cap"}
+STOCK_KEY = ["symbol", "date"]
+
+
+def stock_frame(symbol, sector, subsector, df, market_data, ids):
+    """
+    Shape an enriched symbol frame into stock_market_table's column order.
+    `ids` is (symbol_id, sector_id, subsector_id); columns the frame lacks are loaded as NULL.
+    """
+    symbol_id, sector_id, subsector_id = ids
+    df = df[df["date"].notna()]
+    constants = {
+        "symbol": symbol, "sector": sector, "subsector": subsector,
+        "symbol_id": symbol_id, "sector_id": sector_id, "subsector_id": subsector_id,
+    }
+    for column, key in MARKET_DATA_COLUMNS.items():
+        constants[column] = market_data.get(key)
+
+    columns = {}
+    for column in STOCK_COLUMNS:
+        if column in constants:
+            columns[column] = constants[column]
+        elif column in df.columns:
+            columns[column] = df[column].to_numpy()
+        else:
+            columns[column] = None
+    return pd.DataFrame(columns, index=df.index)[STOCK_COLUMNS]
+
+
+def to_copy_buffer(frame, integer_columns=()):
+    """Render a frame as COPY CSV: empty fields are NULL, integer columns are written without a decimal point."""
+    frame = frame.copy()
+    for column in integer_columns:
+        if column in frame.columns:
+            values = pd.to_numeric(frame[column], errors="coerce")
+            frame[column] = values.round().astype("Int64")
+    frame = frame.replace([np.inf, -np.inf], np.nan)
+
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, na_rep="")
+    buffer.seek(0)
+    return buffer
+
+
+def copy_upsert(cur, table, frame, key_columns, update_columns=None, integer_columns=()):
+    """
+    Stream `frame` into a temp staging table with COPY FROM STDIN, then merge it into `table`
+    with one INSERT ... SELECT ... ON CONFLICT (key_columns).
+    update_columns=None keeps existing rows (DO NOTHING); otherwise those columns are overwritten.
+    Runs inside the caller's transaction. Returns the number of rows inserted or updated.
+    """
+    if frame is None or frame.empty:
+        return 0
+    frame = frame.drop_duplicates(subset=key_columns, keep="last")
+    columns = ", ".join(frame.columns)
+    stage = f"{table}_stage"
+
+    # pg_temp: a stage left by an earlier call in this transaction, never a permanent table of that name
+    cur.execute(f"DROP TABLE IF EXISTS pg_temp.{stage}")
+    cur.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA")
+    cur.copy_expert(
+        f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '')",
+        to_copy_buffer(frame, integer_columns),
+    )
+
+    if update_columns:
+        action = "DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+    else:
+        action = "DO NOTHING"
+    cur.execute(f"""
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM {stage}
+        ON CONFLICT ({", ".join(key_columns)}) {action}
+    """)
+    return cur.rowcount
+
+
+def load_stock_rows(cur, frame):
+    """Bulk insert stock_market_table rows; rows already stored for (symbol, date) are left untouched."""
+    return copy_upsert(cur, "stock_market_table", frame, STOCK_KEY, integer_columns=INTEGER_COLUMNS)
+
+
+def write_stock_records(records):
+    """
+    Insert the rows of several symbols with a single COPY. Each record carries symbol, sector,
+    subsector, ids, df and market_data; records without a df (or with a "status") are only reported.
+    Returns {symbol: status}.
+    """
+    statuses = {}
+    frames = []
+    for record in records:
+        if record.get("status") or record.get("df") is None:
+            statuses[record["symbol"]] = record.get("status") or "no new rows"
+            continue
+        frames.append(stock_frame(record["symbol"], record["sector"], record["subsector"],
+                                  record["df"], record["market_data"], record["ids"]))
+        statuses[record["symbol"]] = f"inserted {len(frames[-1])} rows"
+    if not frames:
+        return statuses
+
+    combined = pd.concat(frames, ignore_index=True)
+    started = time.perf_counter()
+    with get_connection() as conn, conn.cursor() as cur:
+        inserted = load_stock_rows(cur, combined)
+        conn.commit()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"✅ Inserted {inserted} rows for {len(frames)} symbols ({len(combined) / elapsed:,.0f} rows/s)")
+    return statuses
+
+
+def compare_load_speed(rows=50_000):
+    """
+    Load the same synthetic rows with the old execute_values path and with COPY, each into a
+    throwaway copy of stock_market_table inside a rolled-back transaction, and print rows/sec.
+    """
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2004-01-02", periods=rows).date
+    df = pd.DataFrame({column: rng.random(rows) for column in STOCK_COLUMNS[8:]})
+    df["date"] = dates
+    for column in ["day_of_week", "week_of_year"]:
+        df[column] = rng.integers(1, 7, rows)
+    frame = stock_frame("BENCH", "Bench", "Bench", df, {"country": "US"}, (0, 0, 0))
+
+    timings = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE stock_market_bench AS SELECT {', '.join(STOCK_COLUMNS)} "
+                        f"FROM stock_market_table WITH NO DATA")
+            cur.execute("ALTER TABLE stock_market_bench ADD UNIQUE (symbol, date)")
+
+            started = time.perf_counter()
+            records = [
+                tuple(None if pd.isna(v) else (int(v) if c in INTEGER_COLUMNS else v) for c, v in zip(STOCK_COLUMNS, row))
+                for row in frame.itertuples(index=False)
+            ]
+            execute_values(cur, f"INSERT INTO stock_market_bench ({', '.join(STOCK_COLUMNS)}) VALUES %s "
+                                f"ON CONFLICT (symbol, date) DO NOTHING", records)
+            timings["execute_values"] = time.perf_counter() - started
+
+            cur.execute("TRUNCATE stock_market_bench")
+            started = time.perf_counter()
+            copy_upsert(cur, "stock_market_bench", frame, STOCK_KEY, integer_columns=INTEGER_COLUMNS)
+            timings["copy"] = time.perf_counter() - started
+        conn.rollback()
+
+    for method, seconds in timings.items():
+        print(f"⏱️ {method}: {rows} rows in {seconds:.2f}s ({rows / seconds:,.0f} rows/s)")
+    print(f"🚀 COPY speedup: {timings['execute_values'] / timings['copy']:.1f}x")
+    return timings
+
+
+if __name__ == "__main__":
+    compare_load_speed()
@@ -0,0 +1,58 @@
+from stock_list import SECTOR_STOCKS
+
+
+def symbol_mapping(sectors=None):
+    """(symbols, sectors, subsectors) arrays from SECTOR_STOCKS, optionally limited to some sectors."""
+    mapping = {}
+    for sector, subsectors in SECTOR_STOCKS.items():
+        if sectors is not None and sector not in sectors:
+            continue
+        for subsector, tickers in subsectors.items():
+            for symbol in tickers:
+                mapping[symbol] = (sector, subsector)
+    return list(mapping), [s for s, _ in mapping.values()], [sub for _, sub in mapping.values()]
+
+
+def update_weights(cur, cap_blend, sectors=None, start_date=None, end_date=None):
+    """
+    Set sector_weight/subsector_weight of every stock row (within start_date..end_date when given) in one statement:
+    each row's synthetic cap (cap_blend = market_cap share, market_cap_proxy share) over the sum of its
+    SECTOR_STOCKS sector/subsector on the same date, via SUM() OVER. A zero total gives NULL weights.
+    Rows whose weights are already current are not rewritten. Runs inside the caller's transaction.
+    Returns the number of rows updated.
+    """
+    symbols, sector_names, subsector_names = symbol_mapping(sectors)
+    if not symbols:
+        return 0
+    market_cap_share, proxy_share = cap_blend
+    date_filter = ""
+    params = [market_cap_share, proxy_share, symbols, sector_names, subsector_names]
+    if start_date:
+        date_filter += " AND s.date >= %s"
+        params.append(start_date)
+    if end_date:
+        date_filter += " AND s.date <= %s"
+        params.append(end_date)
+
+    cur.execute(f"""
+        UPDATE stock_market_table t
+        SET sector_weight = w.sector_weight,
+            subsector_weight = w.subsector_weight
+        FROM (
+            SELECT id, date,
+                   cap / NULLIF(SUM(cap) OVER (PARTITION BY date, sector), 0) AS sector_weight,
+                   cap / NULLIF(SUM(cap) OVER (PARTITION BY date, sector, subsector), 0) AS subsector_weight
+            FROM (
+                SELECT s.id, s.date, m.sector, m.subsector,
+                       %s * COALESCE(s.market_cap, 0) + %s * COALESCE(s.market_cap_proxy, 0) AS cap
+                FROM stock_market_table s
+                JOIN unnest(%s::text[], %s::text[], %s::text[]) AS m(symbol, sector, subsector)
+                  ON m.symbol = s.symbol
+                WHERE (s.market_cap_proxy IS NOT NULL OR s.market_cap IS NOT NULL){date_filter}
+            ) caps
+        ) w
+        WHERE t.id = w.id AND t.date = w.date
+          AND (t.sector_weight IS DISTINCT FROM w.sector_weight
+               OR t.subsector_weight IS DISTINCT FROM w.subsector_weight)
+    """, params)
+    return cur.rowcount
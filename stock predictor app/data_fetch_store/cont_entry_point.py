@@ -1,18 +1,19 @@
 # entrypoint.py
 
-import psycopg2
-from db_params import DB_CONFIG
-
+import fundamentals_cache
 import upd_company_weight
 import upd_data_fetch
 import upd_index_sector_calc
 import upd_index_subsector_calc
 import db_extract
+from db_params import test_database_connection
+from index_builder import MARKET_SECTOR
+from index_state import create_index_state_table
+from watermarks import create_watermarks_table
+from pipeline_dag import Dag, DAG_WORKERS
+from stock_list import SECTOR_STOCKS, SUBSECTOR_TO_SECTOR
 
 
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
-
 def update_database():
     upd_data_fetch.main()
 
@@ -28,13 +29,51 @@ def update_company_weight():
 def fetch_data():
     db_extract.fetch_entity_data()
 
-def main():
+def fetch_prices(dag):
+    """DAG node: the incremental fetch, signalling landed:<sector> as each sector's symbols are written."""
+    results = upd_data_fetch.main(on_sector_written=lambda sector: dag.signal(f"landed:{sector}"))
+    if results is None:
+        return "failed: database connection"
+    failed = sum(not ok for ok, _ in results.values())
+    return f"{len(results) - failed} symbol(s) written, {failed} with errors"
+
+def build_update_dag():
+    """
+    fetch ─┬─ landed:<sector> ─┬─ sector_index:<sector> ── subsector_index:<subsector>
+           │                   └─ weights:<sector>
+           └─ sector_index:Market
+    Subsector rows read their sector's market_cap (influence_weight), hence the sector_index dependency.
+    The market index covers every stock, so it waits for the whole fetch.
+    """
+    dag = Dag()
+    dag.add("fetch", fetch_prices, dag)
+    for sector in SECTOR_STOCKS:
+        dag.add_signal(f"landed:{sector}", owner="fetch")
+        dag.add(f"sector_index:{sector}", upd_index_sector_calc.run_sector, sector, deps=[f"landed:{sector}"])
+        dag.add(f"weights:{sector}", upd_company_weight.run_sector, sector, deps=[f"landed:{sector}"])
+    dag.add(f"sector_index:{MARKET_SECTOR}", upd_index_sector_calc.run_sector, MARKET_SECTOR, deps=["fetch"])
+    for subsector, sector in SUBSECTOR_TO_SECTOR.items():
+        dag.add(f"subsector_index:{subsector}", upd_index_subsector_calc.run_subsector, subsector,
+                deps=[f"sector_index:{sector}"])
+    return dag
+
+def main(workers=DAG_WORKERS):
     print("⚙️ Running full update pipeline...")
-    update_database()
-    update_sector_index()
-    update_subsector_index()
-    update_company_weight()
+    if not test_database_connection():
+        print("❌ Database connection failed.")
+        return
+    # The fetch reads cached fundamentals; refreshing them is its own throttled job (fundamentals_cache.main)
+    fundamentals_cache.create_fundamentals_table()
+    create_index_state_table()
+    create_watermarks_table()
+    dag = build_update_dag()
+    results = dag.run(max_workers=workers)
+    dag.report()
+    failed = [name for name, (ok, _) in results.items() if not ok]
+    if failed:
+        print(f"⚠️ {len(failed)} pipeline node(s) failed: {', '.join(failed)}")
     print("✅ All update modules completed.")
+    return results
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,8 @@
 # fetch_entity_data.py
 
-import psycopg2
 import pandas as pd
 from datetime import datetime
-from db_params import DB_CONFIG
+from db_params import get_connection
 
 EXCLUDE_MACRO_COLUMNS = {
     "cpi_inflation",
@@ -31,10 +30,6 @@ EXPANDED_COLUMNS = CORE_COLUMNS + [
 ]
 
 
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
-
-
 def get_closest_date_for_entity(entity_type, entity_name, target_date):
     table = "stock_market_table" if entity_type == "company" else "sector_index_table"
     field = {
@@ -43,7 +38,7 @@ def get_closest_date_for_entity(entity_type, entity_name, target_date):
         "sector": "sector"
     }[entity_type]
 
-    with get_db_connection() as conn, conn.cursor() as cur:
+    with get_connection() as conn, conn.cursor() as cur:
         cur.execute(f"""
             SELECT MAX(date)
             FROM {table}
@@ -73,7 +68,7 @@ def fetch_entity_data(entity_name, date_str=None, mode="MAX"):
         elif any(c in entity_name.lower() for c in ["semi", "bank", "tech", "sub"]):
             entity_type = "subsector"
 
-    table = "stock_market_table" if entity_type == "company" else "sector_index_table"
+    table = "stock_market_view" if entity_type == "company" else "sector_index_table"
     column = {
         "company": "symbol",
         "subsector": "subsector",
@@ -81,7 +76,7 @@ def fetch_entity_data(entity_name, date_str=None, mode="MAX"):
     }[entity_type]
 
     if not date_obj:
-        with get_db_connection() as conn:
+        with get_connection() as conn:
             df = pd.read_sql(f"""
                 SELECT * FROM {table}
                 WHERE {column} = %s
@@ -93,7 +88,7 @@ def fetch_entity_data(entity_name, date_str=None, mode="MAX"):
             print(f"⚠️ No historical data available for {entity_name} at or before {date_obj}.")
             return pd.DataFrame()
 
-        with get_db_connection() as conn:
+        with get_connection() as conn:
             df = pd.read_sql(f"""
                 SELECT * FROM {table}
                 WHERE {column} = %s AND date = %s
@@ -1,6 +1,10 @@
 import psycopg2
 from psycopg2 import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
 import os
+import atexit
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../credentials/.env'))
@@ -15,10 +19,66 @@ DB_CONFIG = {
 
 api_key = os.getenv("FRED_API_KEY")
 
+STOCK_INDEXES_PATH = os.path.join(os.path.dirname(__file__), "schema", "company_indexes.sql")
+
+# --- Connection Pool ---
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "16"))
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide ThreadedConnectionPool, created on first use and again in forked child processes."""
+    global _pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # A pool inherited through fork shares sockets with the parent: leave it alone and start fresh
+            _pool = ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, **DB_CONFIG)
+            _pool_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a pooled connection: commits when the block succeeds, rolls back on error, and always
+    hands the connection back. Blocks while all POOL_MAX_CONN connections are in use.
+    """
+    pool = get_pool()
+    with _pool_slots:
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+atexit.register(close_pool)
+
+
 def test_database_connection():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.close()
+        with get_connection() as conn:
+            conn.cursor().close()
         print("Successfully connected to PostgreSQL database.")
         return True
     except OperationalError as e:
@@ -27,26 +87,54 @@ def test_database_connection():
 
 def create_table():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        with open("schema/company.schema.sql", "r") as f:
-            cur.execute(f.read())
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with open("schema/company.schema.sql", "r") as f:
+                    cur.execute(f.read())
         print("Table created or already exists.")
     except Exception as e:
         print("Error creating table:", e)
+    from partitions import ensure_partitions
+    ensure_partitions()
+    create_stock_indexes()
+
+
+def create_stock_indexes():
+    """Secondary indexes of stock_market_table (schema/company_indexes.sql); a no-op once they exist."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with open(STOCK_INDEXES_PATH, "r") as f:
+                cur.execute(f.read())
 
 
 
 def get_latest_stock_date():
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT MAX(date) FROM stock_market_table;")
             result = cur.fetchone()
             return result[0] if result and result[0] else None
 
+
+def get_symbol_watermarks(symbols=None):
+    """
+    Last stored date per symbol in one round-trip: {symbol: date}, symbols with no rows are left out.
+    With a symbol list each MAX(date) is a single probe of the (symbol, date) unique index.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if symbols is None:
+                cur.execute("SELECT symbol, MAX(date) FROM stock_market_table GROUP BY symbol;")
+            else:
+                cur.execute("""
+                    SELECT s.symbol, w.last_date
+                    FROM unnest(%s::text[]) AS s(symbol)
+                    CROSS JOIN LATERAL (
+                        SELECT MAX(date) AS last_date FROM stock_market_table t WHERE t.symbol = s.symbol
+                    ) w
+                """, (list(symbols),))
+            return {symbol: last_date for symbol, last_date in cur.fetchall() if last_date is not None}
+
 ALLOWED_COLUMNS = {
     "company": [
         "date", "symbol", "sector", "subsector",
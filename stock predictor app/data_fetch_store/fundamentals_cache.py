@@ -0,0 +1,179 @@
+import os
+import time
+from psycopg2.extras import execute_values
+from datetime import datetime, timedelta
+from db_params import get_connection, test_database_connection
+from stock_list import SECTOR_STOCKS
+from ingest_pool import TokenBucket
+from providers import get_provider
+
+# --- Cache Settings ---
+# The daily update only reads this cache. Stale entries are refreshed by running this module as its own
+# scheduled job, apart from the price update (e.g. cron: `0 6 * * * python fundamentals_cache.py`).
+
+# Ticker.info key for every cached field
+INFO_KEYS = {
+    "market_cap": "marketCap",
+    "pe_ratio": "trailingPE",
+    "forward_pe": "forwardPE",
+    "price_to_book": "priceToBook",
+    "country": "country",
+}
+TEXT_FIELDS = {"country"}
+
+# How long each field stays fresh before the refresh job re-fetches it. market_cap_proxy, derived from
+# the daily close, already tracks cap day to day, so the reported market_cap only needs a weekly refresh.
+FIELD_TTL = {
+    "market_cap": timedelta(days=7),
+    "pe_ratio": timedelta(days=7),
+    "forward_pe": timedelta(days=7),
+    "price_to_book": timedelta(days=7),
+    "country": timedelta(days=180),
+}
+
+REFRESH_REQUESTS_PER_SECOND = 0.5   # the refresh job stays well under the provider limit
+REFRESH_MAX_SYMBOLS = None          # cap symbols per refresh run (None = all stale)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema", "fundamentals.schema.sql")
+
+
+def create_fundamentals_table():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with open(SCHEMA_PATH, "r") as f:
+                cur.execute(f.read())
+        conn.commit()
+
+
+def fetch_live_fundamentals(symbol, limiter=None):
+    """Ask the provider for Ticker.info once and return the cached fields as a market_data dict."""
+    if limiter:
+        limiter.acquire()
+    info = get_provider().info(symbol)
+    return {field: info.get(key) for field, key in INFO_KEYS.items()}
+
+
+def load_fundamentals(symbols):
+    """Returns {symbol: {field: (value, fetched_at)}} for every cached field of the given symbols."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT symbol, field, value_num, value_text, fetched_at
+                FROM fundamentals_cache
+                WHERE symbol = ANY(%s)
+            """, (list(symbols),))
+            rows = cur.fetchall()
+
+    cached = {}
+    for symbol, field, value_num, value_text, fetched_at in rows:
+        value = value_text if field in TEXT_FIELDS else value_num
+        cached.setdefault(symbol, {})[field] = (value, fetched_at)
+    return cached
+
+
+def store_fundamentals(records):
+    """Upsert {symbol: market_data} into the cache, stamping every field with the current time."""
+    now = datetime.now()
+    rows = []
+    for symbol, market_data in records.items():
+        for field in INFO_KEYS:
+            value = market_data.get(field)
+            if field in TEXT_FIELDS:
+                rows.append((symbol, field, None, value, now))
+            else:
+                rows.append((symbol, field, float(value) if value is not None else None, None, now))
+
+    if not rows:
+        return
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO fundamentals_cache (symbol, field, value_num, value_text, fetched_at)
+                VALUES %s
+                ON CONFLICT (symbol, field) DO UPDATE SET
+                    value_num = EXCLUDED.value_num,
+                    value_text = EXCLUDED.value_text,
+                    fetched_at = EXCLUDED.fetched_at
+            """, rows)
+        conn.commit()
+
+
+def get_market_data(symbols, limiter=None):
+    """
+    Read fundamentals for the given symbols from the cache, stale or not.
+    Symbols that were never cached are fetched live once and stored.
+    Returns {symbol: market_data}; symbols whose live fetch fails are left out.
+    """
+    cached = load_fundamentals(symbols)
+    market = {
+        symbol: {field: cached[symbol].get(field, (None, None))[0] for field in INFO_KEYS}
+        for symbol in symbols if symbol in cached
+    }
+
+    fetched = {}
+    for symbol in symbols:
+        if symbol in market:
+            continue
+        try:
+            print(f"🆕 {symbol}: no cached fundamentals, fetching live")
+            fetched[symbol] = fetch_live_fundamentals(symbol, limiter=limiter)
+        except Exception as e:
+            print(f"⚠️ Fundamentals fetch failed for {symbol}: {e}")
+
+    store_fundamentals(fetched)
+    market.update(fetched)
+    return market
+
+
+def get_stale_symbols(symbols, now=None):
+    """Symbols with at least one field missing from the cache or older than its TTL."""
+    now = now or datetime.now()
+    cached = load_fundamentals(symbols)
+    stale = []
+    for symbol in symbols:
+        fields = cached.get(symbol, {})
+        for field, ttl in FIELD_TTL.items():
+            fetched_at = fields.get(field, (None, None))[1]
+            if fetched_at is None or now - fetched_at > ttl:
+                stale.append(symbol)
+                break
+    return stale
+
+
+def refresh_fundamentals(symbols=None, requests_per_second=REFRESH_REQUESTS_PER_SECOND, max_symbols=REFRESH_MAX_SYMBOLS):
+    """Throttled refresh of stale cache entries. Meant to run apart from the daily price update."""
+    if symbols is None:
+        symbols = [symbol for subsectors in SECTOR_STOCKS.values() for syms in subsectors.values() for symbol in syms]
+
+    stale = get_stale_symbols(symbols)
+    if max_symbols:
+        stale = stale[:max_symbols]
+    if not stale:
+        print("✅ Fundamentals cache is fresh.")
+        return 0
+
+    print(f"🔄 Refreshing fundamentals for {len(stale)} stale symbol(s) at {requests_per_second} req/s")
+    limiter = TokenBucket(rate=requests_per_second, capacity=1)
+    refreshed = 0
+    for symbol in stale:
+        try:
+            store_fundamentals({symbol: fetch_live_fundamentals(symbol, limiter=limiter)})
+            refreshed += 1
+        except Exception as e:
+            print(f"⚠️ Fundamentals refresh failed for {symbol}: {e}")
+            time.sleep(1)
+
+    print(f"✅ Refreshed fundamentals for {refreshed}/{len(stale)} symbol(s)")
+    return refreshed
+
+
+def main():
+    if test_database_connection():
+        create_fundamentals_table()
+        refresh_fundamentals()
+    else:
+        print("❌ Database connection failed.")
+
+
+if __name__ == "__main__":
+    main()
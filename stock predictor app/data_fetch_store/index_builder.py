@@ -0,0 +1,302 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from db_params import get_connection, test_database_connection
+from index_writer import INDEX_COLUMNS, write_index_batches
+from ingest_pool import run_jobs, parse_workers, INDEX_WORKERS
+from datetime import datetime
+
+# --- Index Settings ---
+
+MARKET_SECTOR = "Market"      # sector name of the market-wide row (subsector NULL)
+INDEX_LEVELS = ("market", "sector", "subsector")
+INDEX_ENGINE = os.getenv("INDEX_ENGINE", "python")   # "sql" computes the rebuild inside PostgreSQL (index_sql.py)
+VOLATILITY_WINDOWS = [5, 10, 20, 40]
+MOMENTUM_WINDOW = 14
+SMA_WINDOWS = [5, 20, 50, 125, 200]
+EMA_WINDOWS = [5, 10, 20, 50, 125, 200]
+WEEKLY_SMA_WINDOW = 1000
+NUMERIC_COLUMNS = ["close", "market_cap_proxy", "volume", "future_return_1d", "blended_cap"]
+ROUNDED_COLUMNS = INDEX_COLUMNS[INDEX_COLUMNS.index("volatility_5d"):]
+PANEL_MATRICES = ["close", "future", "volume", "blended"]   # date x symbol
+PANEL_VECTORS = ["base", "baseline_cap"]                    # per symbol
+
+
+# --- Index Math ---
+
+def build_index_panel(df):
+    """
+    Pivot stock rows (symbol, date, close, market_cap_proxy, volume, future_return_1d, blended_cap)
+    into date x symbol matrices, plus each symbol's first close and first market_cap_proxy,
+    which are its base price and baseline cap in every index it belongs to.
+    """
+    df = df.sort_values("date", kind="stable")
+    # NUMERIC columns come back as Decimal and missing values as None
+    df = df.assign(**{column: df[column].astype(float) for column in NUMERIC_COLUMNS})
+    first = df.groupby("symbol", sort=False).first()
+
+    def matrix(column):
+        return df.pivot(index="date", columns="symbol", values=column).reindex(columns=first.index)
+
+    close = matrix("close")
+    return {
+        "dates": close.index.to_numpy(),
+        "symbols": list(first.index),
+        "close": close.to_numpy(dtype=float),
+        "future": matrix("future_return_1d").to_numpy(dtype=float),
+        "volume": matrix("volume").to_numpy(dtype=float),
+        "blended": matrix("blended_cap").to_numpy(dtype=float),
+        "base": first["close"].to_numpy(dtype=float),
+        "baseline_cap": first["market_cap_proxy"].to_numpy(dtype=float),
+    }
+
+
+def index_from_panel(panel, columns=None):
+    """
+    Cap-weighted price index over the panel symbols at positions `columns` (all when None).
+    Each symbol is weighted by its baseline cap and priced relative to its base price. Returns a
+    date-indexed frame with index_value, market_cap, total_volume, average_return, weighted_return,
+    return_vs_previous and num_constituents, or None when the baseline cap is zero.
+    """
+    columns = slice(None) if columns is None else np.asarray(columns)
+    baseline_cap = panel["baseline_cap"][columns]
+    total_baseline_cap = baseline_cap.sum()
+    if total_baseline_cap == 0:
+        return None
+
+    close = panel["close"][:, columns]
+    future = panel["future"][:, columns]
+    base = panel["base"][columns]
+    weights = baseline_cap / total_baseline_cap
+
+    # A symbol counts on a date when it has a close and a usable (non-zero) base price
+    used = ~np.isnan(close) & ~np.isnan(base) & (base != 0)
+    weight_used = np.where(used, weights, 0.0)
+    ratio = np.where(used, close / np.where(base != 0, base, 1.0), 0.0)
+    future_used = np.where(used & ~np.isnan(future), future, 0.0)
+
+    index_val = (ratio * weights).sum(axis=1)
+    daily_weights_used = weight_used.sum(axis=1)
+    constituents = used.sum(axis=1)
+
+    keep = (constituents > 0) & (daily_weights_used != 0)
+    index_value = np.round(index_val[keep] / daily_weights_used[keep] * 1000, 2)
+    previous = np.concatenate([[np.nan], index_value[:-1]])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return_vs_previous = np.where(
+            ~np.isnan(previous) & (previous != 0), np.round((index_value - previous) / previous * 100, 2), np.nan)
+
+    constituents = constituents[keep]
+    return pd.DataFrame({
+        "index_value": index_value,
+        "market_cap": np.nansum(panel["blended"][:, columns], axis=1)[keep],
+        "total_volume": np.where(used, np.nan_to_num(panel["volume"][:, columns]), 0.0).sum(axis=1)[keep],
+        "average_return": np.round(future_used.sum(axis=1)[keep] / constituents, 5),
+        "weighted_return": np.round((future_used * weights).sum(axis=1)[keep], 5),
+        "return_vs_previous": return_vs_previous,
+        "num_constituents": constituents,
+    }, index=pd.Index(panel["dates"][keep], name="date"))
+
+
+def add_rolling_stats(index_df):
+    """Volatility, momentum, SMAs and EMAs of index_value, added in place and returned."""
+    returns = index_df["index_value"].pct_change()
+
+    for w in VOLATILITY_WINDOWS:
+        index_df[f"volatility_{w}d"] = returns.rolling(w).std()
+
+    index_df[f"momentum_{MOMENTUM_WINDOW}d"] = index_df["index_value"].pct_change(MOMENTUM_WINDOW)
+
+    for w in SMA_WINDOWS:
+        index_df[f"sma_{w}"] = index_df["index_value"].rolling(w).mean()
+
+    index_df["sma_200_weekly"] = index_df["index_value"].rolling(WEEKLY_SMA_WINDOW).mean()
+
+    for w in EMA_WINDOWS:
+        index_df[f"ema_{w}"] = index_df["index_value"].ewm(span=w, adjust=False).mean()
+    return index_df
+
+
+# --- Hierarchy ---
+
+def load_index_source(cutoff_date=None):
+    """Every priced stock row up to cutoff_date in one scan of stock_market_table."""
+    query = """
+        SELECT symbol, sector, subsector, date, close, market_cap, market_cap_proxy, volume, future_return_1d,
+               0.4 * market_cap + 0.6 * market_cap_proxy AS blended_cap
+        FROM stock_market_table
+        WHERE close IS NOT NULL AND market_cap_proxy IS NOT NULL
+    """
+    params = ()
+    if cutoff_date:
+        query += " AND date <= %s"
+        params = (cutoff_date,)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query + " ORDER BY date", params)
+            rows = cur.fetchall()
+            columns = [desc[0] for desc in cur.description]
+    df = pd.DataFrame(rows, columns=columns)
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df
+
+
+def slice_panel(panel, columns):
+    """The panel restricted to the symbols at positions `columns`, small enough to ship to a worker process."""
+    columns = np.asarray(columns, dtype=int)
+    sliced = {key: panel[key][:, columns] for key in PANEL_MATRICES}
+    sliced.update({key: panel[key][columns] for key in PANEL_VECTORS})
+    sliced.update(dates=panel["dates"], symbols=[panel["symbols"][i] for i in columns])
+    return sliced
+
+
+def hierarchy_groups(df, panel, levels=INDEX_LEVELS):
+    """
+    Independent index groups as (sector, panel, {subsector: columns}): the market over the whole panel,
+    then each sector over a slice holding only its members, with its subsectors' positions in that slice.
+    A group computes the same numbers alone as in one big pass, so groups can run in separate processes.
+    """
+    groups = [(MARKET_SECTOR, panel, {})] if "market" in levels else []
+    if "sector" not in levels and "subsector" not in levels:
+        return groups
+
+    position = {symbol: i for i, symbol in enumerate(panel["symbols"])}
+    members = df[["symbol", "sector", "subsector"]].drop_duplicates().dropna(subset=["sector"])
+    for sector, sector_members in members.groupby("sector", sort=True):
+        columns = sorted({position[s] for s in sector_members["symbol"]})
+        local = {panel["symbols"][column]: i for i, column in enumerate(columns)}
+        subsectors = {}
+        if "subsector" in levels:
+            subsectors = {
+                subsector: sorted({local[s] for s in sub_members["symbol"]})
+                for subsector, sub_members in sector_members.dropna(subset=["subsector"]).groupby("subsector", sort=True)
+            }
+        groups.append((sector, slice_panel(panel, columns), subsectors))
+    return groups
+
+
+def build_group(sector, panel, subsectors, levels=INDEX_LEVELS):
+    """
+    [(sector, subsector, index_df)] of one group. The sector frame is computed even when only its
+    subsectors are wanted: subsector frames carry influence_weight, their blended cap over the
+    sector's on the same date.
+    """
+    sector_df = index_from_panel(panel)
+    if sector_df is None:
+        print(f"⚠️ Skipping {sector}: baseline market cap is zero.")
+        return []
+
+    entities = []
+    if index_level(sector, None) in levels:
+        entities.append((sector, None, add_rolling_stats(sector_df)))
+    for subsector, columns in subsectors.items():
+        sub_df = index_from_panel(panel, columns)
+        if sub_df is None:
+            print(f"⚠️ Skipping {subsector}: zero baseline cap.")
+            continue
+        sector_cap = sector_df["market_cap"].reindex(sub_df.index)
+        sub_df["influence_weight"] = (sub_df["market_cap"] / sector_cap.where(sector_cap != 0)).round(5)
+        entities.append((sector, subsector, add_rolling_stats(sub_df)))
+    return entities
+
+
+def build_hierarchy(df, levels=INDEX_LEVELS):
+    """
+    Market, sector and subsector indexes from one panel, in memory. Returns [(sector, subsector, index_df)]
+    with the market row first (sector MARKET_SECTOR, subsector None).
+    """
+    panel = build_index_panel(df)
+    return [entity for group in hierarchy_groups(df, panel, levels) for entity in build_group(*group, levels)]
+
+
+def index_rows(sector, subsector, index_df):
+    """sector_index_table tuples in INDEX_COLUMNS order; rolling stats rounded to 5 places like before."""
+    frame = index_df.reindex(columns=INDEX_COLUMNS[4:])
+    frame[ROUNDED_COLUMNS] = frame[ROUNDED_COLUMNS].round(5)
+    frame = frame.astype(object).where(pd.notna(frame), None)
+    frame["num_constituents"] = frame["num_constituents"].map(lambda n: None if n is None else int(n))
+    is_subsector = subsector is not None
+    return [
+        (sector, subsector, is_subsector, date, *values)
+        for date, values in zip(frame.index, frame.itertuples(index=False, name=None))
+    ]
+
+
+def parse_cutoff(cutoff_date):
+    """'YYYY-MM-DD' string as a date, or None for "LATEST" (every stored date)."""
+    if cutoff_date == "LATEST":
+        return None
+    try:
+        return datetime.strptime(cutoff_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("❌ Invalid cutoff date format. Use 'YYYY-MM-DD' or 'LATEST'.")
+
+
+def index_level(sector, subsector):
+    return "subsector" if subsector is not None else "market" if sector == MARKET_SECTOR else "sector"
+
+
+def write_group(sector, panel, subsectors, levels):
+    """
+    run_jobs worker: compute one index group and write it on this process's own connection,
+    one COPY batch per index. Returns {sector: status}.
+    """
+    entities = build_group(sector, panel, subsectors, levels)
+    written = write_index_batches(
+        (subsector or sector, index_rows(sector, subsector, index_df)) for sector, subsector, index_df in entities
+    )
+    return {sector: f"{written} rows in {len(entities)} index(es)"}
+
+
+def rebuild_indexes(cutoff_date=None, levels=INDEX_LEVELS, workers=INDEX_WORKERS):
+    """
+    Compute the index levels in `levels` from a single scan of stock_market_table through cutoff_date
+    (a date, or None for all stored dates) and write them. The scan and the panel are built once; the
+    market and each sector (with its subsectors) are then computed and written as separate jobs, in
+    `workers` processes when workers > 1. Returns the number of rows written.
+    """
+    started = time.perf_counter()
+    df = load_index_source(cutoff_date)
+    if df.empty:
+        print("⚠️ No stock data to build indexes from")
+        return 0
+    print(f"📥 Loaded {len(df):,} stock rows ({df['symbol'].nunique()} symbols) in {time.perf_counter() - started:.1f}s")
+
+    groups = hierarchy_groups(df, build_index_panel(df), levels)
+    jobs = [([sector], (sector, panel, subsectors, levels)) for sector, panel, subsectors in groups]
+    results = run_jobs(jobs, write_group, max_workers=workers, processes=True)
+
+    written = sum(int(status.split()[0]) for ok, status in results.values() if ok)
+    failed = [sector for sector, (ok, _) in results.items() if not ok]
+    if failed:
+        print(f"❌ Failed index groups: {', '.join(failed)}")
+    print(f"🏁 Index rebuild completed: {written:,} rows from {len(groups)} group(s) in {time.perf_counter() - started:.1f}s")
+    return written
+
+
+def build_all_indexes(cutoff_date="LATEST", engine=INDEX_ENGINE, workers=INDEX_WORKERS):
+    """
+    Full rebuild of every level of sector_index_table from a single scan of stock_market_table.
+    :param cutoff_date: 'YYYY-MM-DD' string or "LATEST" for all stored dates
+    :param engine: "python" computes here with NumPy, "sql" runs the same math as window-function queries
+    :param workers: processes computing and writing index groups in parallel (python engine only)
+    """
+    cutoff_date = parse_cutoff(cutoff_date)
+    if engine == "sql":
+        from index_sql import build_all_indexes_sql
+        return build_all_indexes_sql(cutoff_date)
+    return rebuild_indexes(cutoff_date, workers=workers)
+
+
+def main(workers=INDEX_WORKERS):
+    if test_database_connection():
+        # CUTOFF_DATE = "2025-08-15"   # fixed date
+        CUTOFF_DATE = "LATEST"          # use every stored date
+        build_all_indexes(cutoff_date=CUTOFF_DATE, workers=workers)
+    else:
+        print("❌ Database connection failed.")
+
+
+if __name__ == "__main__":
+    main(workers=parse_workers("Rebuild every index level."))
@@ -0,0 +1,233 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from db_params import get_connection, test_database_connection
+from index_builder import (
+    MARKET_SECTOR, VOLATILITY_WINDOWS, MOMENTUM_WINDOW, SMA_WINDOWS, EMA_WINDOWS, WEEKLY_SMA_WINDOW,
+    load_index_source, build_hierarchy, index_rows,
+)
+from index_writer import INDEX_COLUMNS, INDEX_KEY, INDEX_STAGE, create_index_stage, merge_index_stage
+
+# --- SQL Index Engine ---
+# Computes every sector_index_table row inside PostgreSQL with set-based window-function queries,
+# mirroring index_builder.build_hierarchy + add_rolling_stats: each symbol is priced relative to its
+# first close and weighted by its first market_cap_proxy, the market/sector/subsector groups are
+# aggregated per date, and the rolling stats are window frames over each index's rows.
+# Selected with INDEX_ENGINE=sql (see index_builder.build_all_indexes).
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema", "index_engine.sql")
+
+
+def create_index_functions():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with open(SCHEMA_PATH, "r") as f:
+                cur.execute(f.read())
+        conn.commit()
+
+
+def _round(expression, places):
+    return f"CAST(ROUND(CAST({expression} AS NUMERIC), {places}) AS DOUBLE PRECISION)"
+
+
+def _frame(width):
+    return f"(w ROWS BETWEEN {width - 1} PRECEDING AND CURRENT ROW)"
+
+
+def _rolling_expressions():
+    """Rolling stat columns, NULL until a window is full like pandas rolling(w)."""
+    expressions = {}
+    for w in VOLATILITY_WINDOWS:
+        expressions[f"volatility_{w}d"] = (
+            f"CASE WHEN COUNT(ret) OVER {_frame(w)} = {w} THEN STDDEV_SAMP(ret) OVER {_frame(w)} END")
+    expressions[f"momentum_{MOMENTUM_WINDOW}d"] = (
+        f"index_value / NULLIF(LAG(index_value, {MOMENTUM_WINDOW}) OVER w, 0) - 1")
+    # index_value has two decimals, so NUMERIC averages are exact and PostgreSQL can slide them in O(1) per row
+    for name, w in [(f"sma_{w}", w) for w in SMA_WINDOWS] + [("sma_200_weekly", WEEKLY_SMA_WINDOW)]:
+        expressions[name] = (
+            f"CASE WHEN rn >= {w} THEN CAST(AVG(CAST(index_value AS NUMERIC)) OVER {_frame(w)} AS DOUBLE PRECISION) END")
+    for w in EMA_WINDOWS:
+        expressions[f"ema_{w}"] = f"index_ema(index_value, CAST({2.0 / (w + 1)!r} AS DOUBLE PRECISION)) OVER w"
+    return expressions
+
+
+def index_query(cutoff_date=None):
+    """(sql, params) of a SELECT returning every market, sector and subsector row in INDEX_COLUMNS order."""
+    rolling = _rolling_expressions()
+    cutoff = "AND date <= %s" if cutoff_date else ""
+    final_columns = {
+        "sector": "sector",
+        "subsector": "subsector",
+        "is_subsector": "subsector IS NOT NULL",
+        "date": "date",
+        "index_value": "index_value",
+        "market_cap": "CAST(ROUND(market_cap) AS BIGINT)",
+        "total_volume": "CAST(ROUND(total_volume) AS BIGINT)",
+        "num_constituents": "CAST(num_constituents AS INTEGER)",
+        "average_return": "average_return",
+        "weighted_return": "weighted_return",
+        "return_vs_previous": "return_vs_previous",
+        "influence_weight": "influence_weight",
+        **{name: _round(name, 5) for name in rolling},
+    }
+    sql = f"""
+        WITH src AS (
+            SELECT symbol, sector, subsector, date,
+                   CAST(close AS DOUBLE PRECISION) AS close,
+                   CAST(market_cap_proxy AS DOUBLE PRECISION) AS market_cap_proxy,
+                   CAST(volume AS DOUBLE PRECISION) AS volume,
+                   CAST(future_return_1d AS DOUBLE PRECISION) AS future_return_1d,
+                   0.4 * market_cap + 0.6 * market_cap_proxy AS blended_cap
+            FROM stock_market_table
+            WHERE close IS NOT NULL AND market_cap_proxy IS NOT NULL {cutoff}
+        ),
+        firsts AS (
+            SELECT symbol, close AS base, market_cap_proxy AS baseline_cap
+            FROM (SELECT symbol, close, market_cap_proxy,
+                         ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY date) AS first_rn
+                  FROM src) ranked
+            WHERE first_rn = 1
+        ),
+        members AS (
+            SELECT DISTINCT symbol, sector, subsector FROM src WHERE sector IS NOT NULL
+        ),
+        groups AS (
+            SELECT DISTINCT '{MARKET_SECTOR}' AS sector, CAST(NULL AS TEXT) AS subsector, symbol FROM src
+            UNION ALL
+            SELECT DISTINCT sector, CAST(NULL AS TEXT), symbol FROM members
+            UNION ALL
+            SELECT DISTINCT sector, subsector, symbol FROM members WHERE subsector IS NOT NULL
+        ),
+        weighted AS (
+            SELECT g.sector, g.subsector, g.symbol, f.base,
+                   f.baseline_cap / NULLIF(SUM(f.baseline_cap) OVER (PARTITION BY g.sector, g.subsector), 0) AS weight
+            FROM groups g JOIN firsts f ON f.symbol = g.symbol
+        ),
+        daily AS (
+            SELECT g.sector, g.subsector, s.date,
+                   SUM(CASE WHEN g.base <> 0 THEN s.close / g.base * g.weight ELSE 0 END) AS index_val,
+                   SUM(CASE WHEN g.base <> 0 THEN g.weight END) AS weights_used,
+                   COUNT(CASE WHEN g.base <> 0 THEN 1 END) AS num_constituents,
+                   COALESCE(SUM(s.blended_cap), 0) AS market_cap,
+                   COALESCE(SUM(CASE WHEN g.base <> 0 THEN s.volume END), 0) AS total_volume,
+                   COALESCE(SUM(CASE WHEN g.base <> 0 THEN s.future_return_1d END), 0) AS future_sum,
+                   COALESCE(SUM(CASE WHEN g.base <> 0 THEN s.future_return_1d * g.weight END), 0) AS weighted_future
+            FROM weighted g JOIN src s ON s.symbol = g.symbol
+            GROUP BY g.sector, g.subsector, s.date
+        ),
+        levels AS (
+            SELECT sector, subsector, date, market_cap, total_volume, num_constituents,
+                   {_round("index_val / weights_used * 1000", 2)} AS index_value,
+                   {_round("future_sum / num_constituents", 5)} AS average_return,
+                   {_round("weighted_future", 5)} AS weighted_return
+            FROM daily
+            WHERE num_constituents > 0 AND weights_used <> 0
+        ),
+        chained AS (
+            SELECT l.*,
+                   index_value / NULLIF(LAG(index_value) OVER w, 0) - 1 AS ret,
+                   ROW_NUMBER() OVER w AS rn
+            FROM levels l
+            WINDOW w AS (PARTITION BY sector, subsector ORDER BY date)
+        ),
+        stats AS (
+            SELECT c.*,
+                   {_round("ret * 100", 2)} AS return_vs_previous,
+                   {", ".join(f"{expression} AS {name}" for name, expression in rolling.items())}
+            FROM chained c
+            WINDOW w AS (PARTITION BY sector, subsector ORDER BY date)
+        ),
+        influenced AS (
+            SELECT s.*,
+                   CASE WHEN s.subsector IS NOT NULL
+                        THEN {_round("s.market_cap / NULLIF(p.market_cap, 0)", 5)} END AS influence_weight
+            FROM stats s
+            LEFT JOIN levels p ON s.subsector IS NOT NULL AND p.subsector IS NULL
+                              AND p.sector = s.sector AND p.date = s.date
+        )
+        SELECT {", ".join(f"{final_columns[c]} AS {c}" for c in INDEX_COLUMNS)}
+        FROM influenced
+        ORDER BY sector, subsector, date
+    """
+    return sql, ((cutoff_date,) if cutoff_date else None)
+
+
+def build_all_indexes_sql(cutoff_date=None):
+    """
+    Full rebuild of every level of sector_index_table inside the database: the index query fills the
+    stage table and merge_index_stage writes it, all in one transaction. Returns the rows written.
+    """
+    started = time.perf_counter()
+    create_index_functions()
+    sql, params = index_query(cutoff_date)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            create_index_stage(cur)
+            cur.execute(f"INSERT INTO {INDEX_STAGE} ({', '.join(INDEX_COLUMNS)}) {sql}", params)
+            print(f"🧮 Computed {cur.rowcount:,} index rows in SQL in {time.perf_counter() - started:.1f}s")
+            updated, inserted = merge_index_stage(cur)
+            conn.commit()
+
+    written = updated + inserted
+    print(f"🏁 SQL index rebuild completed: {inserted:,} inserted, {updated:,} updated in {time.perf_counter() - started:.1f}s")
+    return written
+
+
+# --- Engine Comparison ---
+
+def compare_engines(cutoff_date=None, tolerance=1e-6):
+    """
+    Compute every index row with both engines on the same stored data, without writing anything,
+    and report each engine's time and the largest difference per column. Returns {column: max abs diff}.
+    """
+    started = time.perf_counter()
+    df = load_index_source(cutoff_date)
+    python_rows = [row for sector, subsector, index_df in build_hierarchy(df) for row in index_rows(sector, subsector, index_df)]
+    python_sec = time.perf_counter() - started
+
+    create_index_functions()
+    started = time.perf_counter()
+    sql, params = index_query(cutoff_date)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            sql_rows = cur.fetchall()
+    sql_sec = time.perf_counter() - started
+
+    python_df = pd.DataFrame(python_rows, columns=INDEX_COLUMNS).set_index(INDEX_KEY)
+    sql_df = pd.DataFrame(sql_rows, columns=INDEX_COLUMNS).set_index(INDEX_KEY)
+    print(f"🐍 Python engine: {len(python_df):,} rows in {python_sec:.2f}s (load + compute)")
+    print(f"🐘 SQL engine:    {len(sql_df):,} rows in {sql_sec:.2f}s (query + fetch)")
+
+    missing = python_df.index.symmetric_difference(sql_df.index)
+    if len(missing):
+        print(f"⚠️ {len(missing)} key(s) produced by only one engine, e.g. {list(missing[:3])}")
+
+    common = python_df.index.intersection(sql_df.index)
+    diffs = {}
+    for column in INDEX_COLUMNS[4:]:
+        left = pd.to_numeric(python_df.loc[common, column], errors="coerce").to_numpy(dtype=float)
+        right = pd.to_numeric(sql_df.loc[common, column], errors="coerce").to_numpy(dtype=float)
+        both = ~np.isnan(left) & ~np.isnan(right)
+        mismatched_nulls = int((np.isnan(left) != np.isnan(right)).sum())
+        diffs[column] = float(np.abs(left[both] - right[both]).max()) if both.any() else 0.0
+        if diffs[column] > tolerance or mismatched_nulls:
+            print(f"⚠️ {column}: max diff {diffs[column]:.3g}, {mismatched_nulls} NULL mismatch(es)")
+    if all(d <= tolerance for d in diffs.values()) and not len(missing):
+        print(f"✅ Engines agree on {len(common):,} rows (tolerance {tolerance})")
+    return diffs
+
+
+if __name__ == "__main__":
+    # python index_sql.py            rebuild sector_index_table in SQL
+    # python index_sql.py compare    time both engines on the stored data and diff their rows
+    import sys
+
+    if test_database_connection():
+        if len(sys.argv) > 1 and sys.argv[1] == "compare":
+            compare_engines()
+        else:
+            build_all_indexes_sql()
+    else:
+        print("❌ Database connection failed.")
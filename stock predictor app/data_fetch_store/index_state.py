@@ -0,0 +1,178 @@
+import os
+import math
+from collections import deque
+from psycopg2.extras import Json
+from db_params import get_connection
+from index_builder import VOLATILITY_WINDOWS, MOMENTUM_WINDOW, SMA_WINDOWS, EMA_WINDOWS, WEEKLY_SMA_WINDOW
+
+# Running state per index, enough to advance every rolling statistic by one day in O(1):
+#   n            index values seen so far (drives the rolling-window warm-up)
+#   values       ring buffer of the last WEEKLY_SMA_WINDOW index values (SMA windows and momentum read from it)
+#   returns      ring buffer of the last daily returns, as long as the widest volatility window
+#   ema          EMA value per span
+#   prices/caps  last known close and market_cap_proxy per constituent, which chain the next day's index
+# Window sums and sums of squares are rebuilt from the ring buffers on load, so rounding never drifts across days.
+
+SUM_WINDOWS = sorted(set(SMA_WINDOWS + [WEEKLY_SMA_WINDOW]))
+RETURN_WINDOW = max(VOLATILITY_WINDOWS)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema", "index_state.schema.sql")
+
+
+def create_index_state_table():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with open(SCHEMA_PATH, "r") as f:
+                cur.execute(f.read())
+        conn.commit()
+
+
+def _num(value):
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else float(value)
+
+
+def _rebuild_sums(state):
+    values = list(state["values"])
+    returns = list(state["returns"])
+    state["sums"] = {w: math.fsum(values[-w:]) for w in SUM_WINDOWS}
+    state["return_sums"] = {w: math.fsum(returns[-w:]) for w in VOLATILITY_WINDOWS}
+    state["return_squares"] = {w: math.fsum(r * r for r in returns[-w:]) for w in VOLATILITY_WINDOWS}
+    return state
+
+
+def new_state():
+    """State of an index with no values yet."""
+    return _rebuild_sums({
+        "n": 0,
+        "values": deque(maxlen=WEEKLY_SMA_WINDOW),
+        "returns": deque(maxlen=RETURN_WINDOW),
+        "ema": {span: None for span in EMA_WINDOWS},
+        "prices": {},
+        "caps": {},
+    })
+
+
+def to_json(state):
+    return {
+        "n": state["n"],
+        "values": [float(v) for v in state["values"]],
+        "returns": [float(r) for r in state["returns"]],
+        "ema": {str(span): _num(v) for span, v in state["ema"].items()},
+        "prices": {symbol: float(p) for symbol, p in state["prices"].items()},
+        "caps": {symbol: float(c) for symbol, c in state["caps"].items()},
+    }
+
+
+def from_json(data):
+    return _rebuild_sums({
+        "n": data["n"],
+        "values": deque(data["values"], maxlen=WEEKLY_SMA_WINDOW),
+        "returns": deque(data["returns"], maxlen=RETURN_WINDOW),
+        "ema": {span: data["ema"].get(str(span)) for span in EMA_WINDOWS},
+        "prices": dict(data["prices"]),
+        "caps": dict(data["caps"]),
+    })
+
+
+def advance(state, index_value):
+    """
+    Push one index value into the state and return that day's return_vs_previous and rolling stats,
+    matching index_builder.add_rolling_stats on the full series (None while a window is warming up).
+    """
+    value = float(index_value)
+    values = state["values"]
+    previous = values[-1] if values else None
+    n = state["n"] + 1
+
+    row = {"return_vs_previous": None}
+    if previous:
+        ret = value / previous - 1
+        row["return_vs_previous"] = ret
+        returns = state["returns"]
+        for w in VOLATILITY_WINDOWS:
+            leaving = returns[-w] if len(returns) >= w else 0.0
+            state["return_sums"][w] += ret - leaving
+            state["return_squares"][w] += ret * ret - leaving * leaving
+        returns.append(ret)
+
+    momentum_base = values[-MOMENTUM_WINDOW] if len(values) >= MOMENTUM_WINDOW else None
+    row[f"momentum_{MOMENTUM_WINDOW}d"] = value / momentum_base - 1 if momentum_base else None
+
+    for w in SUM_WINDOWS:
+        leaving = values[-w] if len(values) >= w else 0.0
+        state["sums"][w] += value - leaving
+    values.append(value)
+
+    for w in VOLATILITY_WINDOWS:
+        variance = None
+        if len(state["returns"]) >= w:
+            total = state["return_sums"][w]
+            variance = max(state["return_squares"][w] - total * total / w, 0.0) / (w - 1)
+        row[f"volatility_{w}d"] = math.sqrt(variance) if variance is not None else None
+
+    for w in SMA_WINDOWS:
+        row[f"sma_{w}"] = state["sums"][w] / w if n >= w else None
+    row["sma_200_weekly"] = state["sums"][WEEKLY_SMA_WINDOW] / WEEKLY_SMA_WINDOW if n >= WEEKLY_SMA_WINDOW else None
+
+    for span in EMA_WINDOWS:
+        alpha = 2.0 / (span + 1)
+        prev = state["ema"][span]
+        state["ema"][span] = value if prev is None else (1 - alpha) * prev + alpha * value
+        row[f"ema_{span}"] = state["ema"][span]
+
+    state["n"] = n
+    return row
+
+
+def build_state(index_values, prices=None, caps=None):
+    """State after folding a full index history (oldest first); used to seed indexes that have none yet."""
+    state = new_state()
+    for value in index_values:
+        advance(state, value)
+    state["prices"] = dict(prices or {})
+    state["caps"] = dict(caps or {})
+    return _rebuild_sums(state)
+
+
+def state_from_window(values, n, ema, prices=None, caps=None):
+    """
+    State after n index values, rebuilt from the last WEEKLY_SMA_WINDOW of them (oldest first) and the
+    EMA per span as of the last one; used to rewind an index without folding its whole history again.
+    """
+    values = [float(v) for v in values][-WEEKLY_SMA_WINDOW:]
+    state = new_state()
+    state["n"] = n
+    state["values"].extend(values)
+    state["returns"].extend(value / previous - 1 for previous, value in zip(values, values[1:]) if previous)
+    state["ema"] = {span: _num(ema[span]) for span in EMA_WINDOWS}
+    state["prices"] = dict(prices or {})
+    state["caps"] = dict(caps or {})
+    return _rebuild_sums(state)
+
+
+def last_value(state):
+    return state["values"][-1] if state["values"] else None
+
+
+# --- Database Helpers ---
+
+def load_state(sector, subsector=None):
+    """Returns (last_date, state) for the index, or None when it has no stored state."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT last_date, state FROM index_state WHERE sector = %s AND subsector = %s
+            """, (sector, subsector or ""))
+            row = cur.fetchone()
+    return (row[0], from_json(row[1])) if row else None
+
+
+def save_state(cur, sector, subsector, last_date, state):
+    """Upsert one index's state inside the caller's transaction, so it commits with the rows it describes."""
+    cur.execute("""
+        INSERT INTO index_state (sector, subsector, last_date, state) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (sector, subsector) DO UPDATE SET
+            last_date = EXCLUDED.last_date,
+            state = EXCLUDED.state,
+            updated_at = NOW()
+    """, (sector, subsector or "", last_date, Json(to_json(state))))
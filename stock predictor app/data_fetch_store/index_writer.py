@@ -0,0 +1,97 @@
+import time
+import pandas as pd
+from db_params import get_connection
+from bulk_load import to_copy_buffer
+
+# --- sector_index_table Layout ---
+
+INDEX_COLUMNS = [
+    "sector", "subsector", "is_subsector", "date",
+    "index_value", "market_cap", "total_volume", "num_constituents",
+    "average_return", "weighted_return", "return_vs_previous", "influence_weight",
+    "volatility_5d", "volatility_10d", "volatility_20d", "volatility_40d",
+    "momentum_14d",
+    "sma_5", "sma_20", "sma_50", "sma_125", "sma_200", "sma_200_weekly",
+    "ema_5", "ema_10", "ema_20", "ema_50", "ema_125", "ema_200",
+]
+INDEX_KEY = ["sector", "subsector", "date"]
+INDEX_INTEGER_COLUMNS = ["market_cap", "total_volume", "num_constituents"]
+INDEX_STAGE = "sector_index_table_stage"
+
+# Sector-level rows have subsector NULL, which UNIQUE (sector, subsector, date) and ON CONFLICT
+# never treat as equal, so rows are matched on the key with IS NOT DISTINCT FROM instead.
+KEY_MATCH = "t.sector = s.sector AND t.subsector IS NOT DISTINCT FROM s.subsector AND t.date = s.date"
+
+
+def create_index_stage(cur, columns=INDEX_COLUMNS):
+    """Empty temp table shaped like sector_index_table's `columns`, dropped when the transaction commits."""
+    # pg_temp: only ever a stage of this session, never a permanent table of that name
+    cur.execute(f"DROP TABLE IF EXISTS pg_temp.{INDEX_STAGE}")
+    cur.execute(f"CREATE TEMP TABLE {INDEX_STAGE} ON COMMIT DROP AS SELECT {', '.join(columns)} FROM sector_index_table WITH NO DATA")
+
+
+def merge_index_stage(cur, columns=INDEX_COLUMNS, update_columns=None):
+    """
+    Merge the staged rows with one UPDATE ... FROM for keys already stored and one INSERT ... SELECT
+    for new keys. update_columns=None overwrites every value column given; [] leaves existing rows
+    untouched. Returns (updated, inserted).
+    """
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in INDEX_KEY and c != "is_subsector"]
+    column_list = ", ".join(columns)
+
+    updated = 0
+    if update_columns:
+        cur.execute(f"""
+            UPDATE sector_index_table t
+            SET {", ".join(f"{c} = s.{c}" for c in update_columns)}
+            FROM {INDEX_STAGE} s
+            WHERE {KEY_MATCH}
+        """)
+        updated = cur.rowcount
+
+    cur.execute(f"""
+        INSERT INTO sector_index_table ({column_list})
+        SELECT {column_list} FROM {INDEX_STAGE} s
+        WHERE NOT EXISTS (SELECT 1 FROM sector_index_table t WHERE {KEY_MATCH})
+    """)
+    return updated, cur.rowcount
+
+
+def upsert_index_rows(cur, rows, columns=INDEX_COLUMNS, update_columns=None):
+    """
+    Stage `rows` (tuples in `columns` order, which must include INDEX_KEY) into a temp table with COPY,
+    then merge them into sector_index_table (see merge_index_stage).
+    Runs inside the caller's transaction. Returns (updated, inserted).
+    """
+    if not rows:
+        return 0, 0
+    frame = pd.DataFrame(rows, columns=columns).drop_duplicates(subset=INDEX_KEY, keep="last")
+
+    create_index_stage(cur, columns)
+    cur.copy_expert(
+        f"COPY {INDEX_STAGE} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+        to_copy_buffer(frame, INDEX_INTEGER_COLUMNS),
+    )
+    return merge_index_stage(cur, columns, update_columns)
+
+
+def write_index_batches(batches, columns=INDEX_COLUMNS, update_columns=None):
+    """
+    Write (label, rows) batches, usually one per sector or subsector: one COPY + upsert and one
+    commit per batch, and one progress line per batch. Returns the number of rows written.
+    """
+    batches = [(label, rows) for label, rows in batches if rows]
+    written = 0
+    started = time.perf_counter()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for i, (label, rows) in enumerate(batches, 1):
+                updated, inserted = upsert_index_rows(cur, rows, columns, update_columns)
+                conn.commit()
+                written += updated + inserted
+                print(f"✅ [{i}/{len(batches)}] {label}: {inserted} inserted, {updated} updated")
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    if batches:
+        print(f"📦 Wrote {written:,} index rows in {len(batches)} batch(es) ({written / elapsed:,.0f} rows/s)")
+    return written
@@ -0,0 +1,251 @@
+import os
+import math
+from collections import deque
+from itertools import islice
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values, Json
+from db_params import get_connection
+from indicators import (
+    SMA_EMA_WINDOWS, VOLATILITY_WINDOWS, WEEKLY_SMA_WINDOW, EMA_SPANS,
+    MACD_FAST, MACD_SLOW, MACD_SIGNAL, RSI_WINDOW, BOLLINGER_WINDOW, BOLLINGER_DEV,
+    build_panel, running_values, add_indicators_panel,
+)
+
+# Running state per symbol, enough to advance every indicator by one bar in O(1):
+#   n            bars seen so far (drives the min_periods warm-up)
+#   closes       ring buffer of the last WEEKLY_SMA_WINDOW closes (rolling sums/std windows read from it)
+#   ema          EMA value per span, including the MACD fast/slow spans
+#   macd_signal  EMA of the MACD line, macd_count = MACD values seen
+#   rsi_up/down  Wilder averages of gains and losses
+#   obv          on-balance volume accumulator, last_close for OBV/RSI direction
+# Rolling sums are rebuilt from the ring buffer on load, so rounding never drifts across days.
+
+SUM_WINDOWS = sorted(set(SMA_EMA_WINDOWS + [BOLLINGER_WINDOW, WEEKLY_SMA_WINDOW]))
+STD_WINDOW = max(VOLATILITY_WINDOWS + [BOLLINGER_WINDOW])
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema", "indicator_state.schema.sql")
+
+
+def create_state_table():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with open(SCHEMA_PATH, "r") as f:
+                cur.execute(f.read())
+        conn.commit()
+
+
+def _num(value):
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else float(value)
+
+
+def new_state():
+    """State of a symbol with no bars yet."""
+    return {
+        "n": 0,
+        "closes": deque(maxlen=WEEKLY_SMA_WINDOW),
+        "sums": {w: 0.0 for w in SUM_WINDOWS},
+        "ema": {span: None for span in EMA_SPANS},
+        "macd_signal": None,
+        "macd_count": 0,
+        "rsi_up": None,
+        "rsi_down": None,
+        "obv": None,
+        "last_close": None,
+    }
+
+
+def to_json(state):
+    return {
+        "n": state["n"],
+        "closes": [float(c) for c in state["closes"]],
+        "ema": {str(span): _num(v) for span, v in state["ema"].items()},
+        "macd_signal": _num(state["macd_signal"]),
+        "macd_count": state["macd_count"],
+        "rsi_up": _num(state["rsi_up"]),
+        "rsi_down": _num(state["rsi_down"]),
+        "obv": _num(state["obv"]),
+        "last_close": _num(state["last_close"]),
+    }
+
+
+def from_json(data):
+    closes = deque(data["closes"], maxlen=WEEKLY_SMA_WINDOW)
+    buffered = list(closes)
+    return {
+        "n": data["n"],
+        "closes": closes,
+        "sums": {w: math.fsum(buffered[-w:]) for w in SUM_WINDOWS},
+        "ema": {int(span): data["ema"].get(str(span)) for span in EMA_SPANS},
+        "macd_signal": data["macd_signal"],
+        "macd_count": data["macd_count"],
+        "rsi_up": data["rsi_up"],
+        "rsi_down": data["rsi_down"],
+        "obv": data["obv"],
+        "last_close": data["last_close"],
+    }
+
+
+def states_from_panel(panel):
+    """{symbol: state} at each symbol's last bar, read off the running values of an indicator panel pass."""
+    if panel is None:
+        return {}
+    close, lengths, running = panel["close"], panel["lengths"], panel["running"]
+    states = {}
+    for j, symbol in enumerate(panel["symbols"]):
+        last = lengths[j] - 1
+        closes = deque(close[max(0, last + 1 - WEEKLY_SMA_WINDOW):last + 1, j].tolist(), maxlen=WEEKLY_SMA_WINDOW)
+        buffered = list(closes)
+        states[symbol] = {
+            "n": int(lengths[j]),
+            "closes": closes,
+            "sums": {w: math.fsum(buffered[-w:]) for w in SUM_WINDOWS},
+            "ema": {span: float(running["ema"][span][last, j]) for span in EMA_SPANS},
+            "macd_signal": _num(float(running["macd_signal"][last, j])),
+            "macd_count": max(0, int(lengths[j]) - (MACD_SLOW - 1)),
+            "rsi_up": float(running["rsi_up"][last, j]),
+            "rsi_down": float(running["rsi_down"][last, j]),
+            "obv": float(running["obv"][last, j]),
+            "last_close": float(close[last, j]),
+        }
+    return states
+
+
+def build_states(frames):
+    """
+    Build the running state at the last bar of each full-history frame ({symbol: df with close/volume}).
+    Uses the panel engine, so building states for a batch is a few vectorized passes.
+    """
+    frames = {symbol: df.reset_index(drop=True) for symbol, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return {}
+    close, lengths = build_panel(frames, "close")
+    volume, _ = build_panel(frames, "volume")
+    return states_from_panel({"symbols": list(frames), "close": close, "lengths": lengths,
+                              "running": running_values(close, volume)})
+
+
+def enrich_with_states(frames):
+    """add_indicators_panel plus each symbol's running state at its last bar, from the same panel pass."""
+    enriched, panel = add_indicators_panel(frames, return_panel=True)
+    return enriched, states_from_panel(panel)
+
+
+def advance(state, close, volume):
+    """Push one bar into the state and return that bar's indicator values (same warm-up rules as the panel engine)."""
+    close = float(close)
+    volume = float(volume)
+    closes = state["closes"]
+    n = state["n"] + 1
+
+    # Rolling sums: add the new close, drop the one leaving each window
+    for w in SUM_WINDOWS:
+        leaving = closes[-w] if len(closes) >= w else 0.0
+        state["sums"][w] += close - leaving
+    closes.append(close)
+    recent = list(islice(closes, max(0, len(closes) - STD_WINDOW), None))
+
+    row = {}
+    for w in SMA_EMA_WINDOWS:
+        row[f"sma_{w}"] = state["sums"][w] / w if n >= w else np.nan
+
+    for span in EMA_SPANS:
+        alpha = 2.0 / (span + 1)
+        prev = state["ema"][span]
+        state["ema"][span] = close if prev is None else (1 - alpha) * prev + alpha * close
+    for w in SMA_EMA_WINDOWS:
+        row[f"ema_{w}"] = state["ema"][w] if n >= w else np.nan
+
+    row["macd"] = np.nan
+    if n >= MACD_SLOW:
+        macd_line = state["ema"][MACD_FAST] - state["ema"][MACD_SLOW]
+        alpha = 2.0 / (MACD_SIGNAL + 1)
+        prev = state["macd_signal"]
+        state["macd_signal"] = macd_line if prev is None else (1 - alpha) * prev + alpha * macd_line
+        state["macd_count"] += 1
+        if state["macd_count"] >= MACD_SIGNAL:
+            row["macd"] = macd_line - state["macd_signal"]
+    row["dma"] = close - row["sma_50"]
+
+    last_close = state["last_close"]
+    delta = close - last_close if last_close is not None else 0.0
+    alpha = 1.0 / RSI_WINDOW
+    up, down = max(delta, 0.0), max(-delta, 0.0)
+    state["rsi_up"] = up if state["rsi_up"] is None else (1 - alpha) * state["rsi_up"] + alpha * up
+    state["rsi_down"] = down if state["rsi_down"] is None else (1 - alpha) * state["rsi_down"] + alpha * down
+    if n >= RSI_WINDOW:
+        row["rsi"] = 100.0 if state["rsi_down"] == 0 else 100.0 - 100.0 / (1.0 + state["rsi_up"] / state["rsi_down"])
+    else:
+        row["rsi"] = np.nan
+
+    if n >= BOLLINGER_WINDOW:
+        middle = state["sums"][BOLLINGER_WINDOW] / BOLLINGER_WINDOW
+        band = BOLLINGER_DEV * float(np.std(recent[-BOLLINGER_WINDOW:], ddof=0))
+        row["bollinger_upper"], row["bollinger_middle"], row["bollinger_lower"] = middle + band, middle, middle - band
+    else:
+        row["bollinger_upper"] = row["bollinger_middle"] = row["bollinger_lower"] = np.nan
+
+    signed = -volume if last_close is not None and close < last_close else volume
+    state["obv"] = signed if state["obv"] is None else state["obv"] + signed
+    row["obv"] = state["obv"]
+    row["sma_200_weekly"] = state["sums"][WEEKLY_SMA_WINDOW] / WEEKLY_SMA_WINDOW if n >= WEEKLY_SMA_WINDOW else np.nan
+
+    for w in VOLATILITY_WINDOWS:
+        row[f"volatility_{w}d"] = float(np.std(recent[-w:], ddof=1)) if n >= w else np.nan
+
+    state["n"] = n
+    state["last_close"] = close
+    return row
+
+
+def apply_bars(state, df):
+    """Advance the state over new raw bars and return them enriched like indicators.add_indicators."""
+    df = df.reset_index(drop=True)
+    rows = [advance(state, close, volume) for close, volume in zip(df["close"], df["volume"])]
+    enriched = pd.concat([df, pd.DataFrame(rows, index=df.index)], axis=1)
+
+    dates = pd.to_datetime(enriched["date"])
+    enriched["adj_close"] = enriched["close"]
+    enriched["market_cap_proxy"] = enriched["close"] * enriched["volume"]
+    enriched["day_of_week"] = dates.dt.dayofweek + 1
+    enriched["week_of_year"] = dates.dt.isocalendar().week
+    enriched["date"] = dates.dt.date
+    return enriched
+
+
+def copy_state(state):
+    copied = dict(state)
+    copied["closes"] = deque(state["closes"], maxlen=WEEKLY_SMA_WINDOW)
+    copied["sums"] = dict(state["sums"])
+    copied["ema"] = dict(state["ema"])
+    return copied
+
+
+# --- Database Helpers ---
+
+def load_states(symbols):
+    """Returns {symbol: (last_date, state)} for symbols that have a stored state."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT symbol, last_date, state FROM indicator_state WHERE symbol = ANY(%s)
+            """, (list(symbols),))
+            rows = cur.fetchall()
+    return {symbol: (last_date, from_json(state)) for symbol, last_date, state in rows}
+
+
+def save_states(states):
+    """Upsert {symbol: (last_date, state)}. Call only after the matching rows are committed."""
+    if not states:
+        return
+    rows = [(symbol, last_date, Json(to_json(state))) for symbol, (last_date, state) in states.items()]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO indicator_state (symbol, last_date, state) VALUES %s
+                ON CONFLICT (symbol) DO UPDATE SET
+                    last_date = EXCLUDED.last_date,
+                    state = EXCLUDED.state,
+                    updated_at = NOW()
+            """, rows)
+        conn.commit()
@@ -0,0 +1,238 @@
+import numpy as np
+import pandas as pd
+
+# --- Indicator Settings (same defaults as the `ta` indicators they replace) ---
+
+SMA_EMA_WINDOWS = [5, 20, 50, 125, 200]
+VOLATILITY_WINDOWS = [5, 10, 20, 40]
+WEEKLY_SMA_WINDOW = 200 * 5
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_WINDOW = 14
+BOLLINGER_WINDOW, BOLLINGER_DEV = 20, 2
+STD_CHUNK_ROWS = 256   # rows per sliding-window block when computing rolling std
+EMA_SPANS = SMA_EMA_WINDOWS + [MACD_FAST, MACD_SLOW]
+
+# Panel layout: one column per symbol, left-aligned by bar number (row i = the symbol's i-th bar),
+# padded with NaN at the bottom. Every column is exactly that symbol's own series, so each
+# rolling/recursive pass over the panel gives the same numbers as running it symbol by symbol.
+
+
+def build_panel(frames, column):
+    """Stack one column of every frame into a (max bars x symbols) float panel."""
+    symbols = list(frames)
+    lengths = np.array([len(frames[s]) for s in symbols])
+    panel = np.full((lengths.max() if len(lengths) else 0, len(symbols)), np.nan)
+    for j, symbol in enumerate(symbols):
+        panel[:lengths[j], j] = frames[symbol][column].to_numpy(dtype=float)
+    return panel, lengths
+
+
+def rolling_means(panel, windows):
+    """rolling(window).mean() per column for several windows, sharing one cumulative sum.
+    Values are anchored on the first bar to keep cumsum error small."""
+    anchor = np.nan_to_num(panel[:1])
+    shifted = np.nan_to_num(panel - anchor)
+    valid = np.isfinite(panel).astype(float)
+
+    csum = np.vstack([np.zeros((1, panel.shape[1])), np.cumsum(shifted, axis=0)])
+    ccount = np.vstack([np.zeros((1, panel.shape[1])), np.cumsum(valid, axis=0)])
+
+    means = {}
+    for window in windows:
+        out = np.full_like(panel, np.nan)
+        if panel.shape[0] >= window:
+            sums = csum[window:] - csum[:-window]
+            counts = ccount[window:] - ccount[:-window]
+            out[window - 1:] = np.where(counts == window, sums / window + anchor, np.nan)
+        means[window] = out
+    return means
+
+
+def rolling_mean(panel, window):
+    return rolling_means(panel, [window])[window]
+
+
+def rolling_std(panel, window, ddof=1):
+    """rolling(window).std(ddof) per column, two-pass over sliding windows in row blocks."""
+    out = np.full_like(panel, np.nan)
+    rows = panel.shape[0]
+    if rows < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(panel, window, axis=0)   # (rows - window + 1, symbols, window)
+    for start in range(0, windows.shape[0], STD_CHUNK_ROWS):
+        block = windows[start:start + STD_CHUNK_ROWS]
+        mean = block.mean(axis=2, keepdims=True)
+        var = ((block - mean) ** 2).sum(axis=2) / (window - ddof)
+        out[start + window - 1:start + window - 1 + block.shape[0]] = np.sqrt(var)
+    return out
+
+
+def ewm_mean(panel, alpha, min_periods):
+    """ewm(alpha, adjust=False, min_periods).mean() per column, in one pandas pass over the whole panel."""
+    return pd.DataFrame(panel).ewm(alpha=alpha, adjust=False, min_periods=min_periods).mean().to_numpy()
+
+
+def ema(panel, span):
+    return ewm_mean(panel, 2.0 / (span + 1), span)
+
+
+def diff(panel):
+    out = np.full_like(panel, np.nan)
+    out[1:] = panel[1:] - panel[:-1]
+    return out
+
+
+def running_values(close, volume):
+    """
+    The recursive series behind the indicators, without warm-up masking: EMA per span (including the
+    MACD spans), MACD line and signal, Wilder RSI averages and OBV. Their last row is a symbol's
+    persisted running state (indicator_state.states_from_panel), so both come from this one pass.
+    """
+    counts = np.cumsum(np.isfinite(close), axis=0)
+    emas = {span: ewm_mean(close, 2.0 / (span + 1), 1) for span in EMA_SPANS}
+    macd_line = np.where(counts >= MACD_SLOW, emas[MACD_FAST] - emas[MACD_SLOW], np.nan)
+
+    delta = diff(close)
+    prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    return {
+        "counts": counts,
+        "ema": emas,
+        "macd_line": macd_line,
+        "macd_signal": ewm_mean(macd_line, 2.0 / (MACD_SIGNAL + 1), 1),
+        "rsi_up": ewm_mean(np.where(delta > 0, delta, 0.0), 1.0 / RSI_WINDOW, 1),
+        "rsi_down": ewm_mean(np.where(delta < 0, -delta, 0.0), 1.0 / RSI_WINDOW, 1),
+        "obv": np.cumsum(np.where(close < prev_close, -volume, volume), axis=0),
+    }
+
+
+def compute_panel_indicators(close, volume, running=None):
+    """Every price-derived indicator for a close/volume panel. Returns {column name: panel}."""
+    if running is None:
+        running = running_values(close, volume)
+    counts = running["counts"]
+    means = rolling_means(close, SMA_EMA_WINDOWS + [BOLLINGER_WINDOW, WEEKLY_SMA_WINDOW])
+    out = {}
+    for window in SMA_EMA_WINDOWS:
+        out[f"sma_{window}"] = means[window]
+        out[f"ema_{window}"] = np.where(counts >= window, running["ema"][window], np.nan)
+
+    macd_line = running["macd_line"]
+    signal_counts = np.cumsum(np.isfinite(macd_line), axis=0)
+    out["macd"] = np.where(signal_counts >= MACD_SIGNAL, macd_line - running["macd_signal"], np.nan)
+    out["dma"] = close - out["sma_50"]
+
+    # The gain/loss series have a value on every row (the first delta counts as no change)
+    rows = np.arange(1, close.shape[0] + 1)[:, None]
+    avg_up, avg_down = running["rsi_up"], running["rsi_down"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_down == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_up / avg_down))
+    out["rsi"] = np.where(rows >= RSI_WINDOW, rsi, np.nan)
+
+    middle = means[BOLLINGER_WINDOW]
+    band = BOLLINGER_DEV * rolling_std(close, BOLLINGER_WINDOW, ddof=0)
+    out["bollinger_upper"] = middle + band
+    out["bollinger_middle"] = middle
+    out["bollinger_lower"] = middle - band
+
+    out["obv"] = running["obv"]
+    out["sma_200_weekly"] = means[WEEKLY_SMA_WINDOW]
+
+    for window in VOLATILITY_WINDOWS:
+        out[f"volatility_{window}d"] = rolling_std(close, window, ddof=1)
+    return out
+
+
+def add_indicators_panel(frames, return_panel=False):
+    """
+    Enrich many raw OHLCV frames ({symbol: df with date/open/high/low/close/volume}) in a few
+    vectorized passes. Returns {symbol: df} with the same columns the per-symbol `ta` pipeline produced.
+    With return_panel=True, returns (enriched, panel) where panel holds the symbols, close panel, lengths
+    and running values, from which indicator_state reads each symbol's state without another pass.
+    """
+    frames = {symbol: df.reset_index(drop=True) for symbol, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return ({}, None) if return_panel else {}
+
+    close, lengths = build_panel(frames, "close")
+    volume, _ = build_panel(frames, "volume")
+    running = running_values(close, volume)
+    computed = compute_panel_indicators(close, volume, running)
+
+    enriched = {}
+    for j, (symbol, df) in enumerate(frames.items()):
+        n = lengths[j]
+        dates = df["date"] if pd.api.types.is_datetime64_any_dtype(df["date"]) else pd.to_datetime(df["date"])
+        columns = {name: values[:n, j] for name, values in computed.items()}
+        columns["adj_close"] = df["close"].to_numpy()
+        columns["market_cap_proxy"] = (df["close"] * df["volume"]).to_numpy()
+        columns["day_of_week"] = (dates.dt.dayofweek + 1).to_numpy()
+        columns["week_of_year"] = dates.dt.isocalendar().week.to_numpy()
+
+        df = df.drop(columns=[c for c in columns if c in df.columns])
+        df = pd.concat([df, pd.DataFrame(columns, index=df.index)], axis=1)
+        df["date"] = dates.dt.date.to_numpy()
+        enriched[symbol] = df
+    if return_panel:
+        return enriched, {"symbols": list(frames), "close": close, "lengths": lengths, "running": running}
+    return enriched
+
+
+def add_indicators(df):
+    """Single-symbol entry point; same engine as add_indicators_panel."""
+    return add_indicators_panel({"_": df})["_"]
+
+
+def compare_with_ta(frame, tolerance=1e-6):
+    """Parity check against the `ta` pipeline the engine replaced. Returns {column: max relative error}."""
+    from ta.trend import SMAIndicator, EMAIndicator, MACD
+    from ta.momentum import RSIIndicator
+    from ta.volume import OnBalanceVolumeIndicator
+    from ta.volatility import BollingerBands
+
+    close, volume = frame["close"], frame["volume"]
+    expected = {}
+    for window in SMA_EMA_WINDOWS:
+        expected[f"sma_{window}"] = SMAIndicator(close, window=window).sma_indicator()
+        expected[f"ema_{window}"] = EMAIndicator(close, window=window).ema_indicator()
+    expected["macd"] = MACD(close).macd_diff()
+    expected["dma"] = close - expected["sma_50"]
+    expected["rsi"] = RSIIndicator(close).rsi()
+    bb = BollingerBands(close)
+    expected["bollinger_upper"] = bb.bollinger_hband()
+    expected["bollinger_middle"] = bb.bollinger_mavg()
+    expected["bollinger_lower"] = bb.bollinger_lband()
+    expected["obv"] = OnBalanceVolumeIndicator(close, volume).on_balance_volume()
+    expected["sma_200_weekly"] = close.rolling(window=WEEKLY_SMA_WINDOW).mean()
+    for window in VOLATILITY_WINDOWS:
+        expected[f"volatility_{window}d"] = close.rolling(window).std()
+
+    actual = add_indicators(frame.copy())
+    errors = {}
+    for name, series in expected.items():
+        a, e = actual[name].to_numpy(dtype=float), series.to_numpy(dtype=float)
+        if not np.array_equal(np.isnan(a), np.isnan(e)):
+            errors[name] = float("inf")
+            continue
+        mask = ~np.isnan(e)
+        scale = np.maximum(np.abs(e[mask]), 1.0)
+        errors[name] = float(np.max(np.abs(a[mask] - e[mask]) / scale)) if mask.any() else 0.0
+
+    failed = {name: err for name, err in errors.items() if err > tolerance}
+    if failed:
+        print(f"❌ Indicator parity failed: {failed}")
+    else:
+        print(f"✅ Indicator parity within {tolerance} on {len(frame)} bars")
+    return errors
+
+
+if __name__ == "__main__":
+    # Parity check on a synthetic random walk: python indicators.py
+    rng = np.random.default_rng(42)
+    bars = 5000
+    dates = pd.bdate_range("2004-01-02", periods=bars)
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    sample = pd.DataFrame({
+        "date": dates, "open": close, "high": close, "low": close, "close": close,
+        "volume": rng.integers(1_000, 5_000_000, bars),
+    })
+    compare_with_ta(sample)
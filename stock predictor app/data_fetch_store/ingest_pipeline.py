@@ -0,0 +1,177 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Pipeline Settings ---
+
+FETCH_WORKERS = 4                                    # threads doing network downloads
+COMPUTE_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # processes computing indicators
+QUEUE_SIZE = 8                                       # batches allowed to wait between two stages
+WRITE_BATCH_SYMBOLS = 50                             # symbols grouped into one COPY by the writer
+# The pipeline may start inside a running thread (a DAG node) while other threads hold pool, psycopg2 or
+# stdio locks; a forked worker would inherit those locks held forever, so workers start fresh interpreters.
+COMPUTE_START_METHOD = "spawn"
+
+_DONE = object()
+
+
+class StageStats:
+    """Thread-safe counters for one pipeline stage: symbols and rows handled, time spent working."""
+
+    def __init__(self, name):
+        self.name = name
+        self.symbols = 0
+        self.rows = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, symbols, rows, seconds):
+        with self._lock:
+            self.symbols += symbols
+            self.rows += rows
+            self.busy += seconds
+
+    def report(self, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        print(f"   {self.name:<8} {self.symbols:>6} symbols ({self.symbols / elapsed:6.1f}/s) "
+              f"{self.rows:>10,} rows ({self.rows / elapsed:9,.0f}/s)  busy {self.busy:7.1f}s")
+
+
+def _count_rows(records):
+    return sum(record.get("rows", 0) for record in records)
+
+
+def run_pipeline(jobs, fetch, compute, write,
+                 fetch_workers=FETCH_WORKERS, compute_workers=COMPUTE_WORKERS,
+                 queue_size=QUEUE_SIZE, write_batch_symbols=WRITE_BATCH_SYMBOLS, on_result=None):
+    """
+    Three overlapping stages joined by bounded queues:
+        fetch(*args) -> payload             threads (network bound)
+        compute(payload) -> [record, ...]   process pool (CPU bound); must be a picklable top-level function
+        write([record, ...]) -> {symbol: status}   one writer thread, several jobs' records per call
+    `jobs` are (symbols, args) pairs like ingest_pool.run_jobs. A record is a dict with at least
+    "symbol" and "rows". A full queue blocks the stage before it, so memory stays bounded.
+    compute_workers <= 1 computes in the calling threads without a process pool.
+    on_result(symbols), when given, is called from the pipeline threads as soon as those symbols have a result.
+    Returns {symbol: (ok, status)} in job order plus {stage: StageStats}.
+    """
+    started = time.monotonic()
+    stats = {name: StageStats(name) for name in ("fetch", "compute", "write")}
+    fetched = queue.Queue(maxsize=queue_size)
+    computed = queue.Queue(maxsize=queue_size)
+    pending = queue.Queue()
+    for job in jobs:
+        pending.put(job)
+
+    results = {}
+    results_lock = threading.Lock()
+
+    def notify(symbols):
+        # A failing callback must not take down the thread that called it: the stages would stall
+        if on_result is None:
+            return
+        try:
+            on_result(symbols)
+        except Exception as e:
+            print(f"⚠️ on_result callback failed for {', '.join(symbols)}: {e}")
+
+    def fail(symbols, error):
+        print(f"⚠️ Failed processing {', '.join(symbols)}: {error}")
+        with results_lock:
+            for symbol in symbols:
+                results[symbol] = (False, f"failed: {error}")
+        notify(symbols)
+
+    def fetch_loop():
+        while True:
+            try:
+                symbols, args = pending.get_nowait()
+            except queue.Empty:
+                return
+            t0 = time.perf_counter()
+            try:
+                payload = fetch(*args)
+            except Exception as e:
+                fail(symbols, e)
+                continue
+            stats["fetch"].record(len(symbols), 0, time.perf_counter() - t0)
+            fetched.put((symbols, payload))
+
+    executor = ProcessPoolExecutor(
+        max_workers=compute_workers, mp_context=multiprocessing.get_context(COMPUTE_START_METHOD),
+    ) if compute_workers > 1 else None
+
+    def compute_loop():
+        while True:
+            item = fetched.get()
+            if item is _DONE:
+                return
+            symbols, payload = item
+            t0 = time.perf_counter()
+            try:
+                records = executor.submit(compute, payload).result() if executor else compute(payload)
+            except Exception as e:
+                fail(symbols, e)
+                continue
+            stats["compute"].record(len(symbols), _count_rows(records), time.perf_counter() - t0)
+            computed.put((symbols, records))
+
+    def write_group(group):
+        symbols = [symbol for job_symbols, _ in group for symbol in job_symbols]
+        records = [record for _, job_records in group for record in job_records]
+        t0 = time.perf_counter()
+        try:
+            statuses = write(records)
+        except Exception as e:
+            fail(symbols, e)
+            return
+        stats["write"].record(len(symbols), _count_rows(records), time.perf_counter() - t0)
+        with results_lock:
+            for symbol in symbols:
+                status = statuses.get(symbol, "failed: no data")
+                results[symbol] = (not status.startswith("failed"), status)
+        notify(symbols)
+
+    def write_loop():
+        group, grouped_symbols = [], 0
+        while True:
+            item = computed.get()
+            if item is _DONE:
+                break
+            group.append(item)
+            grouped_symbols += len(item[0])
+            if grouped_symbols >= write_batch_symbols:
+                write_group(group)
+                group, grouped_symbols = [], 0
+        if group:
+            write_group(group)
+
+    fetchers = [threading.Thread(target=fetch_loop, name=f"fetch-{i}") for i in range(max(1, fetch_workers))]
+    computers = [threading.Thread(target=compute_loop, name=f"compute-{i}") for i in range(max(1, compute_workers))]
+    writer = threading.Thread(target=write_loop, name="write")
+    for thread in fetchers + computers + [writer]:
+        thread.start()
+
+    try:
+        for thread in fetchers:
+            thread.join()
+        for _ in computers:
+            fetched.put(_DONE)
+        for thread in computers:
+            thread.join()
+        computed.put(_DONE)
+        writer.join()
+    finally:
+        if executor:
+            executor.shutdown()
+
+    elapsed = time.monotonic() - started
+    print(f"\n⏱️ Pipeline stages over {elapsed:.1f}s")
+    for stage in stats.values():
+        stage.report(elapsed)
+
+    ordered = [symbol for symbols, _ in jobs for symbol in symbols]
+    return {symbol: results[symbol] for symbol in ordered if symbol in results}, stats
@@ -0,0 +1,103 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+# --- Worker Pool Settings ---
+
+MAX_WORKERS = 8               # concurrent symbols in flight
+REQUESTS_PER_SECOND = 2.0     # sustained request rate allowed against the data provider
+BURST = 4                     # short bursts allowed above the sustained rate
+INDEX_WORKERS = 1             # processes for sector/subsector index builds (--workers N)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting how fast workers may hit the data provider.
+    `rate` tokens are added per second, up to `capacity`; each request takes one.
+    """
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def run_jobs(jobs, worker, max_workers=MAX_WORKERS, processes=False):
+    """
+    Run `worker(*args)` for every (symbols, args) job on a bounded thread pool, or on a process
+    pool with processes=True (worker and args must then be picklable, top-level).
+    The worker returns {symbol: status}; an exception marks every symbol of its job as failed.
+    With max_workers <= 1 the jobs run sequentially in the calling thread.
+    Returns {symbol: (ok, status)} in job order.
+    """
+    results = {}
+
+    def record(symbols, outcome, error=None):
+        for symbol in symbols:
+            if error is not None:
+                results[symbol] = (False, f"failed: {error}")
+            else:
+                status = outcome.get(symbol, "failed: no result") if outcome else "failed: no result"
+                results[symbol] = (not status.startswith("failed"), status)
+
+    if max_workers <= 1:
+        for symbols, args in jobs:
+            try:
+                record(symbols, worker(*args))
+            except Exception as e:
+                print(f"⚠️ Failed processing {', '.join(symbols)}: {e}")
+                record(symbols, None, e)
+        return results
+
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, *args): symbols for symbols, args in jobs}
+        for future in as_completed(futures):
+            symbols = futures[future]
+            try:
+                record(symbols, future.result())
+            except Exception as e:
+                print(f"⚠️ Failed processing {', '.join(symbols)}: {e}")
+                record(symbols, None, e)
+
+    ordered = [symbol for symbols, _ in jobs for symbol in symbols]
+    return {symbol: results[symbol] for symbol in ordered if symbol in results}
+
+
+def parse_workers(description, default=INDEX_WORKERS, argv=None):
+    """`--workers N` from the command line."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--workers", type=int, default=default,
+                        help="worker processes, one entity (sector or subsector) at a time each")
+    return parser.parse_args(argv).workers
+
+
+def report_results(results, started_at=None):
+    """Print a per-symbol summary at the end of a pooled run."""
+    succeeded = [s for s, (ok, _) in results.items() if ok]
+    failed = [(s, status) for s, (ok, status) in results.items() if not ok]
+
+    print("\n📋 Ingestion summary")
+    for symbol, (ok, status) in results.items():
+        print(f"   {'✅' if ok else '❌'} {symbol}: {status}")
+
+    elapsed = f" in {time.monotonic() - started_at:.1f}s" if started_at is not None else ""
+    print(f"🏁 {len(succeeded)} succeeded, {len(failed)} failed{elapsed}")
+    if failed:
+        print("❌ Failed symbols: " + ", ".join(s for s, _ in failed))
+    return succeeded, failed
@@ -1,17 +1,19 @@
 import time
-import yfinance as yf
 import pandas as pd
-import psycopg2
-from psycopg2.extras import execute_values
-from db_params import DB_CONFIG, test_database_connection, create_table, api_key
-from stock_list import SECTOR_STOCKS, MACRO_CODES
-from fredapi import Fred
-from datetime import datetime, timedelta
-
-from ta.trend import SMAIndicator, EMAIndicator, MACD
-from ta.momentum import RSIIndicator
-from ta.volume import OnBalanceVolumeIndicator
-from ta.volatility import BollingerBands
+from db_params import test_database_connection, create_table
+from stock_list import SECTOR_STOCKS
+from ingest_pool import TokenBucket, report_results, REQUESTS_PER_SECOND
+from ingest_pipeline import run_pipeline, FETCH_WORKERS, COMPUTE_WORKERS
+from price_fetch import build_batches, BATCH_LEVEL
+from providers import get_provider, VIX_SYMBOL
+from bar_cache import fetch_history
+from bulk_load import write_stock_records
+from macro_cache import fetch_macro_data
+from macro_tables import create_macro_tables, store_macro_daily, store_vix_daily
+from fundamentals_cache import get_market_data, create_fundamentals_table
+from indicator_state import enrich_with_states, save_states, create_state_table
+from datetime import datetime
+
 
 # --- Mapping Section ---
 
@@ -30,116 +32,68 @@ SYMBOL_IDS = {symbol: idx for idx, symbol in enumerate(ALL_SYMBOLS, 1)}
 
 def fetch_vix_data(start_date="2004-01-01"):
     try:
-        vix = yf.Ticker("^VIX")
-        df = vix.history(start=start_date).reset_index()
-        df = df[["Date", "Close"]].rename(columns={"Date": "date", "Close": "vix_close"})
+        df = get_provider().prices([VIX_SYMBOL], start_date).get(VIX_SYMBOL)
+        if df is None:
+            raise ValueError("No data for ^VIX")
+        df = df[["date", "close"]].rename(columns={"close": "vix_close"})
         df["date"] = pd.to_datetime(df["date"]).dt.date
         return df
     except Exception as e:
         print("Failed to fetch VIX data:", e)
         return pd.DataFrame()
 
-def fetch_macro_data(start_date="2004-01-01", end_date="2025-04-04"):
-    fred = Fred(api_key=api_key)
-    all_macro = []
-    
-    for macro_name, fred_code in MACRO_CODES.items():
-        try:
-            print(f"📈 Fetching {macro_name} ({fred_code})...")
-            series = fred.get_series(fred_code, observation_start=start_date, observation_end=end_date)
-            df = series.reset_index()
-            df.columns = ["date", macro_name]
-            all_macro.append(df)
-        except Exception as e:
-            print(f"⚠️ Error fetching {macro_name}: {e}")
-
-    if all_macro:
-        macro_df = all_macro[0]
-        for df in all_macro[1:]:
-            macro_df = pd.merge(macro_df, df, on="date", how="outer")
-
-        macro_df["date"] = pd.to_datetime(macro_df["date"]).dt.date
-        
-        # 🛠️ Fill logic starts here
-        columns_to_forward_fill = [col for col in macro_df.columns if col != "date" and col != "breakeven_inflation_rate"]
-        
-        macro_df.sort_values("date", inplace=True)
-        macro_df[columns_to_forward_fill] = macro_df[columns_to_forward_fill].ffill()
-
-        return macro_df
-    else:
-        return pd.DataFrame()
-
-
-def fetch_stock_data(symbol, start_date="2004-01-01", retries=3, sleep_sec=2):
-    for attempt in range(retries):
+def fetch_batch(items, end_date, limiter=None):
+    """Pipeline fetch stage: raw bars up to end_date for one batch (one multi-ticker download) plus cached fundamentals."""
+    symbols = [symbol for symbol, _, _ in items]
+    print(f"📈 Fetching batch of {len(symbols)} up to {end_date}: {', '.join(symbols)}")
+    frames = fetch_history(symbols, start_date="2004-01-01", limiter=limiter)
+
+    # Indicators only look back, so cutting before computing gives the same rows as cutting after
+    cutoff = pd.Timestamp(end_date)
+    frames = {symbol: df[pd.to_datetime(df["date"]) <= cutoff] for symbol, df in frames.items()}
+    frames = {symbol: df for symbol, df in frames.items() if not df.empty}
+
+    # Fundamentals come from the cache; only never-seen symbols hit the provider
+    market = get_market_data(list(frames), limiter=limiter) if frames else {}
+    return {"items": items, "frames": frames, "market": market}
+
+
+def compute_batch(payload):
+    """
+    Pipeline compute stage (runs in a worker process): indicators and running state for every
+    symbol of a fetched batch. Returns one record per symbol that can be written.
+    """
+    frames, market = payload["frames"], payload["market"]
+    enriched, states = enrich_with_states(frames)
+
+    records = []
+    for symbol, sector, subsector in payload["items"]:
+        df = enriched.get(symbol)
+        if df is None or symbol not in market:
+            continue
+        record = {"symbol": symbol, "sector": sector, "subsector": subsector, "rows": len(df),
+                  "df": df, "market_data": market[symbol], "state": (df["date"].max(), states[symbol])}
         try:
-            ticker = yf.Ticker(symbol)
-            df = ticker.history(start=start_date)
-            if df.empty:
-                raise ValueError(f"No data for {symbol}")
-            df = df.reset_index()
-            df.columns = df.columns.str.lower()
-            info = ticker.info
-
-            market_data = {
-                "market_cap": info.get("marketCap"),
-                "pe_ratio": info.get("trailingPE"),
-                "forward_pe": info.get("forwardPE"),
-                "price_to_book": info.get("priceToBook"),
-                "country": info.get("country")  # Replaced is_adr with country
-            }
-            break
-        except Exception as e:
-            print(f"⏳ Retry {attempt + 1} for {symbol} due to error: {e}")
-            time.sleep(sleep_sec)
-    else:
-        print(f"❌ Giving up on {symbol} after {retries} retries")
-        return None, None
-
-    try:
-        close = df["close"]
-        volume = df["volume"]
-
-        for window in [5, 20, 50, 125, 200]:
-            df[f"sma_{window}"] = SMAIndicator(close, window=window).sma_indicator()
-            df[f"ema_{window}"] = EMAIndicator(close, window=window).ema_indicator()
-
-        df["macd"] = MACD(close).macd_diff()
-        df["dma"] = close - df["sma_50"]
-        df["rsi"] = RSIIndicator(close).rsi()
+            record["ids"] = resolve_ids(symbol, sector, subsector)
+        except ValueError as e:
+            record["status"] = f"failed: {e}"
+        records.append(record)
+    return records
+
+
+def write_batch(records):
+    """Pipeline write stage: one COPY for all records, then seed their indicator state."""
+    statuses = write_stock_records(records)
+    # Seed the running indicator state so daily updates only advance new bars
+    save_states({
+        record["symbol"]: record["state"] for record in records
+        if statuses[record["symbol"]].startswith("inserted")
+    })
+    return statuses
 
-        bb = BollingerBands(close)
-        df["bollinger_upper"] = bb.bollinger_hband()
-        df["bollinger_middle"] = bb.bollinger_mavg()
-        df["bollinger_lower"] = bb.bollinger_lband()
-
-        df["obv"] = OnBalanceVolumeIndicator(close, volume).on_balance_volume()
-        df["sma_200_weekly"] = close.rolling(window=200 * 5).mean()
-
-        df["adj_close"] = close
-        df["market_cap_proxy"] = df["close"] * df["volume"]
-        df["date"] = pd.to_datetime(df["date"])
-        df["day_of_week"] = df["date"].dt.dayofweek + 1
-        df["week_of_year"] = df["date"].dt.isocalendar().week
-
-        for window in [5, 10, 20, 40]:
-            df[f"volatility_{window}d"] = df["close"].rolling(window).std()
-
-        df["date"] = df["date"].dt.date
-
-        return df, market_data
-
-    except Exception as e:
-        print(f"⚠️ Indicator calc failed for {symbol}: {e}")
-        return None, None
-    
 # --- Data Insert Function ---
 
-def insert_data(symbol, sector, subsector, df, market_data):
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-
+def resolve_ids(symbol, sector, subsector):
     symbol_id = SYMBOL_IDS.get(symbol)
     sector_id = SECTOR_IDS.get(sector)
     subsector_id = SUBSECTOR_IDS.get(subsector)
@@ -150,64 +104,13 @@ def insert_data(symbol, sector, subsector, df, market_data):
         raise ValueError(f"❌ Sector {sector} not found in SECTOR_IDS mapping.")
     if subsector_id is None:
         raise ValueError(f"❌ Subsector {subsector} not found in SUBSECTOR_IDS mapping.")
+    return symbol_id, sector_id, subsector_id
 
-    insert_rows = []
-
-    for _, row in df.iterrows():
-        if pd.isna(row["date"]):
-            continue
-        insert_rows.append((
-            symbol, sector, subsector, row["date"], row.get("day_of_week"), row.get("week_of_year"),
-            market_data.get("country"), symbol_id,  # <-- Changed from is_adr
-            row.get("open"), row.get("high"), row.get("low"), row.get("close"), row.get("volume"), row.get("adj_close"),
-            row.get("sma_5"), row.get("sma_20"), row.get("sma_50"), row.get("sma_125"), row.get("sma_200"), row.get("sma_200_weekly"),
-            row.get("ema_5"), row.get("ema_20"), row.get("ema_50"), row.get("ema_125"), row.get("ema_200"),
-            row.get("macd"), row.get("dma"), row.get("rsi"),
-            row.get("bollinger_upper"), row.get("bollinger_middle"), row.get("bollinger_lower"), row.get("obv"),
-            market_data.get("pe_ratio"), market_data.get("forward_pe"), market_data.get("price_to_book"),
-            row.get("volatility_5d"), row.get("volatility_10d"), row.get("volatility_20d"), row.get("volatility_40d"),
-            market_data.get("market_cap"), row.get("market_cap_proxy"),
-            sector_id, subsector_id,
-            row.get("sector_weight"), row.get("subsector_weight"), row.get("vix_close"), row.get("future_return_1d"),
-            row.get("cpi_inflation"), row.get("core_cpi_inflation"), row.get("pce_inflation"), row.get("core_pce_inflation"),
-            row.get("breakeven_inflation_rate"), row.get("realized_inflation"), row.get("us_10y_bond_rate"),
-            row.get("retail_sales"), row.get("consumer_confidence_index"), row.get("nfp"), row.get("unemployment_rate"),
-            row.get("effective_federal_funds_rate")
-        ))
-
-    if insert_rows:
-        try:
-            execute_values(cur, """
-                INSERT INTO stock_market_table (
-                    symbol, sector, subsector, date, day_of_week, week_of_year, country_of_origin, symbol_id,
-                    open, high, low, close, volume, adj_close,
-                    sma_5, sma_20, sma_50, sma_125, sma_200, sma_200_weekly,
-                    ema_5, ema_20, ema_50, ema_125, ema_200,
-                    macd, dma, rsi,
-                    bollinger_upper, bollinger_middle, bollinger_lower, obv,
-                    pe_ratio, forward_pe, price_to_book,
-                    volatility_5d, volatility_10d, volatility_20d, volatility_40d,
-                    market_cap, market_cap_proxy,
-                    sector_id, subsector_id,
-                    sector_weight, subsector_weight, vix_close, future_return_1d,
-                    cpi_inflation, core_cpi_inflation, pce_inflation, core_pce_inflation,
-                    breakeven_inflation_rate, realized_inflation, us_10y_bond_rate,
-                    retail_sales, consumer_confidence_index, nfp, unemployment_rate,
-                    effective_federal_funds_rate
-                ) VALUES %s
-                ON CONFLICT (symbol, date) DO NOTHING
-            """, insert_rows)
-            conn.commit()
-        except Exception as e:
-            print(f"❌ Failed batch insert {symbol}: {e}")
-            conn.rollback()
-
-    cur.close()
-    conn.close()
 
 # --- Main Driver ---
 
-def main():
+def main(workers=FETCH_WORKERS, requests_per_second=REQUESTS_PER_SECOND, batch_level=BATCH_LEVEL,
+         compute_workers=COMPUTE_WORKERS):
     # --- Change this variable to control cutoff ---
     CUTOFF_DATE = "2025-08-08"   # options: "LATEST" or "YYYY-MM-DD"
                              # Make sure the cutoff is a weekday.
@@ -222,28 +125,27 @@ def main():
             raise ValueError("❌ Invalid date format. Use 'YYYY-MM-DD' or 'LATEST'.")
 
     if test_database_connection():
+        started_at = time.monotonic()
         create_table()
-        macro_df = fetch_macro_data(end_date=end_date)
-        vix_df = fetch_vix_data(start_date="2004-01-01")
-
-        for sector, subsectors in SECTOR_STOCKS.items():
-            for subsector, symbols in subsectors.items():
-                for symbol in symbols:
-                    print(f"📈 Fetching {symbol} ({sector} - {subsector}) up to {end_date}...")
-                    try:
-                        df, market_data = fetch_stock_data(symbol, start_date="2004-01-01")
-                        if df is not None and not df.empty:
-                            # Restrict rows up to chosen cutoff
-                            df = df[df["date"] <= pd.to_datetime(end_date).date()]
-
-                            # Merge with VIX & macro
-                            df = df.merge(vix_df, on="date", how="left")
-                            if not macro_df.empty:
-                                df = df.merge(macro_df, on="date", how="left")
-
-                            insert_data(symbol, sector, subsector, df, market_data)
-                    except Exception as e:
-                        print(f"⚠️ Failed processing {symbol}: {e}")
+        create_fundamentals_table()
+        create_state_table()
+        create_macro_tables()
+
+        # Market-wide series are stored once per date, not on every stock row
+        store_macro_daily(fetch_macro_data(end_date=end_date))
+        store_vix_daily(fetch_vix_data(start_date="2004-01-01"))
+
+        limiter = TokenBucket(rate=requests_per_second)
+        jobs = [
+            ([symbol for symbol, _, _ in items], (items, end_date, limiter))
+            for items in build_batches(batch_level)
+        ]
+
+        print(f"🚀 Loading {len(jobs)} {batch_level} batches: {workers} fetch thread(s) at {requests_per_second} req/s, "
+              f"{compute_workers} compute process(es)")
+        results, _ = run_pipeline(jobs, fetch_batch, compute_batch, write_batch,
+                                  fetch_workers=workers, compute_workers=compute_workers)
+        report_results(results, started_at)
     else:
         print("❌ Database connection failed.")
 
@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from providers import get_provider, cache_root
+from stock_list import MACRO_CODES
+
+# --- Cache Layout ---
+# macro_cache/<FRED code>.parquet   one file per distinct FRED series (date, value)
+# macro_cache/manifest.json         per code: requested start, last observation, day of the last refresh
+
+MACRO_CACHE_DIR = os.getenv("MACRO_CACHE_DIR", os.path.join(os.path.dirname(__file__), "macro_cache"))
+MACRO_WORKERS = 4              # distinct series fetched concurrently
+REVISION_LOOKBACK_DAYS = 93    # re-read the last few monthly prints, FRED revises them
+NO_FFILL_COLUMNS = ["breakeven_inflation_rate"]   # daily series, left with gaps like before
+
+_manifest_lock = threading.Lock()
+
+
+def cache_dir():
+    return cache_root(MACRO_CACHE_DIR)
+
+
+def series_path(code):
+    return os.path.join(cache_dir(), f"{code}.parquet")
+
+
+def read_manifest():
+    path = os.path.join(cache_dir(), "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def update_manifest(code, entry):
+    with _manifest_lock:
+        os.makedirs(cache_dir(), exist_ok=True)
+        manifest = read_manifest()
+        manifest[code] = entry
+        path = os.path.join(cache_dir(), "manifest.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+
+def load_series(code):
+    """Cached observations of one FRED code as a date-indexed Series, or None."""
+    path = series_path(code)
+    if not os.path.exists(path):
+        return None
+    df = pd.read_parquet(path)
+    return pd.Series(df["value"].to_numpy(), index=pd.to_datetime(df["date"]), name=code)
+
+
+def store_series(code, series):
+    os.makedirs(cache_dir(), exist_ok=True)
+    path = series_path(code)
+    df = pd.DataFrame({"date": series.index, "value": series.to_numpy()})
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def refresh_series(code, start_date="2004-01-01", end_date=None):
+    """
+    Bring one FRED code up to date: the first call downloads from start_date, later calls only
+    ask for observations after the cached watermark (minus REVISION_LOOKBACK_DAYS) and at most once a day.
+    Returns the full cached Series; a failed refresh falls back to the cached copy.
+    """
+    today = datetime.today().strftime("%Y-%m-%d")
+    entry = read_manifest().get(code)
+    cached = load_series(code)
+    if cached is None or entry is None or entry["requested_start"] > start_date:
+        cached, entry = None, None
+
+    if entry and entry.get("refreshed_on") == today and (entry.get("requested_end") or today) >= (end_date or today):
+        return cached
+
+    fetch_start = start_date
+    if cached is not None and not cached.empty:
+        fetch_start = (cached.index.max() - timedelta(days=REVISION_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+
+    try:
+        print(f"📈 Fetching {code} from {fetch_start}...")
+        fresh = get_provider().macro_series(code, fetch_start, end_date)
+    except Exception as e:
+        print(f"⚠️ Error fetching {code}: {e}")
+        return cached
+
+    fresh = fresh.dropna()
+    fresh.index = pd.to_datetime(fresh.index)
+    if cached is not None:
+        fresh = pd.concat([cached, fresh])
+    fresh = fresh[~fresh.index.duplicated(keep="last")].sort_index()
+
+    store_series(code, fresh)
+    update_manifest(code, {
+        "requested_start": entry["requested_start"] if entry else start_date,
+        "end": str(fresh.index.max().date()) if not fresh.empty else None,
+        "refreshed_on": today,
+        "requested_end": end_date,
+    })
+    return fresh
+
+
+def fetch_macro_series(codes, start_date="2004-01-01", end_date=None, max_workers=MACRO_WORKERS):
+    """Refresh each distinct code once, concurrently. Returns {code: Series} for codes with data."""
+    codes = list(dict.fromkeys(codes))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        series = dict(zip(codes, executor.map(lambda code: refresh_series(code, start_date, end_date), codes)))
+    return {code: s for code, s in series.items() if s is not None}
+
+
+def build_macro_frame(series_by_code, start_date="2004-01-01", end_date=None, macro_codes=MACRO_CODES):
+    """
+    One column per macro name on the union of observation dates, forward-filled
+    (except NO_FFILL_COLUMNS). Names sharing a FRED code reuse the same cached series.
+    """
+    columns = {name: series_by_code[code] for name, code in macro_codes.items() if code in series_by_code}
+    if not columns:
+        return pd.DataFrame()
+
+    macro_df = pd.DataFrame(columns).sort_index()
+    macro_df = macro_df[macro_df.index >= pd.Timestamp(start_date)]
+    if end_date:
+        macro_df = macro_df[macro_df.index <= pd.Timestamp(end_date)]
+
+    columns_to_forward_fill = [col for col in macro_df.columns if col not in NO_FFILL_COLUMNS]
+    macro_df[columns_to_forward_fill] = macro_df[columns_to_forward_fill].ffill()
+    macro_df = macro_df.rename_axis("date").reset_index()
+    macro_df["date"] = macro_df["date"].dt.date
+    return macro_df
+
+
+def fetch_macro_data(start_date="2004-01-01", end_date=None):
+    """Merged, forward-filled macro frame for [start_date, end_date], served from the series cache."""
+    if end_date is None:
+        end_date = datetime.today().strftime("%Y-%m-%d")
+    series_by_code = fetch_macro_series(MACRO_CODES.values(), start_date=start_date, end_date=end_date)
+    return build_macro_frame(series_by_code, start_date=start_date, end_date=end_date)
@@ -0,0 +1,45 @@
+import os
+import pandas as pd
+from db_params import get_connection
+from bulk_load import copy_upsert
+from stock_list import MACRO_CODES
+
+MACRO_COLUMNS = list(MACRO_CODES)
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema", "macro.schema.sql")
+
+
+def create_macro_tables():
+    """Create vix_daily/macro_daily and stock_market_view, migrating an old denormalized table if needed."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with open(SCHEMA_PATH, "r") as f:
+                cur.execute(f.read())
+        conn.commit()
+
+
+def store_vix_daily(vix_df):
+    """Upsert the VIX closes ({date, vix_close} frame). Returns rows written."""
+    if vix_df is None or vix_df.empty:
+        print("⚠️ No VIX data to store")
+        return 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            written = copy_upsert(cur, "vix_daily", vix_df[["date", "vix_close"]], ["date"], update_columns=["vix_close"])
+        conn.commit()
+    print(f"✅ Stored {written} VIX rows")
+    return written
+
+
+def store_macro_daily(macro_df):
+    """Upsert the merged, forward-filled macro frame, one row per date. Returns rows written."""
+    if macro_df is None or macro_df.empty:
+        print("⚠️ No macro data to store")
+        return 0
+    frame = macro_df.reindex(columns=["date"] + MACRO_COLUMNS)
+    frame = frame[pd.notna(frame["date"])]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            written = copy_upsert(cur, "macro_daily", frame, ["date"], update_columns=MACRO_COLUMNS)
+        conn.commit()
+    print(f"✅ Stored {written} macro rows")
+    return written
@@ -0,0 +1,143 @@
+import sys
+from datetime import date
+from db_params import get_connection, test_database_connection, create_stock_indexes
+
+# --- Partition Settings ---
+# stock_market_table and sector_index_table are range-partitioned by year on date (see their schema
+# files). Loaders and readers keep using the parent table; PostgreSQL routes rows to <table>_<year> and
+# prunes partitions outside a query's date range. Each table also has a <table>_default partition that
+# catches dates without a yearly partition, so an insert never fails for lack of one.
+
+PARTITIONED_TABLES = {                  # table -> unique key, which must contain the partition column
+    "stock_market_table": ["symbol", "date"],
+    "sector_index_table": ["sector", "subsector", "date"],
+}
+FIRST_PARTITION_YEAR = 2004             # history is fetched from 2004-01-01
+PARTITION_YEARS_AHEAD = 1               # the daily run keeps next year's partition ready
+
+
+def partition_name(table, year):
+    return f"{table}_{year}"
+
+
+def default_partition(table):
+    return f"{table}_default"
+
+
+def is_partitioned(cur, table):
+    cur.execute("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+    """, (table,))
+    return cur.fetchone() is not None
+
+
+def existing_partitions(cur, table):
+    cur.execute("""
+        SELECT child.relname
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)
+    """, (table,))
+    return {name for name, in cur.fetchall()}
+
+
+def create_year_partition(cur, table, year):
+    """
+    Create <table>_<year>. A new partition may not overlap rows already parked in the default
+    partition, so those are moved into it while the default partition is detached.
+    """
+    name, default = partition_name(table, year), default_partition(table)
+    start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE date >= %s AND date < %s)", (start, end))
+    if not cur.fetchone()[0]:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {table} {bounds}")
+        return
+
+    cur.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+    cur.execute(f"CREATE TABLE {name} PARTITION OF {table} {bounds}")
+    cur.execute(f"""
+        WITH moved AS (DELETE FROM {default} WHERE date >= %s AND date < %s RETURNING *)
+        INSERT INTO {table} SELECT * FROM moved
+    """, (start, end))
+    print(f"↪️ Moved {cur.rowcount:,} row(s) from {default} into {name}")
+    cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+
+
+def ensure_partitions(through_date=None, tables=PARTITIONED_TABLES):
+    """
+    Create any missing yearly partition from FIRST_PARTITION_YEAR through PARTITION_YEARS_AHEAD years
+    past through_date (today by default). Tables that are not partitioned yet are left alone.
+    Cheap when nothing is missing, so every daily run calls it. Returns the partitions created.
+    """
+    last_year = (through_date or date.today()).year + PARTITION_YEARS_AHEAD
+    created = []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for table in tables:
+                if not is_partitioned(cur, table):
+                    continue
+                existing = existing_partitions(cur, table)
+                for year in range(FIRST_PARTITION_YEAR, last_year + 1):
+                    if partition_name(table, year) not in existing:
+                        create_year_partition(cur, table, year)
+                        created.append(partition_name(table, year))
+        conn.commit()
+    if created:
+        print(f"🧱 Created {len(created)} partition(s): {', '.join(created)}")
+    return created
+
+
+def partition_table(table):
+    """
+    One-time migration of an existing unpartitioned table: the rows are copied into a partitioned table
+    with the same columns, defaults, id sequence and unique key. Holds an exclusive lock while it copies.
+    Returns False when the table is already partitioned.
+    """
+    key = PARTITIONED_TABLES[table]
+    old = f"{table}_unpartitioned"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if is_partitioned(cur, table):
+                print(f"⏭️ {table} is already partitioned.")
+                return False
+
+            cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+            cur.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (date)")
+            cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, date)")
+            cur.execute(f"ALTER TABLE {table} ADD UNIQUE ({', '.join(key)})")
+            cur.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+            cur.execute(f"CREATE TABLE {default_partition(table)} PARTITION OF {table} DEFAULT")
+
+            cur.execute(f"SELECT EXTRACT(YEAR FROM MIN(date))::int FROM {old}")
+            first_year = min(cur.fetchone()[0] or FIRST_PARTITION_YEAR, FIRST_PARTITION_YEAR)
+            for year in range(first_year, date.today().year + PARTITION_YEARS_AHEAD + 1):
+                create_year_partition(cur, table, year)
+
+            cur.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+            print(f"📦 Copied {cur.rowcount:,} row(s) into partitioned {table}")
+            # CASCADE drops stock_market_view along with the old heap; it is recreated below
+            cur.execute(f"DROP TABLE {old} CASCADE")
+        conn.commit()
+
+    if table == "stock_market_table":
+        from macro_tables import create_macro_tables
+        create_macro_tables()
+        create_stock_indexes()
+    return True
+
+
+if __name__ == "__main__":
+    # python partitions.py            create missing yearly partitions
+    # python partitions.py migrate    convert existing unpartitioned tables, then create partitions
+    if test_database_connection():
+        if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+            for table in PARTITIONED_TABLES:
+                partition_table(table)
+        ensure_partitions()
+    else:
+        print("❌ Database connection failed.")
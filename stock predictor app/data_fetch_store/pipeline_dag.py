@@ -0,0 +1,146 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- DAG Settings ---
+# Runs the update pipeline as a graph of per-entity nodes (see cont_entry_point.build_update_dag), so a
+# sector's index build starts as soon as that sector's symbols have landed instead of after the whole
+# fetch. Nodes run on a thread pool: they mostly wait on the network and the database.
+
+DAG_WORKERS = 4        # nodes running at once
+
+
+class Dag:
+    """
+    A dependency graph of named nodes. A task node runs `func(*args)` once every dependency succeeded;
+    the function returns a status string ("failed..." marks a failure) or raises. A signal node does no
+    work of its own: its owner completes it by calling signal(name) while running, which lets part of a
+    long node's output unblock dependents early. Nodes behind a failed dependency are skipped as failed.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self._changed = threading.Condition()
+        self._started_at = None
+
+    def add(self, name, func, *args, deps=()):
+        self._add(name, {"func": func, "args": args, "deps": list(deps), "owner": None})
+
+    def add_signal(self, name, owner):
+        self._add(name, {"func": None, "args": (), "deps": [], "owner": owner})
+
+    def _add(self, name, node):
+        if name in self.nodes:
+            raise ValueError(f"❌ Duplicate DAG node {name}")
+        node.update(state="pending", ok=None, status=None, started=None, finished=None)
+        self.nodes[name] = node
+
+    def signal(self, name, ok=True, status="signalled"):
+        """Complete a signal node; called from its owner's thread. Later calls are ignored."""
+        with self._changed:
+            node = self.nodes[name]
+            if node["state"] != "done":
+                owner = self.nodes[node["owner"]]
+                self._finish(name, ok, status, started=owner["started"])
+
+    def _finish(self, name, ok, status, started=None):
+        """Record a node's outcome. Caller holds self._changed."""
+        node = self.nodes[name]
+        node.update(state="done", ok=ok, status=status, finished=time.monotonic())
+        node["started"] = started if started is not None else node["started"] or node["finished"]
+        # A signal its owner never sent will not come any more
+        for other, waiting in self.nodes.items():
+            if waiting["owner"] == name and waiting["state"] != "done":
+                self._finish(other, False, f"failed: never signalled by {name}", started=node["started"])
+        self._changed.notify_all()
+
+    def _execute(self, name):
+        node = self.nodes[name]
+        with self._changed:
+            node["started"] = time.monotonic()
+        try:
+            status = node["func"](*node["args"]) or "done"
+        except Exception as e:
+            print(f"⚠️ DAG node {name} failed: {e}")
+            status = f"failed: {e}"
+        with self._changed:
+            self._finish(name, not status.startswith("failed"), status)
+
+    def _validate(self):
+        for name, node in self.nodes.items():
+            for dep in node["deps"] + ([node["owner"]] if node["owner"] else []):
+                if dep not in self.nodes:
+                    raise ValueError(f"❌ DAG node {name} depends on unknown node {dep}")
+        self.topological_order()
+
+    def topological_order(self):
+        order, visiting, seen = [], set(), set()
+
+        def visit(name):
+            if name in seen:
+                return
+            if name in visiting:
+                raise ValueError(f"❌ DAG cycle through {name}")
+            visiting.add(name)
+            for dep in self.nodes[name]["deps"]:
+                visit(dep)
+            visiting.discard(name)
+            seen.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def run(self, max_workers=DAG_WORKERS):
+        """Run every node as soon as its dependencies allow. Returns {name: (ok, status)} in insertion order."""
+        self._validate()
+        self._started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor, self._changed:
+            while any(node["state"] != "done" for node in self.nodes.values()):
+                progressed = False
+                for name, node in self.nodes.items():
+                    if node["state"] != "pending" or node["func"] is None:
+                        continue
+                    deps = [self.nodes[dep] for dep in node["deps"]]
+                    failed = [dep for dep in node["deps"] if self.nodes[dep]["ok"] is False]
+                    if failed:
+                        self._finish(name, False, f"failed: skipped after {failed[0]} failed")
+                        progressed = True
+                    elif all(dep["state"] == "done" for dep in deps):
+                        node["state"] = "running"
+                        executor.submit(self._execute, name)
+                if not progressed:
+                    self._changed.wait()
+        return {name: (node["ok"], node["status"]) for name, node in self.nodes.items()}
+
+    def critical_path(self):
+        """The dependency chain with the largest summed node time, and that time."""
+        longest, previous = {}, {}
+        for name in self.topological_order():
+            node = self.nodes[name]
+            duration = (node["finished"] or 0) - (node["started"] or node["finished"] or 0)
+            best = max(node["deps"], key=lambda dep: longest[dep], default=None)
+            longest[name] = duration + (longest[best] if best else 0)
+            previous[name] = best
+        if not longest:
+            return [], 0.0
+        name = max(longest, key=longest.get)
+        total, path = longest[name], []
+        while name:
+            path.append(name)
+            name = previous[name]
+        return path[::-1], total
+
+    def report(self):
+        """Print per-node timings (offset from the run start and duration) and the critical path."""
+        start = self._started_at or 0
+        print("\n⏱️ Pipeline DAG timings")
+        print(f"   {'node':<48}{'start':>8}{'time':>9}  status")
+        for name, node in sorted(self.nodes.items(), key=lambda item: item[1]["started"] or 0):
+            began = (node["started"] or start) - start
+            took = (node["finished"] or start) - (node["started"] or node["finished"] or start)
+            print(f"   {'✅' if node['ok'] else '❌'} {name:<45}{began:>7.1f}s{took:>8.1f}s  {node['status']}")
+        path, total = self.critical_path()
+        wall = max((node["finished"] or start for node in self.nodes.values()), default=start) - start
+        print(f"🧭 Critical path ({total:.1f}s of {wall:.1f}s wall): {' → '.join(path)}")
@@ -0,0 +1,51 @@
+import time
+from stock_list import SECTOR_STOCKS
+from providers import get_provider
+
+# --- Batch Settings ---
+
+BATCH_LEVEL = "subsector"   # "subsector" or "sector": how many tickers go into one download request
+
+
+def build_batches(level=BATCH_LEVEL):
+    """Group (symbol, sector, subsector) items into one batch per subsector or per sector."""
+    batches = []
+    for sector, subsectors in SECTOR_STOCKS.items():
+        if level == "sector":
+            batches.append([(symbol, sector, subsector) for subsector, symbols in subsectors.items() for symbol in symbols])
+        else:
+            for subsector, symbols in subsectors.items():
+                batches.append([(symbol, sector, subsector) for symbol in symbols])
+    return [batch for batch in batches if batch]
+
+
+def download_history(symbols, start_date="2004-01-01", end_date=None, retries=3, sleep_sec=2, limiter=None):
+    """
+    Download OHLCV for many symbols in one multi-ticker provider request, split per symbol.
+    Symbols missing from a response are retried together, up to `retries` attempts.
+    Returns {symbol: DataFrame}; symbols that never came back are left out.
+    """
+    frames = {}
+    pending = list(dict.fromkeys(symbols))
+
+    for attempt in range(retries):
+        if not pending:
+            break
+        try:
+            if limiter:
+                limiter.acquire()
+            frames.update(get_provider().prices(pending, start_date, end_date))
+        except Exception as e:
+            print(f"⏳ Retry {attempt + 1} for batch of {len(pending)} due to error: {e}")
+            time.sleep(sleep_sec)
+            continue
+
+        missing = [s for s in pending if s not in frames]
+        if missing and attempt < retries - 1:
+            print(f"⏳ Retry {attempt + 1} for {len(missing)} missing symbol(s): {', '.join(missing)}")
+            time.sleep(sleep_sec)
+        pending = missing
+
+    if pending:
+        print(f"❌ Giving up on {', '.join(pending)} after {retries} retries")
+    return frames
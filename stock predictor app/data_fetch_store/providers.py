@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import random
+import zlib
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from fredapi import Fred
+from stock_list import SECTOR_STOCKS, MACRO_CODES
+
+# --- Provider Settings ---
+# MARKET_DATA_PROVIDER=live   Yahoo Finance prices/fundamentals + FRED macro series (default)
+# MARKET_DATA_PROVIDER=local  recorded or synthetic data read from LOCAL_DATA_DIR, no network at all
+
+MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "live")
+LOCAL_DATA_DIR = os.getenv("LOCAL_DATA_DIR", os.path.join(os.path.dirname(__file__), "local_data"))
+PROVIDER_LATENCY_MS = float(os.getenv("PROVIDER_LATENCY_MS", "0"))   # simulated round-trip per request
+PROVIDER_JITTER_MS = float(os.getenv("PROVIDER_JITTER_MS", "0"))     # extra uniform random delay
+
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume", "dividends", "stock splits"]
+VIX_SYMBOL = "^VIX"
+
+
+def split_by_symbol(wide, symbols):
+    """Split a wide multi-ticker download into {symbol: frame} shaped like Ticker.history().reset_index()."""
+    frames = {}
+    if wide is None or wide.empty:
+        return frames
+
+    if not isinstance(wide.columns, pd.MultiIndex):
+        # A single ticker comes back without the ticker level
+        wide = pd.concat({symbols[0]: wide}, axis=1)
+
+    available = set(wide.columns.get_level_values(0))
+    for symbol in symbols:
+        if symbol not in available:
+            continue
+        df = wide[symbol].dropna(how="all")
+        if "Close" in df.columns:
+            df = df.dropna(subset=["Close"])
+        if df.empty:
+            continue
+        df = df.reset_index()
+        df.columns = df.columns.str.lower()
+        df = df.rename(columns={"index": "date", "datetime": "date"})
+        frames[symbol] = df[["date"] + [c for c in PRICE_COLUMNS if c in df.columns]].reset_index(drop=True)
+    return frames
+
+
+class MarketDataProvider(ABC):
+    """
+    Everything the ingestion path asks the outside world for. One call = one provider request.
+      prices(symbols, start_date, end_date)   -> {symbol: df[date, open, high, low, close, volume, dividends, stock splits]}
+      info(symbol)                            -> Ticker.info-style dict (marketCap, trailingPE, ...)
+      macro_series(code, start_date, end_date) -> date-indexed Series of one FRED code
+    Symbols the provider has no data for are left out of prices(); the other calls raise.
+    A provider missing any of the three fails when it is instantiated, not in the middle of a run.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def prices(self, symbols, start_date, end_date=None):
+        ...
+
+    @abstractmethod
+    def info(self, symbol):
+        ...
+
+    @abstractmethod
+    def macro_series(self, code, start_date, end_date=None):
+        ...
+
+
+class LiveProvider(MarketDataProvider):
+    """Yahoo Finance for prices and fundamentals, FRED for macro series."""
+
+    name = "live"
+
+    def __init__(self, fred_api_key=None):
+        self.fred_api_key = fred_api_key
+
+    def prices(self, symbols, start_date, end_date=None):
+        symbols = list(symbols)
+        wide = yf.download(
+            symbols, start=start_date, end=end_date,
+            group_by="ticker", auto_adjust=True, actions=True,
+            threads=False, progress=False
+        )
+        return split_by_symbol(wide, symbols)
+
+    def info(self, symbol):
+        return yf.Ticker(symbol).info
+
+    def macro_series(self, code, start_date, end_date=None):
+        if self.fred_api_key is None:
+            from db_params import api_key
+            self.fred_api_key = api_key
+        return Fred(api_key=self.fred_api_key).get_series(code, observation_start=start_date, observation_end=end_date)
+
+
+class LocalProvider(MarketDataProvider):
+    """
+    Serves recorded or synthetic data from disk, with a configurable delay per request:
+        <root>/prices/<SYMBOL>.parquet   <root>/info/<SYMBOL>.json   <root>/macro/<CODE>.parquet
+    Fill the directory with generate_dataset() (synthetic) or record_dataset() (captured from live).
+    """
+
+    name = "local"
+
+    def __init__(self, root=LOCAL_DATA_DIR, latency_ms=PROVIDER_LATENCY_MS, jitter_ms=PROVIDER_JITTER_MS):
+        self.root = root
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def prices(self, symbols, start_date, end_date=None):
+        self._request()
+        frames = {}
+        for symbol in symbols:
+            path = os.path.join(self.root, "prices", f"{symbol}.parquet")
+            if not os.path.exists(path):
+                continue
+            df = pd.read_parquet(path)
+            mask = df["date"] >= pd.Timestamp(start_date)
+            if end_date:
+                mask &= df["date"] < pd.Timestamp(end_date)
+            df = df[mask].reset_index(drop=True)
+            if not df.empty:
+                frames[symbol] = df
+        return frames
+
+    def info(self, symbol):
+        self._request()
+        path = os.path.join(self.root, "info", f"{symbol}.json")
+        if not os.path.exists(path):
+            raise ValueError(f"No recorded info for {symbol}")
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def macro_series(self, code, start_date, end_date=None):
+        self._request()
+        path = os.path.join(self.root, "macro", f"{code}.parquet")
+        if not os.path.exists(path):
+            raise ValueError(f"No recorded series for {code}")
+        df = pd.read_parquet(path)
+        series = pd.Series(df["value"].to_numpy(), index=pd.to_datetime(df["date"]), name=code)
+        series = series[series.index >= pd.Timestamp(start_date)]
+        if end_date:
+            series = series[series.index <= pd.Timestamp(end_date)]
+        return series
+
+
+# --- Active Provider ---
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """The process-wide provider picked by MARKET_DATA_PROVIDER, unless set_provider() replaced it."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = LocalProvider() if MARKET_DATA_PROVIDER == "local" else LiveProvider()
+        return _provider
+
+
+def set_provider(provider):
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+
+def cache_root(base):
+    """On-disk caches keep live data in `base` and any other provider's data in base/<provider name>."""
+    name = get_provider().name
+    return base if name == "live" else os.path.join(base, name)
+
+
+# --- Local Datasets ---
+
+def all_symbols():
+    return sorted({symbol for subsectors in SECTOR_STOCKS.values() for symbols in subsectors.values() for symbol in symbols})
+
+
+def synthetic_bars(symbol, start_date, end_date, seed=0):
+    """Deterministic geometric random walk for one symbol on business days."""
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()) + seed)
+    dates = pd.bdate_range(start_date, end_date)
+    close = rng.uniform(10, 300) * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(dates))))
+    spread = np.abs(rng.normal(0, 0.01, len(dates))) * close
+    return pd.DataFrame({
+        "date": dates,
+        "open": close * (1 + rng.normal(0, 0.005, len(dates))),
+        "high": close + spread,
+        "low": close - spread,
+        "close": close,
+        "volume": rng.integers(100_000, 20_000_000, len(dates)).astype(float),
+        "dividends": 0.0,
+        "stock splits": 0.0,
+    })
+
+
+def generate_dataset(root=LOCAL_DATA_DIR, symbols=None, years=20, end_date=None, seed=0):
+    """
+    Write a synthetic dataset for LocalProvider: `years` of business-day bars per symbol
+    (all stock_list symbols plus ^VIX by default), fundamentals, and every FRED code in MACRO_CODES.
+    """
+    symbols = list(symbols) if symbols is not None else all_symbols()
+    end = pd.Timestamp(end_date) if end_date else pd.Timestamp.today().normalize()
+    start = end - pd.DateOffset(years=years)
+    for sub in ("prices", "info", "macro"):
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    for symbol in symbols + [VIX_SYMBOL]:
+        synthetic_bars(symbol, start, end, seed).to_parquet(os.path.join(root, "prices", f"{symbol}.parquet"), index=False)
+
+    for symbol in symbols:
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()) + seed + 1)
+        info = {
+            "marketCap": int(rng.uniform(1e9, 2e12)),
+            "trailingPE": float(rng.uniform(5, 60)),
+            "forwardPE": float(rng.uniform(5, 50)),
+            "priceToBook": float(rng.uniform(0.5, 20)),
+            "country": "United States",
+        }
+        with open(os.path.join(root, "info", f"{symbol}.json"), "w") as f:
+            json.dump(info, f)
+
+    for code in dict.fromkeys(MACRO_CODES.values()):
+        rng = np.random.default_rng(zlib.crc32(code.encode()) + seed)
+        dates = pd.bdate_range(start, end) if code == "T10YIE" else pd.date_range(start, end, freq="MS")
+        values = 100 + np.cumsum(rng.normal(0, 0.5, len(dates)))
+        pd.DataFrame({"date": dates, "value": values}).to_parquet(os.path.join(root, "macro", f"{code}.parquet"), index=False)
+
+    print(f"✅ Synthetic dataset: {len(symbols)} symbols x {years} years in {root}")
+    return root
+
+
+def record_dataset(root=LOCAL_DATA_DIR, symbols=None, start_date="2004-01-01", source=None):
+    """Capture live prices, fundamentals and macro series to disk so runs can be replayed offline."""
+    source = source or LiveProvider()
+    symbols = list(symbols) if symbols is not None else all_symbols()
+    for sub in ("prices", "info", "macro"):
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    for symbol, df in source.prices(symbols + [VIX_SYMBOL], start_date).items():
+        df = df.assign(date=pd.to_datetime(df["date"]).dt.tz_localize(None))
+        df.to_parquet(os.path.join(root, "prices", f"{symbol}.parquet"), index=False)
+    for symbol in symbols:
+        try:
+            info = source.info(symbol)
+        except Exception as e:
+            print(f"⚠️ No info recorded for {symbol}: {e}")
+            continue
+        with open(os.path.join(root, "info", f"{symbol}.json"), "w") as f:
+            json.dump({key: info.get(key) for key in ("marketCap", "trailingPE", "forwardPE", "priceToBook", "country")}, f)
+    for code in dict.fromkeys(MACRO_CODES.values()):
+        series = source.macro_series(code, start_date)
+        pd.DataFrame({"date": series.index, "value": series.to_numpy()}).to_parquet(
+            os.path.join(root, "macro", f"{code}.parquet"), index=False)
+
+    print(f"✅ Recorded {len(symbols)} symbols from {start_date} in {root}")
+    return root
+
+
+if __name__ == "__main__":
+    # python providers.py generate [years]   |   python providers.py record
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "record":
+        record_dataset()
+    else:
+        generate_dataset(years=int(sys.argv[2]) if len(sys.argv) > 2 else 20)
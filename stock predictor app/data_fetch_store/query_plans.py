@@ -0,0 +1,241 @@
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from db_params import get_connection, test_database_connection, create_stock_indexes, STOCK_INDEXES_PATH
+from company_weights import symbol_mapping
+
+# --- Query Plan Settings ---
+# Captures EXPLAIN (ANALYZE, BUFFERS) of the hot stock_market_table queries without the indexes of
+# schema/company_indexes.sql (dropped inside a transaction that is rolled back) and with them, so every
+# index is justified by before/after timings and plans. The "before" pass holds an exclusive lock on
+# stock_market_table while it runs, so run it off-hours.
+
+PLAN_RUNS = 3          # executions per query and pass; the median execution time is reported
+RECENT_DAYS = 30       # size of the "daily update" date window
+PLAN_REPORT = os.getenv("PLAN_REPORT", os.path.join(os.path.dirname(__file__), "query_plans.json"))
+
+# name -> query as the pipeline and training code issue it, with sample parameters from sample_params().
+# Keep in step with the code: index_builder.load_index_source, upd_index_sector_calc.get_stock_data (per
+# sector and for the market), upd_index_subsector_calc.process_subsector, company_weights.update_weights
+# (its SELECT part; EXPLAIN ANALYZE would run the UPDATE) and the sector/subsector training fetches.
+HOT_QUERIES = {
+    "index_source": """
+        SELECT symbol, sector, subsector, date, close, market_cap, market_cap_proxy, volume, future_return_1d,
+               0.4 * market_cap + 0.6 * market_cap_proxy AS blended_cap
+        FROM stock_market_table
+        WHERE close IS NOT NULL AND market_cap_proxy IS NOT NULL AND date <= %(last_date)s
+        ORDER BY date
+    """,
+    "sector_update_rows": """
+        SELECT symbol, date, close, market_cap_proxy, volume
+        FROM stock_market_table
+        WHERE date >= %(recent)s AND close IS NOT NULL AND market_cap_proxy IS NOT NULL
+          AND sector = %(sector)s AND date <= %(last_date)s
+        ORDER BY date
+    """,
+    "market_update_rows": """
+        SELECT symbol, date, close, market_cap_proxy, volume
+        FROM stock_market_table
+        WHERE date >= %(recent)s AND close IS NOT NULL AND market_cap_proxy IS NOT NULL
+          AND date <= %(last_date)s
+        ORDER BY date
+    """,
+    "subsector_update_rows": """
+        SELECT symbol, date, close, market_cap_proxy, volume
+        FROM stock_market_table
+        WHERE subsector = %(subsector)s AND close IS NOT NULL AND market_cap_proxy IS NOT NULL AND date >= %(recent)s
+        ORDER BY date
+    """,
+    "subsector_caps": """
+        SELECT date, SUM(0.3 * market_cap + 0.7 * market_cap_proxy)
+        FROM stock_market_table
+        WHERE subsector = %(subsector)s AND date > %(recent)s
+        GROUP BY date
+    """,
+    "weight_caps": """
+        SELECT id, date,
+               cap / NULLIF(SUM(cap) OVER (PARTITION BY date, sector), 0) AS sector_weight,
+               cap / NULLIF(SUM(cap) OVER (PARTITION BY date, sector, subsector), 0) AS subsector_weight
+        FROM (
+            SELECT s.id, s.date, m.sector, m.subsector,
+                   0.3 * COALESCE(s.market_cap, 0) + 0.7 * COALESCE(s.market_cap_proxy, 0) AS cap
+            FROM stock_market_table s
+            JOIN unnest(%(weight_symbols)s::text[], %(weight_sectors)s::text[], %(weight_subsectors)s::text[])
+                 AS m(symbol, sector, subsector)
+              ON m.symbol = s.symbol
+            WHERE (s.market_cap_proxy IS NOT NULL OR s.market_cap IS NOT NULL) AND s.date >= %(recent)s
+        ) caps
+    """,
+    "sector_training": """
+        SELECT date, sector, symbol, open, high, low, close, volume, adj_close, rsi, pe_ratio, market_cap
+        FROM stock_market_table
+        WHERE sector_id = %(sector_id)s AND date IS NOT NULL
+    """,
+    "sector_name_by_id": """
+        SELECT sector FROM stock_market_table WHERE sector_id = %(sector_id)s LIMIT 1
+    """,
+    "subsector_training": """
+        SELECT *
+        FROM stock_market_view
+        WHERE subsector_id = %(subsector_id)s AND future_return_1d IS NOT NULL
+        ORDER BY date
+    """,
+    "subsector_listing": """
+        SELECT DISTINCT subsector_id, subsector
+        FROM stock_market_table
+        WHERE subsector_id IS NOT NULL AND subsector IS NOT NULL
+        ORDER BY subsector_id
+    """,
+}
+
+
+def shipped_indexes():
+    """Index names created by schema/company_indexes.sql."""
+    with open(STOCK_INDEXES_PATH, "r") as f:
+        return re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", f.read())
+
+
+def sample_params(cur):
+    """Parameters for HOT_QUERIES taken from the largest sector/subsector in the table."""
+    cur.execute("""
+        SELECT sector, subsector, sector_id, subsector_id, MAX(date)
+        FROM stock_market_table
+        WHERE sector IS NOT NULL AND subsector IS NOT NULL
+        GROUP BY sector, subsector, sector_id, subsector_id
+        ORDER BY COUNT(*) DESC
+        LIMIT 1
+    """)
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError("❌ stock_market_table is empty, nothing to explain.")
+    sector, subsector, sector_id, subsector_id, last_date = row
+    symbols, sectors, subsectors = symbol_mapping([sector])
+    return {
+        "sector": sector, "subsector": subsector, "sector_id": sector_id, "subsector_id": subsector_id,
+        "last_date": last_date, "recent": last_date - timedelta(days=RECENT_DAYS),
+        "weight_symbols": symbols, "weight_sectors": sectors, "weight_subsectors": subsectors,
+    }
+
+
+def plan_nodes(node):
+    """Node types of a JSON plan, with the relation or index each scan reads."""
+    label = node["Node Type"]
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    elif "Relation Name" in node:
+        label += f" on {node['Relation Name']}"
+    return [label] + [child for sub in node.get("Plans", []) for child in plan_nodes(sub)]
+
+
+def explain(cur, query, params, runs=PLAN_RUNS):
+    """Median EXPLAIN ANALYZE figures of `runs` executions, plus the plan of the median run."""
+    plans = []
+    for _ in range(runs):
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+        plans.append(cur.fetchone()[0][0])
+    plans.sort(key=lambda p: p["Execution Time"])
+    median = plans[len(plans) // 2]
+    root = median["Plan"]
+    return {
+        "execution_ms": round(statistics.median(p["Execution Time"] for p in plans), 3),
+        "planning_ms": round(median["Planning Time"], 3),
+        "rows": root.get("Actual Rows"),
+        "shared_hit": root.get("Shared Hit Blocks"),
+        "shared_read": root.get("Shared Read Blocks"),
+        "nodes": plan_nodes(root),
+        "plan": median,
+    }
+
+
+def capture(queries, params, runs=PLAN_RUNS, with_indexes=True):
+    """{name: explain result} for every query, with or without the shipped indexes."""
+    results = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if not with_indexes:
+                for name in shipped_indexes():
+                    cur.execute(f"DROP INDEX IF EXISTS {name}")
+            for name, query in queries.items():
+                results[name] = explain(cur, query, params, runs)
+        # Nothing measured here is kept: the dropped indexes come back with the rollback
+        conn.rollback()
+    return results
+
+
+def table_stats():
+    """Index sizes and the physical order correlation of date (what makes the BRIN index selective)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # A partitioned index has no storage of its own: add up the partition indexes under it
+            cur.execute("""
+                SELECT i.relname, SUM(pg_relation_size(tree.relid))
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                CROSS JOIN LATERAL pg_partition_tree(i.oid) tree
+                WHERE x.indrelid = 'stock_market_table'::regclass
+                GROUP BY i.relname
+                ORDER BY i.relname
+            """)
+            sizes = {name: size for name, size in cur.fetchall()}
+            cur.execute("""
+                SELECT correlation FROM pg_stats
+                WHERE tablename = 'stock_market_table' AND attname = 'date'
+            """)
+            row = cur.fetchone()
+    return {"index_bytes": sizes, "date_correlation": row[0] if row else None}
+
+
+def report(before, after, stats, runs=PLAN_RUNS):
+    print(f"\n📊 Hot queries, median of {runs} runs (ms)")
+    print(f"   {'query':<26}{'before':>11}{'after':>11}{'speedup':>9}  plan after")
+    for name in after:
+        b, a = before[name]["execution_ms"], after[name]["execution_ms"]
+        speedup = f"{b / a:.1f}x" if a else "-"
+        print(f"   {name:<26}{b:>11.2f}{a:>11.2f}{speedup:>9}  {' > '.join(after[name]['nodes'][:3])}")
+    print("\n📦 Index sizes")
+    for name, size in stats["index_bytes"].items():
+        print(f"   {name:<32}{size / 1024 ** 2:>10.1f} MB")
+    if stats["date_correlation"] is not None:
+        print(f"🧭 date correlation with physical order: {stats['date_correlation']:.3f} (BRIN needs it near 1)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE the hot stock_market_table queries before/after the shipped indexes.")
+    parser.add_argument("--runs", type=int, default=PLAN_RUNS, help="executions per query and pass")
+    parser.add_argument("--queries", default=",".join(HOT_QUERIES), help="comma-separated subset of " + ",".join(HOT_QUERIES))
+    parser.add_argument("--output", default=PLAN_REPORT, help="JSON report with the full plans")
+    args = parser.parse_args(argv)
+
+    if not test_database_connection():
+        print("❌ Database connection failed.")
+        return 1
+    queries = {name: HOT_QUERIES[name] for name in args.queries.split(",") if name in HOT_QUERIES}
+
+    create_stock_indexes()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE stock_market_table")
+            params = sample_params(cur)
+    print(f"🔎 Sample: sector {params['sector']}, subsector {params['subsector']}, last date {params['last_date']}")
+
+    before = capture(queries, params, args.runs, with_indexes=False)
+    after = capture(queries, params, args.runs, with_indexes=True)
+    stats = table_stats()
+    report(before, after, stats, args.runs)
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "params": {k: v for k, v in params.items() if not k.startswith("weight_")},
+            "before": before, "after": after, "stats": stats,
+        }, f, indent=1, default=str)
+    print(f"📝 Full plans written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
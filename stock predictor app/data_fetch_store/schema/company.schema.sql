@@ -1,7 +1,10 @@
-DROP TABLE IF EXISTS stock_market_table;
+-- CASCADE also drops stock_market_view; create_macro_tables() recreates it.
+DROP TABLE IF EXISTS stock_market_table CASCADE;
 
+-- Range-partitioned by year on date: partitions.ensure_partitions() creates stock_market_table_<year>
+-- through next year (create_table and every daily run call it); dates outside them land in the default partition.
 CREATE TABLE stock_market_table (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     symbol TEXT NOT NULL,
     symbol_id INT NOT NULL,
     sector TEXT,
@@ -53,22 +56,13 @@ CREATE TABLE stock_market_table (
     market_cap_proxy FLOAT,
     sector_weight FLOAT,
     subsector_weight FLOAT,
-    vix_close FLOAT,
     future_return_1d FLOAT,
 
-    --Macro Federal Information.
-    cpi_inflation FLOAT,
-    core_cpi_inflation FLOAT,
-    pce_inflation FLOAT,
-    core_pce_inflation FLOAT,
-    breakeven_inflation_rate FLOAT,
-    realized_inflation FLOAT,
-    us_10y_bond_rate FLOAT,
-    retail_sales FLOAT,
-    consumer_confidence_index FLOAT,
-    nfp FLOAT,
-    unemployment_rate FLOAT,
-    effective_federal_funds_rate FLOAT,
+    -- VIX and FRED macro series live in vix_daily / macro_daily (schema/macro.schema.sql)
 
+    -- Keys of a partitioned table must contain the partition column
+    PRIMARY KEY (id, date),
     UNIQUE(symbol, date)
-);
+) PARTITION BY RANGE (date);
+
+CREATE TABLE stock_market_table_default PARTITION OF stock_market_table DEFAULT;
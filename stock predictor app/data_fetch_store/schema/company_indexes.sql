@@ -0,0 +1,32 @@
+-- Secondary indexes on stock_market_table for the hot read paths. UNIQUE(symbol, date) already serves
+-- per-symbol reads (watermarks, company training, weight updates). Idempotent, so it also upgrades
+-- existing databases. query_plans.py captures EXPLAIN ANALYZE of each hot query with and without them.
+
+-- Sector index updater: WHERE sector = ? AND date >= ? AND date <= ? ORDER BY date, reading only
+-- symbol/close/market_cap_proxy/volume. Replaces stock_sector_date_idx, whose wider INCLUDE list served
+-- the per-sector full rebuild that index_builder's single scan replaced.
+DROP INDEX IF EXISTS stock_sector_date_idx;
+CREATE INDEX IF NOT EXISTS stock_sector_date_update_idx
+    ON stock_market_table (sector, date)
+    INCLUDE (symbol, close, market_cap_proxy, volume);
+
+-- Subsector index updater: WHERE subsector = ? AND date >= ? ORDER BY date, and the cap sums GROUP BY date
+CREATE INDEX IF NOT EXISTS stock_subsector_date_idx
+    ON stock_market_table (subsector, date)
+    INCLUDE (symbol, close, market_cap, market_cap_proxy, volume);
+
+-- Sector training fetch: WHERE sector_id = ?, plus the sector-name lookup by sector_id (index-only)
+CREATE INDEX IF NOT EXISTS stock_sector_id_date_idx
+    ON stock_market_table (sector_id, date)
+    INCLUDE (sector);
+
+-- Subsector training fetch: WHERE subsector_id = ? ORDER BY date, plus the id/name listing (index-only)
+CREATE INDEX IF NOT EXISTS stock_subsector_id_date_idx
+    ON stock_market_table (subsector_id, date)
+    INCLUDE (subsector);
+
+-- Date range scans across all symbols: the daily market index update, the full index source with a
+-- cutoff, and weight updates from a start date. BRIN stays a few pages in size; it pays off once rows
+-- are appended in date order by the daily run.
+CREATE INDEX IF NOT EXISTS stock_date_brin_idx
+    ON stock_market_table USING BRIN (date);
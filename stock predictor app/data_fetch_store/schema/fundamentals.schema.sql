@@ -0,0 +1,12 @@
+-- Cached Ticker.info fundamentals, one row per symbol and field.
+-- Each field carries its own fetch time so it can expire on its own TTL.
+
+CREATE TABLE IF NOT EXISTS fundamentals_cache (
+    symbol TEXT NOT NULL,
+    field TEXT NOT NULL,                   -- market_cap, pe_ratio, forward_pe, price_to_book, country
+    value_num FLOAT,                       -- numeric fields
+    value_text TEXT,                       -- text fields (country)
+    fetched_at TIMESTAMP NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (symbol, field)
+);
@@ -0,0 +1,19 @@
+-- Functions used by the SQL index engine (index_sql.py). Requires PostgreSQL 12+ for CREATE OR REPLACE AGGREGATE.
+
+-- One step of an adjust=False EMA, same as pandas .ewm(span, adjust=False).mean(): the first value seeds it.
+CREATE OR REPLACE FUNCTION index_ema_step(state DOUBLE PRECISION, value DOUBLE PRECISION, alpha DOUBLE PRECISION)
+RETURNS DOUBLE PRECISION
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT CASE
+        WHEN state IS NULL THEN value
+        WHEN value IS NULL THEN state
+        ELSE (1 - alpha) * state + alpha * value
+    END
+$$;
+
+-- index_ema(value, alpha) OVER (PARTITION BY ... ORDER BY date): with the default frame
+-- (UNBOUNDED PRECEDING .. CURRENT ROW) PostgreSQL advances the state row by row, so it is O(n).
+CREATE OR REPLACE AGGREGATE index_ema(DOUBLE PRECISION, DOUBLE PRECISION) (
+    SFUNC = index_ema_step,
+    STYPE = DOUBLE PRECISION
+);
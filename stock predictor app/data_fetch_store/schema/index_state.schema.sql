@@ -0,0 +1,11 @@
+-- Running rolling-statistics state per index, so the daily index update advances volatility,
+-- momentum, SMAs and EMAs by the new days only instead of re-reading the whole index history.
+
+CREATE TABLE IF NOT EXISTS index_state (
+    sector TEXT NOT NULL,
+    subsector TEXT NOT NULL DEFAULT '',    -- '' for sector-level indexes (primary key columns cannot be NULL)
+    last_date DATE NOT NULL,               -- last index date folded into the state (matches sector_index_table)
+    state JSONB NOT NULL,                  -- ring buffers, EMA values, last prices/caps (see index_state.py)
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (sector, subsector)
+);
@@ -0,0 +1,9 @@
+-- Running indicator state per symbol, so the daily update advances every indicator
+-- by the new bars only instead of re-deriving them from a history buffer.
+
+CREATE TABLE IF NOT EXISTS indicator_state (
+    symbol TEXT PRIMARY KEY,
+    last_date DATE NOT NULL,               -- last bar folded into the state (matches stock_market_table)
+    state JSONB NOT NULL,                  -- EMA values, ring buffer, OBV/RSI accumulators (see indicator_state.py)
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,92 @@
+-- Market-wide daily series, stored once per date instead of on every stock row.
+-- stock_market_view joins them back so readers still see the old stock_market_table columns.
+
+CREATE TABLE IF NOT EXISTS vix_daily (
+    date DATE PRIMARY KEY,
+    vix_close FLOAT
+);
+
+CREATE TABLE IF NOT EXISTS macro_daily (
+    date DATE PRIMARY KEY,
+    cpi_inflation FLOAT,
+    core_cpi_inflation FLOAT,
+    pce_inflation FLOAT,
+    core_pce_inflation FLOAT,
+    breakeven_inflation_rate FLOAT,
+    realized_inflation FLOAT,
+    us_10y_bond_rate FLOAT,
+    retail_sales FLOAT,
+    consumer_confidence_index FLOAT,
+    nfp FLOAT,
+    unemployment_rate FLOAT,
+    effective_federal_funds_rate FLOAT
+);
+
+-- One-time migration of a stock_market_table that still carries the denormalized columns:
+-- copy one value per date into the new tables, then drop the columns.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'stock_market_table' AND column_name = 'vix_close'
+    ) THEN
+        DROP VIEW IF EXISTS stock_market_view;
+
+        INSERT INTO vix_daily (date, vix_close)
+        SELECT date, MAX(vix_close) FROM stock_market_table
+        WHERE vix_close IS NOT NULL
+        GROUP BY date
+        ON CONFLICT (date) DO NOTHING;
+
+        INSERT INTO macro_daily (
+            date, cpi_inflation, core_cpi_inflation, pce_inflation, core_pce_inflation,
+            breakeven_inflation_rate, realized_inflation, us_10y_bond_rate,
+            retail_sales, consumer_confidence_index, nfp, unemployment_rate,
+            effective_federal_funds_rate
+        )
+        SELECT date, MAX(cpi_inflation), MAX(core_cpi_inflation), MAX(pce_inflation), MAX(core_pce_inflation),
+               MAX(breakeven_inflation_rate), MAX(realized_inflation), MAX(us_10y_bond_rate),
+               MAX(retail_sales), MAX(consumer_confidence_index), MAX(nfp), MAX(unemployment_rate),
+               MAX(effective_federal_funds_rate)
+        FROM stock_market_table
+        GROUP BY date
+        ON CONFLICT (date) DO NOTHING;
+
+        ALTER TABLE stock_market_table
+            DROP COLUMN vix_close,
+            DROP COLUMN cpi_inflation,
+            DROP COLUMN core_cpi_inflation,
+            DROP COLUMN pce_inflation,
+            DROP COLUMN core_pce_inflation,
+            DROP COLUMN breakeven_inflation_rate,
+            DROP COLUMN realized_inflation,
+            DROP COLUMN us_10y_bond_rate,
+            DROP COLUMN retail_sales,
+            DROP COLUMN consumer_confidence_index,
+            DROP COLUMN nfp,
+            DROP COLUMN unemployment_rate,
+            DROP COLUMN effective_federal_funds_rate;
+    END IF;
+END $$;
+
+-- Same columns, in the same order, as the old denormalized stock_market_table
+CREATE OR REPLACE VIEW stock_market_view AS
+SELECT
+    s.id, s.symbol, s.symbol_id, s.sector, s.sector_id, s.subsector, s.subsector_id,
+    s.date, s.country_of_origin, s.day_of_week, s.week_of_year,
+    s.open, s.high, s.low, s.close, s.volume, s.adj_close,
+    s.sma_5, s.sma_20, s.sma_50, s.sma_125, s.sma_200, s.sma_200_weekly,
+    s.ema_5, s.ema_20, s.ema_50, s.ema_125, s.ema_200,
+    s.macd, s.dma, s.rsi,
+    s.bollinger_upper, s.bollinger_middle, s.bollinger_lower, s.obv,
+    s.pe_ratio, s.forward_pe, s.price_to_book,
+    s.volatility_5d, s.volatility_10d, s.volatility_20d, s.volatility_40d,
+    s.market_cap, s.market_cap_proxy, s.sector_weight, s.subsector_weight,
+    v.vix_close, s.future_return_1d,
+    m.cpi_inflation, m.core_cpi_inflation, m.pce_inflation, m.core_pce_inflation,
+    m.breakeven_inflation_rate, m.realized_inflation, m.us_10y_bond_rate,
+    m.retail_sales, m.consumer_confidence_index, m.nfp, m.unemployment_rate,
+    m.effective_federal_funds_rate
+FROM stock_market_table s
+LEFT JOIN vix_daily v ON v.date = s.date
+LEFT JOIN macro_daily m ON m.date = s.date;
@@ -0,0 +1,13 @@
+-- Shared progress of the daily pipeline stages (see watermarks.py). Upstream stages mark the date range
+-- they changed as dirty for every downstream stage; a downstream stage processes exactly that range for
+-- each entity, then records its last processed date and clears the range.
+
+CREATE TABLE IF NOT EXISTS pipeline_watermarks (
+    stage TEXT NOT NULL,                   -- stock, sector_index, subsector_index, weights
+    entity TEXT NOT NULL,                  -- symbol for stock, sector or subsector name for the others
+    last_date DATE,                        -- last date the stage has processed for the entity
+    dirty_from DATE,                       -- pending changed range, merged across upstream writes
+    dirty_to DATE,                         -- (both NULL when the entity is up to date)
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (stage, entity)
+);
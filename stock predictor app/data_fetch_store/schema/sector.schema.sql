@@ -1,7 +1,8 @@
 -- DROP TABLE IF EXISTS sector_index_table;
 
+-- Range-partitioned by year on date like stock_market_table (see partitions.py)
 CREATE TABLE sector_index_table (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
 
     -- Hierarchy
     sector TEXT NOT NULL,
@@ -46,5 +47,9 @@ CREATE TABLE sector_index_table (
     influence_weight FLOAT,
 
     -- Unique identifier per row: prevents duplicate entries and ensures clean updates
+    -- (keys of a partitioned table must contain the partition column)
+    PRIMARY KEY (id, date),
     UNIQUE (sector, subsector, date)
-);
+) PARTITION BY RANGE (date);
+
+CREATE TABLE sector_index_table_default PARTITION OF sector_index_table DEFAULT;
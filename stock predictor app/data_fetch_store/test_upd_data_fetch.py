@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+import bar_cache
+import upd_data_fetch
+from indicators import add_indicators
+from indicator_state import build_states
+from providers import synthetic_bars
+from stock_list import SECTOR_STOCKS
+
+# Run from data_fetch_store: python -m pytest test_upd_data_fetch.py
+
+BARS = 1300          # long enough to warm sma_200_weekly (1000 bars)
+STATE_BARS = 1200    # bars folded into the stored indicator state before the run
+SPLIT_BAR = 1250     # 2:1 split inside the new tail
+
+
+def first_item():
+    sector, subsectors = next(iter(SECTOR_STOCKS.items()))
+    subsector, symbols = next(iter(subsectors.items()))
+    return symbols[0], sector, subsector
+
+
+def split_history(symbol):
+    """(history as cached before the split, auto-adjusted history after it) for one symbol."""
+    adjusted = synthetic_bars(symbol, "2015-01-01", pd.bdate_range("2015-01-01", periods=BARS)[-1])
+    adjusted.loc[SPLIT_BAR, "stock splits"] = 2.0
+    before = adjusted.iloc[:STATE_BARS].copy()
+    before[["open", "high", "low", "close"]] *= 2
+    before["volume"] /= 2
+    return before, adjusted
+
+
+def test_split_in_tail_matches_full_recompute(tmp_path, monkeypatch):
+    symbol, sector, subsector = first_item()
+    before, adjusted = split_history(symbol)
+    served = {"df": before}
+
+    def fake_download(symbols, start_date="2004-01-01", end_date=None, limiter=None):
+        df = served["df"]
+        return {s: df[df["date"] >= pd.Timestamp(start_date)].reset_index(drop=True) for s in symbols}
+
+    monkeypatch.setattr(bar_cache, "cache_root", lambda base: str(tmp_path))
+    monkeypatch.setattr(bar_cache, "download_history", fake_download)
+    bar_cache.fetch_history([symbol], start_date="2004-01-01")   # cache the pre-split history
+
+    last_date = before["date"].iloc[-1].date()
+    stored_state = build_states({symbol: before})[symbol]
+    monkeypatch.setattr(upd_data_fetch, "load_states", lambda symbols: {symbol: (last_date, stored_state)})
+    monkeypatch.setattr(upd_data_fetch, "get_market_data", lambda symbols, limiter=None: {s: {} for s in symbols})
+
+    served["df"] = adjusted
+    payload = upd_data_fetch.fetch_increment([(symbol, sector, subsector)], {symbol: last_date})
+    assert symbol in payload["fresh"] and symbol not in payload["stateful"]
+    record, = upd_data_fetch.compute_increment(payload)
+
+    expected = add_indicators(adjusted)
+    expected = expected[expected["date"] > last_date].reset_index(drop=True)
+    got = record["df"].reset_index(drop=True)
+    assert list(got["date"]) == list(expected["date"])
+    for column in ["sma_50", "ema_200", "macd", "rsi", "bollinger_upper", "obv", "sma_200_weekly", "volatility_20d"]:
+        np.testing.assert_allclose(got[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                   rtol=1e-9, equal_nan=True, err_msg=column)
+
+    state_date, state = record["state"]
+    rebuilt = build_states({symbol: adjusted})[symbol]
+    assert state_date == adjusted["date"].iloc[-1].date()
+    assert state["n"] == rebuilt["n"]
+    np.testing.assert_allclose([state["ema"][span] for span in rebuilt["ema"]], list(rebuilt["ema"].values()), rtol=1e-9)
+    np.testing.assert_allclose([state["obv"], state["rsi_up"], state["rsi_down"]],
+                               [rebuilt["obv"], rebuilt["rsi_up"], rebuilt["rsi_down"]], rtol=1e-9)
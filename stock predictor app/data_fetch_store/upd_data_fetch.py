@@ -1,16 +1,22 @@
 import time
-import yfinance as yf
+import threading
+from functools import partial
 import pandas as pd
-import psycopg2
-from psycopg2.extras import execute_values
-from db_params import DB_CONFIG, test_database_connection, create_table, api_key
-from stock_list import SECTOR_STOCKS, MACRO_CODES
-from fredapi import Fred
-
-from ta.trend import SMAIndicator, EMAIndicator, MACD
-from ta.momentum import RSIIndicator
-from ta.volume import OnBalanceVolumeIndicator
-from ta.volatility import BollingerBands
+from db_params import test_database_connection, create_stock_indexes, get_symbol_watermarks
+from stock_list import SECTOR_STOCKS
+from ingest_pool import TokenBucket, report_results, REQUESTS_PER_SECOND
+from ingest_pipeline import run_pipeline, FETCH_WORKERS, COMPUTE_WORKERS
+from price_fetch import build_batches, BATCH_LEVEL
+from providers import get_provider, VIX_SYMBOL
+from bar_cache import fetch_history
+from indicator_state import load_states, save_states, enrich_with_states, apply_bars, copy_state, create_state_table
+from bulk_load import write_stock_records
+from macro_cache import fetch_macro_data
+from macro_tables import create_macro_tables, store_macro_daily, store_vix_daily
+from partitions import ensure_partitions
+from watermarks import create_watermarks_table, record_stock_changes
+from fundamentals_cache import get_market_data, create_fundamentals_table
+
 from datetime import datetime, timedelta
 
 
@@ -25,25 +31,14 @@ ALL_SYMBOLS = sorted({symbol for sector in SECTOR_STOCKS.values() for subsector
 SYMBOL_IDS = {symbol: idx for idx, symbol in enumerate(ALL_SYMBOLS, 1)}
 
 
-# --- Database Helpers ---
-
-def get_last_date_for_symbol(symbol):
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    cur.execute("SELECT MAX(date) FROM stock_market_table WHERE symbol = %s", (symbol,))
-    result = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return result  # returns None if no data yet
-
-
 # --- Data Fetching Functions ---
 
 def fetch_vix_data(start_date="2004-01-01"):
     try:
-        vix = yf.Ticker("^VIX")
-        df = vix.history(start=start_date).reset_index()
-        df = df[["Date", "Close"]].rename(columns={"Date": "date", "Close": "vix_close"})
+        df = get_provider().prices([VIX_SYMBOL], start_date).get(VIX_SYMBOL)
+        if df is None:
+            raise ValueError("No data for ^VIX")
+        df = df[["date", "close"]].rename(columns={"close": "vix_close"})
         df["date"] = pd.to_datetime(df["date"]).dt.date
         return df
     except Exception as e:
@@ -51,123 +46,11 @@ def fetch_vix_data(start_date="2004-01-01"):
         return pd.DataFrame()
 
 
-def fetch_macro_data(start_date="2004-01-01", end_date=None):
-    if end_date is None:
-        end_date = datetime.today().strftime("%Y-%m-%d")
-    fred = Fred(api_key=api_key)
-    all_macro = []
-    
-    for macro_name, fred_code in MACRO_CODES.items():
-        try:
-            print(f"📈 Fetching {macro_name} ({fred_code})...")
-            series = fred.get_series(fred_code, observation_start=start_date, observation_end=end_date)
-            df = series.reset_index()
-            df.columns = ["date", macro_name]
-            all_macro.append(df)
-        except Exception as e:
-            print(f"⚠️ Error fetching {macro_name}: {e}")
-
-    if all_macro:
-        macro_df = all_macro[0]
-        for df in all_macro[1:]:
-            macro_df = pd.merge(macro_df, df, on="date", how="outer")
-
-        macro_df["date"] = pd.to_datetime(macro_df["date"]).dt.date
-        columns_to_forward_fill = [col for col in macro_df.columns if col != "date" and col != "breakeven_inflation_rate"]
-        macro_df.sort_values("date", inplace=True)
-        macro_df[columns_to_forward_fill] = macro_df[columns_to_forward_fill].ffill()
-        return macro_df
-    else:
-        return pd.DataFrame()
-
-
-def fetch_stock_data(symbol, start_date="2004-01-01", retries=3, sleep_sec=2):
-    for attempt in range(retries):
-        try:
-            ticker = yf.Ticker(symbol)
-            df = ticker.history(start=start_date)
-            if df.empty:
-                raise ValueError(f"No data for {symbol}")
-            df = df.reset_index()
-            df.columns = df.columns.str.lower()
-            info = ticker.info
-
-            market_data = {
-                "market_cap": info.get("marketCap"),
-                "pe_ratio": info.get("trailingPE"),
-                "forward_pe": info.get("forwardPE"),
-                "price_to_book": info.get("priceToBook"),
-                "country": info.get("country")
-            }
-            break
-        except Exception as e:
-            print(f"⏳ Retry {attempt + 1} for {symbol} due to error: {e}")
-            time.sleep(sleep_sec)
-    else:
-        print(f"❌ Giving up on {symbol} after {retries} retries")
-        return None, None
-
-    try:
-        close = df["close"]
-        volume = df["volume"]
-
-        # Technical indicators
-        for window in [5, 20, 50, 125, 200]:
-            df[f"sma_{window}"] = SMAIndicator(close, window=window).sma_indicator()
-            df[f"ema_{window}"] = EMAIndicator(close, window=window).ema_indicator()
-
-        df["macd"] = MACD(close).macd_diff()
-        df["dma"] = close - df["sma_50"]
-        df["rsi"] = RSIIndicator(close).rsi()
-
-        bb = BollingerBands(close)
-        df["bollinger_upper"] = bb.bollinger_hband()
-        df["bollinger_middle"] = bb.bollinger_mavg()
-        df["bollinger_lower"] = bb.bollinger_lband()
-
-        df["obv"] = OnBalanceVolumeIndicator(close, volume).on_balance_volume()
-        df["sma_200_weekly"] = close.rolling(window=200 * 5).mean()
-
-        df["adj_close"] = close
-        df["market_cap_proxy"] = df["close"] * df["volume"]
-        df["date"] = pd.to_datetime(df["date"])
-        df["day_of_week"] = df["date"].dt.dayofweek + 1
-        df["week_of_year"] = df["date"].dt.isocalendar().week
-
-        for window in [5, 10, 20, 40]:
-            df[f"volatility_{window}d"] = df["close"].rolling(window).std()
-
-        df["date"] = df["date"].dt.date
-        return df, market_data
-
-    except Exception as e:
-        print(f"⚠️ Indicator calc failed for {symbol}: {e}")
-        return None, None
-
-
 # --- Incremental Stock Fetch ---
 
-def fetch_stock_data_incremental(symbol, buffer_days=200):
-    """
-    Fetch new data for a symbol incrementally, recalculating indicators with a buffer window.
-    """
-    last_date = get_last_date_for_symbol(symbol)
+def select_new_rows(symbol, df, last_date):
     today = datetime.today().date()
 
-    if last_date:
-        # Start fetching buffer_days before last_date
-        start_date = (pd.to_datetime(last_date) - pd.Timedelta(days=buffer_days)).strftime("%Y-%m-%d")
-        print(f"↪️ {symbol}: last DB date = {last_date}, fetching from {start_date} to today")
-    else:
-        # DB has no data for this symbol
-        start_date = "2004-01-01"
-        print(f"🆕 {symbol}: no data in DB, fetching full history")
-
-    # Fetch stock data and calculate indicators
-    df, market_data = fetch_stock_data(symbol, start_date=start_date)
-    if df is None or df.empty:
-        return None, None
-
     # Only keep rows that are actually new for insertion
     if last_date:
         df_to_insert = df[df["date"] > last_date]
@@ -179,15 +62,133 @@ def fetch_stock_data_incremental(symbol, buffer_days=200):
 
     if df_to_insert.empty:
         print(f"⚠️ {symbol}: no new rows to insert")
-        return None, None
+        return None
+    return df_to_insert
+
+
+def fetch_increment(items, watermarks, limiter=None):
+    """
+    Pipeline fetch stage for one batch, driven by the persisted indicator state.
+    Symbols with a stored state download only the bars after the state's last date. Symbols without
+    a state load full history (served by the bar cache after init) so their indicators and state
+    start from the first bar, and so do symbols whose new bars carry a dividend or split.
+    `watermarks` is {symbol: last stored date} from get_symbol_watermarks.
+    """
+    symbols = [symbol for symbol, _, _ in items]
+    print(f"📈 Updating batch of {len(symbols)}: {', '.join(symbols)}")
+    states = load_states(symbols)
+    stateful = {symbol: states[symbol] for symbol in symbols if symbol in states}
+    fresh = {symbol: watermarks.get(symbol) for symbol in symbols if symbol not in states}
+
+    frames = {}
+    if stateful:
+        tail_start = min(last_date for last_date, _ in stateful.values()) + timedelta(days=1)
+        print(f"↪️ {len(stateful)} symbol(s) with indicator state, fetching from {tail_start}")
+        refreshed = set()
+        frames.update(fetch_history(list(stateful), start_date=tail_start.strftime("%Y-%m-%d"), limiter=limiter,
+                                    refreshed=refreshed))
+        # A dividend or split re-adjusted every earlier close, so a state built from the old closes is stale:
+        # rebuild it from the adjusted full history like a symbol without state
+        for symbol in refreshed:
+            print(f"♻️ {symbol}: corporate action, rebuilding indicator state from the adjusted history")
+            del stateful[symbol]
+            frames.pop(symbol, None)
+            fresh[symbol] = watermarks.get(symbol)
+    if fresh:
+        print(f"🆕 {len(fresh)} symbol(s) without indicator state, loading full history: {', '.join(fresh)}")
+        frames.update(fetch_history(list(fresh), start_date="2004-01-01", limiter=limiter))
+
+    # Fundamentals come from the cache; only never-seen symbols hit the provider
+    market = get_market_data(list(frames), limiter=limiter) if frames else {}
+    return {"items": items, "frames": frames, "stateful": stateful, "fresh": fresh, "market": market}
+
+
+def compute_increment(payload):
+    """
+    Pipeline compute stage (runs in a worker process): advance stored states over the new bars,
+    or compute full-history indicators and build a state for symbols without one.
+    Returns one record per symbol; a record without a df has nothing to insert.
+    """
+    today = datetime.today().date()
+    frames, market = payload["frames"], payload["market"]
+
+    prepared = {}
+    for symbol, (last_date, state) in payload["stateful"].items():
+        df = frames.get(symbol)
+        if df is None:
+            continue
+        dates = pd.to_datetime(df["date"]).dt.date
+        bars = df[(dates > last_date) & (dates <= today)]
+        if bars.empty:
+            print(f"⚠️ {symbol}: no new rows to insert")
+            prepared[symbol] = (None, None)
+            continue
+        try:
+            state = copy_state(state)
+            enriched = apply_bars(state, bars)
+        except Exception as e:
+            print(f"⚠️ Indicator calc failed for {symbol}: {e}")
+            continue
+        prepared[symbol] = (enriched, (enriched["date"].max(), state))
+
+    history = {}
+    for symbol in payload["fresh"]:
+        df = frames.get(symbol)
+        if df is not None:
+            history[symbol] = df[pd.to_datetime(df["date"]).dt.date <= today]
+    enriched_history, built_states = enrich_with_states(history)
+    for symbol, last_date in payload["fresh"].items():
+        df = enriched_history.get(symbol)
+        if df is None:
+            continue
+        prepared[symbol] = (select_new_rows(symbol, df, last_date), (df["date"].max(), built_states[symbol]))
 
-    return df_to_insert, market_data
+    records = []
+    for symbol, sector, subsector in payload["items"]:
+        if symbol not in prepared:
+            continue
+        df, new_state = prepared[symbol]
+        if df is not None and symbol not in market:
+            continue
+        record = {"symbol": symbol, "sector": sector, "subsector": subsector, "rows": 0 if df is None else len(df),
+                  "df": df, "market_data": market.get(symbol), "state": new_state}
+        try:
+            record["ids"] = resolve_ids(symbol, sector, subsector)
+        except ValueError as e:
+            record["status"] = f"failed: {e}"
+        records.append(record)
+    return records
 
-    
-def insert_data(symbol, sector, subsector, df, market_data):
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
 
+def write_increment(records, inserted_through):
+    """
+    Pipeline write stage: one COPY for all records, then move their indicator state forward and mark
+    the written date ranges dirty for the downstream stages (see watermarks.py).
+    The last inserted date per symbol goes into `inserted_through` for the end-of-run verification.
+    A symbol listed under two sectors/subsectors is written once but marks both of them dirty.
+    """
+    unique = {}
+    for record in records:
+        unique.setdefault(record["symbol"], record)
+    statuses = write_stock_records(list(unique.values()))
+    committed_states = {}
+    changes = []
+    for record in records:
+        symbol = record["symbol"]
+        written = unique[symbol]
+        if statuses[symbol].startswith("inserted"):
+            dates = written["df"]["date"]
+            inserted_through[symbol] = dates.max()
+            changes.append((symbol, record["sector"], record["subsector"], dates.min(), dates.max()))
+        # The state may only move forward once its rows are in the table
+        if written["state"] is not None and not statuses[symbol].startswith("failed"):
+            committed_states[symbol] = written["state"]
+    save_states(committed_states)
+    record_stock_changes(changes)
+    return statuses
+
+
+def resolve_ids(symbol, sector, subsector):
     symbol_id = SYMBOL_IDS.get(symbol)
     sector_id = SECTOR_IDS.get(sector)
     subsector_id = SUBSECTOR_IDS.get(subsector)
@@ -198,96 +199,94 @@ def insert_data(symbol, sector, subsector, df, market_data):
         raise ValueError(f"❌ Sector {sector} not found in SECTOR_IDS mapping.")
     if subsector_id is None:
         raise ValueError(f"❌ Subsector {subsector} not found in SUBSECTOR_IDS mapping.")
+    return symbol_id, sector_id, subsector_id
 
-    insert_rows = []
-    for _, row in df.iterrows():
-        if pd.isna(row["date"]):
-            continue
 
-        insert_rows.append((
-            symbol, sector, subsector, row["date"], row.get("day_of_week"), row.get("week_of_year"),
-            market_data.get("country"), symbol_id,
-            row.get("open"), row.get("high"), row.get("low"), row.get("close"), row.get("volume"), row.get("adj_close"),
-            row.get("sma_5"), row.get("sma_20"), row.get("sma_50"), row.get("sma_125"), row.get("sma_200"), row.get("sma_200_weekly"),
-            row.get("ema_5"), row.get("ema_20"), row.get("ema_50"), row.get("ema_125"), row.get("ema_200"),
-            row.get("macd"), row.get("dma"), row.get("rsi"),
-            row.get("bollinger_upper"), row.get("bollinger_middle"), row.get("bollinger_lower"), row.get("obv"),
-            market_data.get("pe_ratio"), market_data.get("forward_pe"), market_data.get("price_to_book"),
-            row.get("volatility_5d"), row.get("volatility_10d"), row.get("volatility_20d"), row.get("volatility_40d"),
-            market_data.get("market_cap"), row.get("market_cap_proxy"),
-            sector_id, subsector_id,
-            row.get("sector_weight"), row.get("subsector_weight"), row.get("vix_close"), row.get("future_return_1d"),
-            row.get("cpi_inflation"), row.get("core_cpi_inflation"), row.get("pce_inflation"), row.get("core_pce_inflation"),
-            row.get("breakeven_inflation_rate"), row.get("realized_inflation"), row.get("us_10y_bond_rate"),
-            row.get("retail_sales"), row.get("consumer_confidence_index"), row.get("nfp"), row.get("unemployment_rate"),
-            row.get("effective_federal_funds_rate")
-        ))
-
-    if insert_rows:
-        try:
-            execute_values(cur, """
-                INSERT INTO stock_market_table (
-                    symbol, sector, subsector, date, day_of_week, week_of_year, country_of_origin, symbol_id,
-                    open, high, low, close, volume, adj_close,
-                    sma_5, sma_20, sma_50, sma_125, sma_200, sma_200_weekly,
-                    ema_5, ema_20, ema_50, ema_125, ema_200,
-                    macd, dma, rsi,
-                    bollinger_upper, bollinger_middle, bollinger_lower, obv,
-                    pe_ratio, forward_pe, price_to_book,
-                    volatility_5d, volatility_10d, volatility_20d, volatility_40d,
-                    market_cap, market_cap_proxy,
-                    sector_id, subsector_id,
-                    sector_weight, subsector_weight, vix_close, future_return_1d,
-                    cpi_inflation, core_cpi_inflation, pce_inflation, core_pce_inflation,
-                    breakeven_inflation_rate, realized_inflation, us_10y_bond_rate,
-                    retail_sales, consumer_confidence_index, nfp, unemployment_rate,
-                    effective_federal_funds_rate
-                ) VALUES %s
-                ON CONFLICT (symbol, date) DO NOTHING
-            """, insert_rows)
-            conn.commit()
-            print(f"✅ Inserted {len(insert_rows)} rows for {symbol}")
-
-            # --- Post-insert verification ---
-            df_max_date = df["date"].max()
-            cur.execute("SELECT MAX(date) FROM stock_market_table WHERE symbol = %s", (symbol,))
-            db_max_date = cur.fetchone()[0]
-
-            if db_max_date != df_max_date:
-                print(f"⚠️ Verification mismatch for {symbol}: DataFrame max date = {df_max_date}, DB max date = {db_max_date}")
-            else:
-                print(f"🔍 Verification passed for {symbol}: Latest date in DB = {db_max_date}")
+def verify_inserted(inserted_through):
+    """One batched pass comparing each symbol's last inserted date with what the table now holds."""
+    if not inserted_through:
+        return []
+    stored = get_symbol_watermarks(list(inserted_through))
+    mismatched = [symbol for symbol, last_date in inserted_through.items() if stored.get(symbol) != last_date]
+    for symbol in mismatched:
+        print(f"⚠️ Verification mismatch for {symbol}: DataFrame max date = {inserted_through[symbol]}, DB max date = {stored.get(symbol)}")
+    if not mismatched:
+        print(f"🔍 Verification passed for {len(inserted_through)} symbol(s)")
+    return mismatched
 
-        except Exception as e:
-            print(f"❌ Failed batch insert {symbol}: {e}")
-            conn.rollback()
 
-    cur.close()
-    conn.close()
-
-def main():
+def sector_tracker(batches, on_sector_written):
+    """
+    on_result callback for run_pipeline that calls on_sector_written(sector) once every symbol of the
+    sector has a result, so downstream work on that sector can start before the whole fetch ends.
+    A symbol listed in several batches (some belong to two sectors) counts as landed after its last one.
+    """
+    jobs_left = {}
+    sector_symbols = {}
+    for items in batches:
+        for symbol, sector, _ in items:
+            jobs_left[symbol] = jobs_left.get(symbol, 0) + 1
+            sector_symbols.setdefault(sector, set()).add(symbol)
+    lock = threading.Lock()
+
+    def landed(symbols):
+        finished = []
+        with lock:
+            for symbol in symbols:
+                jobs_left[symbol] = jobs_left.get(symbol, 1) - 1
+            for sector, members in list(sector_symbols.items()):
+                if all(jobs_left.get(symbol, 0) <= 0 for symbol in members):
+                    finished.append(sector)
+                    del sector_symbols[sector]
+        for sector in finished:
+            on_sector_written(sector)
+
+    return landed
+
+
+def main(workers=FETCH_WORKERS, requests_per_second=REQUESTS_PER_SECOND, batch_level=BATCH_LEVEL,
+         compute_workers=COMPUTE_WORKERS, on_sector_written=None):
+    """
+    Incremental daily fetch of every symbol. on_sector_written(sector), when given, is called as each
+    sector's symbols are all written (see pipeline_dag). Returns {symbol: (ok, status)}, or None when
+    the database is unreachable.
+    """
     if test_database_connection():
+        started_at = time.monotonic()
         today_str = datetime.today().strftime("%Y-%m-%d")
-
-        macro_df = fetch_macro_data(end_date=today_str)
-        vix_df = fetch_vix_data()
-
-        for sector, subsectors in SECTOR_STOCKS.items():
-            for subsector, symbols in subsectors.items():
-                for symbol in symbols:
-                    print(f"📈 Updating {symbol} ({sector} - {subsector})...")
-                    try:
-                        df, market_data = fetch_stock_data_incremental(symbol)
-                        if df is not None and not df.empty:
-                            df = df.merge(vix_df, on="date", how="left")
-                            if not macro_df.empty:
-                                df = df.merge(macro_df, on="date", how="left")
-                            insert_data(symbol, sector, subsector, df, market_data)
-                    except Exception as e:
-                        print(f"⚠️ Failed processing {symbol}: {e}")
+        create_fundamentals_table()
+        ensure_partitions()
+        create_stock_indexes()
+        create_state_table()
+        create_watermarks_table()
+        create_macro_tables()
+
+        # Market-wide series are stored once per date, not on every stock row
+        store_macro_daily(fetch_macro_data(end_date=today_str))
+        store_vix_daily(fetch_vix_data())
+
+        batches = build_batches(batch_level)
+        watermarks = get_symbol_watermarks([symbol for items in batches for symbol, _, _ in items])
+        inserted_through = {}
+
+        limiter = TokenBucket(rate=requests_per_second)
+        jobs = [
+            ([symbol for symbol, _, _ in items], (items, watermarks, limiter))
+            for items in batches
+        ]
+
+        print(f"🚀 Updating {len(jobs)} {batch_level} batches: {workers} fetch thread(s) at {requests_per_second} req/s, "
+              f"{compute_workers} compute process(es)")
+        on_result = sector_tracker(batches, on_sector_written) if on_sector_written else None
+        results, _ = run_pipeline(jobs, fetch_increment, compute_increment,
+                                  partial(write_increment, inserted_through=inserted_through),
+                                  fetch_workers=workers, compute_workers=compute_workers, on_result=on_result)
+        verify_inserted(inserted_through)
+        report_results(results, started_at)
+        return results
     else:
         print("❌ Database connection failed.")
-
+        return None
 
 
 if __name__ == "__main__":
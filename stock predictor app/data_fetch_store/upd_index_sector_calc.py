@@ -1,62 +1,191 @@
-import psycopg2
-from psycopg2.extras import execute_values
+import math
 import pandas as pd
 from collections import defaultdict
 from datetime import datetime, timedelta
-from db_params import DB_CONFIG, test_database_connection
+from db_params import get_connection, test_database_connection
 from stock_list import SECTORS
-
-ROLL_BACK = 250  # Buffer window
-
-def get_sector_index_history(sector):
-    """Fetch existing sector index from DB."""
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        df = pd.read_sql(
-            """
-            SELECT date, index_value, total_volume, market_cap,
-                   volatility_5d, volatility_10d, volatility_20d, volatility_40d,
-                   momentum_14d, sma_5, sma_20, sma_50, sma_125, sma_200, sma_200_weekly,
-                   ema_5, ema_10, ema_20, ema_50, ema_125, ema_200
-            FROM sector_index_table
-            WHERE sector = %s AND is_subsector = FALSE
-            ORDER BY date
-            """, conn, params=(sector,)
-        )
-    if df.empty:
-        return None
-    df['date'] = pd.to_datetime(df['date']).dt.date
-    return df.set_index('date')
-
-
-def get_stock_data(sector, last_date):
-    """Fetch stock data from last_date - ROLL_BACK to today."""
-    cutoff = last_date - timedelta(days=ROLL_BACK)
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        df = pd.read_sql(
-            """
-            SELECT symbol, date, close, market_cap_proxy, volume
-            FROM stock_market_table
-            WHERE sector = %s AND date >= %s
-              AND close IS NOT NULL AND market_cap_proxy IS NOT NULL
-            ORDER BY date
-            """, conn, params=(sector, cutoff)
-        )
+from index_writer import upsert_index_rows
+from index_builder import MARKET_SECTOR, VOLATILITY_WINDOWS, MOMENTUM_WINDOW, SMA_WINDOWS, EMA_WINDOWS, WEEKLY_SMA_WINDOW
+from index_state import (
+    create_index_state_table, load_state, save_state, build_state, state_from_window, advance, last_value,
+)
+from ingest_pool import run_jobs, parse_workers, INDEX_WORKERS
+from watermarks import SECTOR_INDEX_STAGE, create_watermarks_table, load_watermarks, is_clean, finish_stage
+
+ROLL_BACK = 250  # days of prices read to seed last known closes/caps when an index has no state
+SECTOR_ROW_COLUMNS = [
+    "sector", "subsector", "is_subsector", "date",
+    "index_value", "market_cap", "total_volume",
+    "average_return", "weighted_return", "return_vs_previous",
+    "num_constituents",
+    "volatility_5d", "volatility_10d", "volatility_20d", "volatility_40d",
+    "momentum_14d",
+    "sma_5", "sma_20", "sma_50", "sma_125", "sma_200", "sma_200_weekly",
+    "ema_5", "ema_10", "ema_20", "ema_50", "ema_125", "ema_200",
+]
+# average_return/weighted_return are not recomputed here, so stored values are kept
+SECTOR_UPDATE_COLUMNS = [c for c in SECTOR_ROW_COLUMNS[4:] if c not in ("average_return", "weighted_return")]
+
+def get_latest_index_row(sector):
+    """(date, index_value) of the newest stored sector-level row, or None."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT date, index_value
+                FROM sector_index_table
+                WHERE sector = %s AND is_subsector = FALSE
+                ORDER BY date DESC
+                LIMIT 1
+                """, (sector,)
+            )
+            return cur.fetchone()
+
+
+def get_index_values(sector, through_date):
+    """index_value history of a sector through through_date, oldest first. Only read to seed a missing state."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT index_value
+                FROM sector_index_table
+                WHERE sector = %s AND is_subsector = FALSE AND date <= %s
+                ORDER BY date
+                """, (sector, through_date)
+            )
+            return [float(value) for value, in cur.fetchall()]
+
+
+def get_stock_data(sector, start_date, end_date=None):
+    """
+    Stock rows of a sector (every stock for MARKET_SECTOR) from start_date (through end_date when given),
+    grouped by date.
+    """
+    query = """
+        SELECT symbol, date, close, market_cap_proxy, volume
+        FROM stock_market_table
+        WHERE date >= %s AND close IS NOT NULL AND market_cap_proxy IS NOT NULL
+    """
+    params = [start_date]
+    if sector != MARKET_SECTOR:
+        query += " AND sector = %s"
+        params.append(sector)
+    if end_date:
+        query += " AND date <= %s"
+        params.append(end_date)
+    with get_connection() as conn:
+        df = pd.read_sql(query + " ORDER BY date", conn, params=tuple(params))
     df['date'] = pd.to_datetime(df['date']).dt.date
     stock_dict = defaultdict(list)
     for r in df.itertuples(index=False):
-        stock_dict[r.date].append((r.symbol, r.close, r.market_cap_proxy, r.volume))
+        stock_dict[r.date].append((r.symbol, float(r.close), float(r.market_cap_proxy), r.volume))
     return stock_dict
 
 
-def update_sector(sector, cutoff_date=None):
-    """Incrementally update a sector index using historical index and stock data."""
-    hist = get_sector_index_history(sector)
-    if hist is None or hist.empty:
-        print(f"❌ No prior index data for {sector}, skipping.")
-        return
+def remember_prices(state, daily):
+    """Record each constituent's close and cap on a processed day; they chain the next day's index."""
+    for s, close, cap_proxy, _ in daily:
+        if pd.notna(close):
+            state["prices"][s] = close
+        if pd.notna(cap_proxy):
+            state["caps"][s] = cap_proxy
+
+
+def seed_prices(state, sector, last_date):
+    """Last known closes/caps at last_date from the last ROLL_BACK days of prices."""
+    stock_data = get_stock_data(sector, last_date - timedelta(days=ROLL_BACK), last_date)
+    for date in sorted(stock_data):
+        remember_prices(state, stock_data[date])
+    return state
+
 
-    last_date = hist.index.max()
-    last_index = hist.loc[last_date, 'index_value']
+def seed_state(sector, last_date):
+    """Rolling state at last_date from the stored index history and the last ROLL_BACK days of prices."""
+    return seed_prices(build_state(get_index_values(sector, last_date)), sector, last_date)
+
+
+def rewound_state(sector, from_date):
+    """
+    (last_date, state) as of the newest sector-level row before from_date, so the rows from from_date on
+    can be recomputed. The first stored row is always kept as the chaining baseline. Built from the
+    WEEKLY_SMA_WINDOW rows up to that row and its stored EMAs, so a rewind costs the same as any day.
+    """
+    ema_columns = ", ".join(f"ema_{w}" for w in EMA_WINDOWS)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT MIN(date) FROM sector_index_table WHERE sector = %s AND is_subsector = FALSE
+                """, (sector,)
+            )
+            before = max(from_date, cur.fetchone()[0] + timedelta(days=1))
+            cur.execute(
+                """
+                SELECT COUNT(*) FROM sector_index_table WHERE sector = %s AND is_subsector = FALSE AND date < %s
+                """, (sector, before)
+            )
+            count = cur.fetchone()[0]
+            cur.execute(
+                f"""
+                SELECT date, index_value, {ema_columns}
+                FROM sector_index_table
+                WHERE sector = %s AND is_subsector = FALSE AND date < %s
+                ORDER BY date DESC
+                LIMIT %s
+                """, (sector, before, WEEKLY_SMA_WINDOW)
+            )
+            rows = cur.fetchall()[::-1]
+
+    last_date, ema = rows[-1][0], dict(zip(EMA_WINDOWS, rows[-1][2:]))
+    if any(value is None for value in ema.values()):
+        print(f"🧮 {sector}: stored EMAs incomplete, seeding rolling state from the stored index history")
+        return last_date, seed_state(sector, last_date)
+    state = state_from_window([value for _, value, *_ in rows], count, ema)
+    return last_date, seed_prices(state, sector, last_date)
+
+
+def current_state(sector, last_date, last_index):
+    """
+    The stored state when it ends on the newest stored row; otherwise (first run, or the history was
+    rebuilt since) a freshly seeded one. Returns (state, seeded).
+    """
+    stored = load_state(sector)
+    if stored is not None:
+        state_date, state = stored
+        if state_date == last_date and last_value(state) is not None and \
+                math.isclose(last_value(state), float(last_index), rel_tol=1e-9, abs_tol=1e-6):
+            return state, False
+    print(f"🧮 {sector}: seeding rolling state from the stored index history")
+    return seed_state(sector, last_date), True
+
+
+def _round5(value):
+    return round(value, 5) if value is not None else None
+
+
+def update_sector(sector, cutoff_date=None, rewind_from=None):
+    """
+    Incrementally update a sector index from its persisted rolling state: reads one state row and the
+    stock rows after the last stored date, so the cost no longer grows with history. With rewind_from,
+    the rows from that date on are recomputed (their stock rows changed) and replaced in the same
+    transaction that stores the new state. Returns {sector: status}.
+    """
+    print(f"\n➡️ Updating {sector}...")
+    latest = get_latest_index_row(sector)
+    if latest is None:
+        print(f"❌ No prior index data for {sector}, skipping.")
+        return {sector: "skipped: no prior index"}
+
+    last_date, last_index = latest
+    rewind_after = None
+    if rewind_from is not None and rewind_from <= last_date:
+        last_date, state = rewound_state(sector, rewind_from)
+        rewind_after, seeded = last_date, True
+        print(f"⏪ {sector}: recomputing the rows after {rewind_after}")
+    else:
+        state, seeded = current_state(sector, last_date, last_index)
+    last_index = last_value(state)
 
     # Determine the dates to calculate
     today = datetime.today().date()
@@ -66,154 +195,111 @@ def update_sector(sector, cutoff_date=None):
     else:
         end_date = today
 
-    stock_data = get_stock_data(sector, last_date + timedelta(days=1))
-    trading_dates = sorted(d for d in stock_data.keys() if d > last_date and d <= end_date)
-
-    if not trading_dates:
-        print(f"⏭️ {sector}: No new trading days to process.")
-        return
-
-    working = hist.copy()
-
-    # Precompute buffers
-    last_known_prices = {}
-    last_known_caps = {}
-
-    for date in sorted(stock_data.keys()):
-        daily = stock_data.get(date)
-        if not daily:
-            continue
-        for s, close, cap_proxy, _ in daily:
-            if pd.notna(close):
-                last_known_prices[s] = close
-            if pd.notna(cap_proxy):
-                last_known_caps[s] = cap_proxy
+    stock_data = get_stock_data(sector, last_date + timedelta(days=1), end_date)
+    trading_dates = sorted(stock_data)
 
-    # Process new dates
+    insert_values = []
     for date in trading_dates:
-        daily = stock_data.get(date)
-        if not daily:
-            continue
+        daily = stock_data[date]
+        prices, caps = state["prices"], state["caps"]
 
-        available_symbols = [s for s, _, _, _ in daily if s in last_known_prices and s in last_known_caps]
+        available_symbols = [s for s, _, _, _ in daily if s in prices and s in caps]
+        total_cap = sum(caps[s] for s in available_symbols)
         if not available_symbols:
             print(f"⚠️ {sector} {date}: No symbols with valid prior prices, skipping.")
-            continue
-
-        # Compute weights
-        caps = {s: last_known_caps[s] for s in available_symbols}
-        total_cap = sum(caps.values())
-        if total_cap == 0:
+        elif total_cap == 0:
             print(f"⚠️ {sector} {date}: Zero total cap, skipping.")
-            continue
-
-        weights = {s: caps[s] / total_cap for s in available_symbols}
-
-        # Index calc
-        idx_ret = 0
-        vol_sum = 0
-        cap_sum = 0
-        for s, close, cap_proxy, volume in daily:
-            if s not in available_symbols:
-                continue
-            prev_close = last_known_prices[s]
-            idx_ret += weights[s] * ((close / prev_close) - 1)
-            cap_sum += cap_proxy or 0
-            vol_sum += volume or 0
-
-            last_known_prices[s] = close
-            last_known_caps[s] = cap_proxy
-
-        new_index = round(last_index * (1 + idx_ret), 4)
-
-        working.loc[date, [
-            'index_value', 'total_volume', 'market_cap', 'num_constituents'
-        ]] = [new_index, vol_sum, cap_sum, len(available_symbols)]
-
-        last_index = new_index
-        last_date = date
-
-    # Compute indicators
-    working['return_vs_previous'] = working['index_value'].pct_change()
-    returns = working['index_value'].pct_change()
-    for w in [5, 10, 20, 40]:
-        working[f'volatility_{w}d'] = returns.rolling(w).std()
-    working['momentum_14d'] = working['index_value'].pct_change(14)
-    for w in [5, 20, 50, 125, 200]:
-        working[f'sma_{w}'] = working['index_value'].rolling(w).mean()
-    working['sma_200_weekly'] = working['index_value'].rolling(1000).mean()
-    for w in [5, 10, 20, 50, 125, 200]:
-        working[f'ema_{w}'] = working['index_value'].ewm(span=w, adjust=False).mean()
-
-    working.fillna(method="ffill", inplace=True)
-
-    # Insert only new dates
-    new_rows = working.loc[hist.index.max() + timedelta(days=1):].dropna(subset=['index_value'])
-    if new_rows.empty:
-        print(f"⏭️ {sector}: No new rows to insert.")
-        return
-
-    insert_values = []
-    for d, row in new_rows.iterrows():
-        insert_values.append([
-            sector, None, False, d,
-            row['index_value'], row['market_cap'], row['total_volume'],
-            None, None, round(row['return_vs_previous'], 5) if pd.notna(row['return_vs_previous']) else None,
-            int(row.get('num_constituents', 0)),
-            *[round(row.get(f'volatility_{w}d'), 5) if pd.notna(row.get(f'volatility_{w}d')) else None for w in [5, 10, 20, 40]],
-            round(row['momentum_14d'], 5) if pd.notna(row['momentum_14d']) else None,
-            *[round(row.get(f'sma_{w}'), 5) if pd.notna(row.get(f'sma_{w}')) else None for w in [5, 20, 50, 125, 200]],
-            round(row['sma_200_weekly'], 5) if pd.notna(row['sma_200_weekly']) else None,
-            *[round(row.get(f'ema_{w}'), 5) if pd.notna(row.get(f'ema_{w}')) else None for w in [5, 10, 20, 50, 125, 200]]
-        ])
-
-    insert_sql = """
-        INSERT INTO sector_index_table (
-            sector, subsector, is_subsector, date,
-            index_value, market_cap, total_volume,
-            average_return, weighted_return, return_vs_previous,
-            num_constituents,
-            volatility_5d, volatility_10d, volatility_20d, volatility_40d,
-            momentum_14d,
-            sma_5, sma_20, sma_50, sma_125, sma_200, sma_200_weekly,
-            ema_5, ema_10, ema_20, ema_50, ema_125, ema_200
-        ) VALUES %s
-        ON CONFLICT (sector, subsector, date) DO UPDATE SET
-            index_value = EXCLUDED.index_value,
-            market_cap = EXCLUDED.market_cap,
-            total_volume = EXCLUDED.total_volume,
-            return_vs_previous = EXCLUDED.return_vs_previous,
-            num_constituents = EXCLUDED.num_constituents,
-            volatility_5d = EXCLUDED.volatility_5d,
-            volatility_10d = EXCLUDED.volatility_10d,
-            volatility_20d = EXCLUDED.volatility_20d,
-            volatility_40d = EXCLUDED.volatility_40d,
-            momentum_14d = EXCLUDED.momentum_14d,
-            sma_5 = EXCLUDED.sma_5, sma_20 = EXCLUDED.sma_20,
-            sma_50 = EXCLUDED.sma_50, sma_125 = EXCLUDED.sma_125,
-            sma_200 = EXCLUDED.sma_200, sma_200_weekly = EXCLUDED.sma_200_weekly,
-            ema_5 = EXCLUDED.ema_5, ema_10 = EXCLUDED.ema_10,
-            ema_20 = EXCLUDED.ema_20, ema_50 = EXCLUDED.ema_50,
-            ema_125 = EXCLUDED.ema_125, ema_200 = EXCLUDED.ema_200
-    """
+        else:
+            # Index calc: cap-weighted return since each symbol's last known close
+            idx_ret = 0
+            vol_sum = 0
+            cap_sum = 0
+            for s, close, cap_proxy, volume in daily:
+                if s not in caps or s not in prices:
+                    continue
+                idx_ret += caps[s] / total_cap * ((close / prices[s]) - 1)
+                cap_sum += cap_proxy or 0
+                vol_sum += volume or 0
+
+            new_index = round(last_index * (1 + idx_ret), 4)
+            stats = advance(state, new_index)
+            insert_values.append([
+                sector, None, False, date,
+                new_index, cap_sum, vol_sum,
+                None, None, _round5(stats['return_vs_previous']),
+                len(available_symbols),
+                *[_round5(stats[f'volatility_{w}d']) for w in VOLATILITY_WINDOWS],
+                _round5(stats[f'momentum_{MOMENTUM_WINDOW}d']),
+                *[_round5(stats[f'sma_{w}']) for w in SMA_WINDOWS],
+                _round5(stats['sma_200_weekly']),
+                *[_round5(stats[f'ema_{w}']) for w in EMA_WINDOWS],
+            ])
+            remember_prices(state, daily)
+            last_index = new_index
+            last_date = date
+
+    if not insert_values and not seeded:
+        print(f"⏭️ {sector}: No new trading days to process.")
+        return {sector: "no new trading days"}
 
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
-            execute_values(cur, insert_sql, insert_values)
+            if rewind_after is not None:
+                # Rows past the rewind point that the recomputation no longer produces must not survive it
+                cur.execute(
+                    """
+                    DELETE FROM sector_index_table
+                    WHERE sector = %s AND is_subsector = FALSE AND date > %s AND date <> ALL(%s::date[])
+                    """, (sector, rewind_after, [row[3] for row in insert_values])
+                )
+            updated, inserted = upsert_index_rows(cur, insert_values, SECTOR_ROW_COLUMNS, SECTOR_UPDATE_COLUMNS)
+            save_state(cur, sector, None, last_date, state)
             conn.commit()
 
-    print(f"✅ {sector}: Inserted {len(insert_values)} new row(s) with continuous sector index.")
+    if not insert_values:
+        print(f"⏭️ {sector}: No new trading days to process.")
+        return {sector: "no new trading days"}
+    print(f"✅ {sector}: {inserted} new row(s), {updated} updated, with continuous sector index.")
+    return {sector: f"{inserted} inserted, {updated} updated"}
+
+def sector_job(sector, mark):
+    """
+    run_jobs job updating a sector from its first dirty date, or None when its stock rows did not change.
+    A sector that has never been tracked falls back to appending whatever is newer than its last index row.
+    """
+    if is_clean(mark):
+        print(f"⏭️ {sector}: no stock changes since the last run.")
+        return None
+    return [sector], (sector, None, mark.dirty_from if mark else None)  # optionally provide a cutoff
+
+
+def run_sector(sector):
+    """Update one sector against its watermark and record it (a pipeline DAG node). Returns its status."""
+    marks = load_watermarks(SECTOR_INDEX_STAGE, [sector])
+    job = sector_job(sector, marks.get(sector))
+    if job is None:
+        return "skipped: no changes"
+    results = run_jobs([job], update_sector, max_workers=1)
+    finish_stage(SECTOR_INDEX_STAGE, results, marks, through=datetime.today().date())
+    return results[sector][1]
+
 
-def main():
+def main(workers=INDEX_WORKERS):
     if not test_database_connection():
         print("❌ Cannot connect to DB.")
         return
+    create_index_state_table()
+    create_watermarks_table()
 
+    # Only sectors with dirty stock rows are updated; the market index is maintained like one more sector
+    marks = load_watermarks(SECTOR_INDEX_STAGE)
+    jobs = [job for job in (sector_job(sec, marks.get(sec)) for sec in SECTORS + [MARKET_SECTOR]) if job is not None]
 
-    for sec in SECTORS:
-        print(f"\n➡️ Updating {sec}...")
-        update_sector(sec, cutoff_date=None)  # optionally provide a cutoff
+    # Sectors are independent: with workers > 1 each one updates in its own process
+    results = run_jobs(jobs, update_sector, max_workers=workers, processes=True)
+    finish_stage(SECTOR_INDEX_STAGE, results, marks, through=datetime.today().date())
+    return results
 
 
 if __name__ == "__main__":
-    main()
+    main(workers=parse_workers("Update sector indexes."))
@@ -1,17 +1,17 @@
-import psycopg2
-from psycopg2.extras import execute_values
 from collections import defaultdict
-from datetime import datetime, timedelta
-import time
+from datetime import timedelta
 
-from db_params import DB_CONFIG, test_database_connection, get_latest_stock_date
+from db_params import get_connection, test_database_connection, get_latest_stock_date
 from stock_list import SUBSECTOR_TO_SECTOR
+from index_writer import INDEX_COLUMNS, upsert_index_rows
+from ingest_pool import run_jobs, parse_workers, INDEX_WORKERS
+from watermarks import SUBSECTOR_INDEX_STAGE, create_watermarks_table, load_watermarks, is_clean, finish_stage
 
-BATCH_INSERT_THRESHOLD = 2
 ROLLING_WINDOW_BUFFER = 250
+SUBSECTOR_ROW_COLUMNS = INDEX_COLUMNS[:INDEX_COLUMNS.index("influence_weight") + 1]
 
 def get_subsector_index_at_date(sector, subsector, date):
-    with psycopg2.connect(**DB_CONFIG) as conn, conn.cursor() as cur:
+    with get_connection() as conn, conn.cursor() as cur:
         cur.execute("""
             SELECT index_value
             FROM sector_index_table
@@ -21,19 +21,34 @@ def get_subsector_index_at_date(sector, subsector, date):
         result = cur.fetchone()
         return result[0] if result else None
 
+def get_subsector_baseline_date(sector, subsector, before=None):
+    """Date of the newest stored subsector row (before `before` when given), or None."""
+    query = """
+        SELECT MAX(date)
+        FROM sector_index_table
+        WHERE sector = %s AND subsector = %s
+    """
+    params = [sector, subsector]
+    if before:
+        query += " AND date < %s"
+        params.append(before)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchone()[0]
+
 def process_subsector(subsector, start_date):
+    """Chain the subsector index forward from its stored row on start_date (the baseline), which is kept."""
     preload_start = start_date - timedelta(days=ROLLING_WINDOW_BUFFER)
     sector_name = SUBSECTOR_TO_SECTOR[subsector]
     baseline_index = get_subsector_index_at_date(sector_name, subsector, start_date)
 
     if baseline_index is None:
         print(f"❌ [{subsector}] No baseline index on {start_date}. Skipping.")
-        return
+        return {subsector: "skipped: no baseline index"}
 
     print(f"📌 [{subsector}] Baseline ({start_date}): {baseline_index}")
-    time.sleep(1)
 
-    with psycopg2.connect(**DB_CONFIG) as conn, conn.cursor() as cur:
+    with get_connection() as conn, conn.cursor() as cur:
         cur.execute("""
             SELECT symbol, date, close, market_cap_proxy, volume
             FROM stock_market_table
@@ -44,7 +59,7 @@ def process_subsector(subsector, start_date):
 
         if not rows:
             print(f"⚠️ [{subsector}] No data from {preload_start}.")
-            return
+            return {subsector: "skipped: no data"}
 
         data_by_date = defaultdict(list)
         prices_by_symbol = defaultdict(dict)
@@ -57,26 +72,40 @@ def process_subsector(subsector, start_date):
 
         sorted_dates = sorted(all_dates)
         if not sorted_dates:
-            return
+            return {subsector: "skipped: no dates"}
 
         baseline_data = data_by_date.get(start_date)
         if not baseline_data:
             print(f"⚠️ [{subsector}] No baseline data on {start_date}. Skipping.")
-            return
+            return {subsector: "skipped: no baseline data"}
 
         total_cap = sum(cap for _, _, cap, _ in baseline_data if cap)
         if total_cap == 0:
             print(f"⚠️ [{subsector}] Zero baseline market cap. Skipping.")
-            return
+            return {subsector: "skipped: zero baseline cap"}
 
         cap_weights = {symbol: cap / total_cap for symbol, _, cap, _ in baseline_data if cap}
         symbol_set = set(cap_weights)
 
+        # Sector and subsector caps of every date to chain, read once instead of two queries per date
+        cur.execute("""
+            SELECT date, market_cap FROM sector_index_table
+            WHERE sector = %s AND subsector IS NULL AND date > %s
+        """, (sector_name, start_date))
+        sector_caps = dict(cur.fetchall())
+        cur.execute("""
+            SELECT date, SUM(0.3 * market_cap + 0.7 * market_cap_proxy)
+            FROM stock_market_table
+            WHERE subsector = %s AND date > %s
+            GROUP BY date
+        """, (subsector, start_date))
+        subsector_caps = dict(cur.fetchall())
+
         insert_buffer = []
         previous_index = baseline_index
 
         for i, date in enumerate(sorted_dates):
-            if date < start_date:
+            if date <= start_date:
                 continue
 
             prev_date = sorted_dates[i - 1] if i > 0 else None
@@ -104,20 +133,8 @@ def process_subsector(subsector, start_date):
             ret_pct = round(index_return * 100, 2) if previous_index else None
             previous_index = final_index_value
 
-            cur.execute("""
-                SELECT market_cap FROM sector_index_table
-                WHERE sector = %s AND subsector IS NULL AND date = %s
-            """, (sector_name, date))
-            sector_cap = cur.fetchone()
-            sector_cap = sector_cap[0] if sector_cap else 0
-
-            cur.execute("""
-                SELECT SUM(0.3 * market_cap + 0.7 * market_cap_proxy)
-                FROM stock_market_table
-                WHERE subsector = %s AND date = %s
-            """, (subsector, date))
-            sub_cap = cur.fetchone()[0] or 0
-
+            sector_cap = sector_caps.get(date) or 0
+            sub_cap = subsector_caps.get(date) or 0
             influence = round(sub_cap / sector_cap, 5) if sector_cap else None
 
             insert_buffer.append((
@@ -126,57 +143,53 @@ def process_subsector(subsector, start_date):
                 constituent_count, avg_ret, w_ret, ret_pct, influence
             ))
 
-            print(f"✅ [{date}] {subsector} | Index: {final_index_value} | Influence: {influence}")
-
         if insert_buffer:
-            insert_query = """
-                INSERT INTO sector_index_table (
-                    sector, subsector, is_subsector, date,
-                    index_value, market_cap, total_volume,
-                    num_constituents, average_return, weighted_return,
-                    return_vs_previous, influence_weight
-                ) VALUES %s
-                ON CONFLICT (sector, subsector, date)
-                DO UPDATE SET
-                    index_value = EXCLUDED.index_value,
-                    market_cap = EXCLUDED.market_cap,
-                    total_volume = EXCLUDED.total_volume,
-                    num_constituents = EXCLUDED.num_constituents,
-                    average_return = EXCLUDED.average_return,
-                    weighted_return = EXCLUDED.weighted_return,
-                    return_vs_previous = EXCLUDED.return_vs_previous,
-                    influence_weight = EXCLUDED.influence_weight
-            """
-            if len(insert_buffer) >= BATCH_INSERT_THRESHOLD:
-                execute_values(cur, insert_query, insert_buffer)
-            else:
-                for row in insert_buffer:
-                    cur.execute(insert_query, row)
+            updated, inserted = upsert_index_rows(cur, insert_buffer, SUBSECTOR_ROW_COLUMNS)
             conn.commit()
-
-def main():
+            print(f"✅ {subsector}: {inserted} inserted, {updated} updated through {insert_buffer[-1][3]} "
+                  f"| Index: {insert_buffer[-1][4]}")
+            return {subsector: f"{inserted} inserted, {updated} updated"}
+        return {subsector: "no new rows"}
+
+def subsector_job(subsector, mark):
+    """
+    run_jobs job chaining a dirty subsector again from its last stored row before the first dirty date,
+    or None when there is nothing to do. A subsector that has never been tracked continues from its
+    newest stored row.
+    """
+    if is_clean(mark):
+        print(f"⏭️ [{subsector}] No stock changes since the last run.")
+        return None
+    baseline_date = get_subsector_baseline_date(SUBSECTOR_TO_SECTOR[subsector], subsector,
+                                                mark.dirty_from if mark else None)
+    if baseline_date is None:
+        print(f"❌ [{subsector}] No stored index to chain from. Skipping.")
+        return None
+    return [subsector], (subsector, baseline_date)
+
+def run_subsector(subsector):
+    """Update one subsector against its watermark and record it (a pipeline DAG node). Returns its status."""
+    marks = load_watermarks(SUBSECTOR_INDEX_STAGE, [subsector])
+    job = subsector_job(subsector, marks.get(subsector))
+    if job is None:
+        return "skipped: nothing to chain"
+    results = run_jobs([job], process_subsector, max_workers=1)
+    finish_stage(SUBSECTOR_INDEX_STAGE, results, marks, through=get_latest_stock_date())
+    return results[subsector][1]
+
+def main(workers=INDEX_WORKERS):
     if not test_database_connection():
         print("❌ DB connection failed.")
         return
 
-    latest_date = get_latest_stock_date()
-    today = datetime.today().date()
-
-    if not latest_date:
-        print("❌ No stock data found.")
-        return
-
-    start_date = latest_date + timedelta(days=1)
-    while start_date.weekday() >= 5:
-        start_date += timedelta(days=1)
-    
-    if start_date >= today:
-        print(f"⛔ Aborted: start_date ({start_date}) is today or in the future.")
-        return
+    create_watermarks_table()
+    marks = load_watermarks(SUBSECTOR_INDEX_STAGE)
+    jobs = [job for job in (subsector_job(sub, marks.get(sub)) for sub in SUBSECTOR_TO_SECTOR) if job is not None]
 
-    print(f"\n🚀 Starting subsector index update from: {start_date}\n")
-    for subsector in SUBSECTOR_TO_SECTOR.keys():
-        process_subsector(subsector, start_date)
+    print(f"\n🚀 Starting subsector index update for {len(jobs)} subsector(s)\n")
+    results = run_jobs(jobs, process_subsector, max_workers=workers, processes=True)
+    finish_stage(SUBSECTOR_INDEX_STAGE, results, marks, through=get_latest_stock_date())
+    return results
 
 if __name__ == "__main__":
-    main()
+    main(workers=parse_workers("Update subsector indexes."))
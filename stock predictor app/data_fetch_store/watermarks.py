@@ -0,0 +1,125 @@
+import os
+from collections import namedtuple
+from psycopg2.extras import execute_values
+from db_params import get_connection
+from index_builder import MARKET_SECTOR
+
+# --- Pipeline Stages ---
+# The stock stage writes stock_market_table and marks what it wrote as dirty for the stages below,
+# which read their pending ranges instead of each guessing "new data" from its own MAX(date).
+
+STOCK_STAGE = "stock"                      # entity = symbol
+SECTOR_INDEX_STAGE = "sector_index"        # entity = sector, or MARKET_SECTOR
+SUBSECTOR_INDEX_STAGE = "subsector_index"  # entity = subsector
+WEIGHT_STAGE = "weights"                   # entity = sector
+DOWNSTREAM = {SECTOR_INDEX_STAGE: "sector", SUBSECTOR_INDEX_STAGE: "subsector", WEIGHT_STAGE: "sector"}
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema", "pipeline_watermarks.schema.sql")
+
+Watermark = namedtuple("Watermark", ["last_date", "dirty_from", "dirty_to"])
+
+
+def create_watermarks_table():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with open(SCHEMA_PATH, "r") as f:
+                cur.execute(f.read())
+        conn.commit()
+
+
+def load_watermarks(stage, entities=None):
+    """{entity: Watermark} for one stage, or only some of its entities. An untracked entity has no row."""
+    query = "SELECT entity, last_date, dirty_from, dirty_to FROM pipeline_watermarks WHERE stage = %s"
+    params = [stage]
+    if entities is not None:
+        query += " AND entity = ANY(%s)"
+        params.append(list(entities))
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return {entity: Watermark(*values) for entity, *values in cur.fetchall()}
+
+
+def is_clean(mark):
+    """True when the entity is tracked and nothing upstream changed since it was last processed."""
+    return mark is not None and mark.dirty_from is None
+
+
+def record_stock_changes(changes):
+    """
+    After stock rows are committed: advance each symbol's stock watermark and merge the written date
+    range into the dirty range of every downstream stage for its sector and subsector.
+    `changes` are (symbol, sector, subsector, first_date, last_date) tuples.
+    """
+    if not changes:
+        return
+    # One row per key: a symbol may come in twice (two sectors), and ON CONFLICT rejects a repeated key
+    advanced = {}
+    for symbol, _, _, _, last in changes:
+        advanced[symbol] = max(advanced.get(symbol, last), last)
+    dirty = {}
+    for symbol, sector, subsector, first, last in changes:
+        entities = {"sector": sector, "subsector": subsector}
+        keys = [(stage, entities[level]) for stage, level in DOWNSTREAM.items()]
+        # Every stock is a constituent of the market index, which the sector index stage also maintains
+        keys.append((SECTOR_INDEX_STAGE, MARKET_SECTOR))
+        for key in keys:
+            if key[1] is None:
+                continue
+            low, high = dirty.get(key, (first, last))
+            dirty[key] = (min(low, first), max(high, last))
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO pipeline_watermarks (stage, entity, last_date, dirty_from, dirty_to) VALUES %s
+                ON CONFLICT (stage, entity) DO UPDATE SET
+                    last_date = GREATEST(pipeline_watermarks.last_date, EXCLUDED.last_date),
+                    updated_at = NOW()
+            """, [(STOCK_STAGE, symbol, last, None, None) for symbol, last in advanced.items()])
+            # LEAST/GREATEST skip NULLs, so a clean entity simply takes the new range
+            execute_values(cur, """
+                INSERT INTO pipeline_watermarks (stage, entity, dirty_from, dirty_to) VALUES %s
+                ON CONFLICT (stage, entity) DO UPDATE SET
+                    dirty_from = LEAST(pipeline_watermarks.dirty_from, EXCLUDED.dirty_from),
+                    dirty_to = GREATEST(pipeline_watermarks.dirty_to, EXCLUDED.dirty_to),
+                    updated_at = NOW()
+            """, [(stage, entity, low, high) for (stage, entity), (low, high) in dirty.items()])
+        conn.commit()
+
+
+def finish_stage(stage, results, marks, through=None):
+    """
+    After a stage ran: for every entity it processed (not failed or skipped), record the last processed
+    date (its dirty_to, or `through` when it had no range) and clear the range it handled. A range that
+    grew meanwhile is left dirty, so rows written during the run are picked up next time.
+    `results` is {entity: (ok, status)} as returned by run_jobs.
+    """
+    rows = []
+    for entity, (ok, status) in results.items():
+        if not ok or status.startswith("skipped"):
+            continue
+        mark = marks.get(entity) or Watermark(None, None, None)
+        rows.append((stage, entity, mark.dirty_to or through, mark.dirty_from, mark.dirty_to))
+    if not rows:
+        return
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO pipeline_watermarks (stage, entity) VALUES %s ON CONFLICT (stage, entity) DO NOTHING
+            """, [(stage, entity) for stage, entity, *_ in rows])
+            execute_values(cur, """
+                UPDATE pipeline_watermarks w
+                SET last_date = GREATEST(w.last_date, v.last_date::date),
+                    dirty_from = CASE WHEN unchanged THEN NULL ELSE w.dirty_from END,
+                    dirty_to = CASE WHEN unchanged THEN NULL ELSE w.dirty_to END,
+                    updated_at = NOW()
+                FROM (
+                    SELECT v.*, (w0.dirty_from IS NOT DISTINCT FROM v.seen_from::date
+                                 AND w0.dirty_to IS NOT DISTINCT FROM v.seen_to::date) AS unchanged
+                    FROM (VALUES %s) AS v(stage, entity, last_date, seen_from, seen_to)
+                    JOIN pipeline_watermarks w0 ON w0.stage = v.stage AND w0.entity = v.entity
+                ) v
+                WHERE w.stage = v.stage AND w.entity = v.entity
+            """, rows)
+        conn.commit()